@@ -6,8 +6,9 @@ import os
 import asyncio
 
 # Importações para telemetria e métricas
-from prometheus_client import make_asgi_app, Counter, Histogram, Gauge
+from prometheus_client import Gauge
 from config.telemetry import setup_telemetry
+from config.prometheus import setup_prometheus
 from services.logging import setup_logging, StructuredLogger
 
 # Configuração simples para desenvolvimento Docker
@@ -41,27 +42,18 @@ logger = StructuredLogger("totem-api")
 # Configurar telemetria (OpenTelemetry + Jaeger)
 # setup_telemetry(app)
 
-# Configurar métricas Prometheus
-metrics_app = make_asgi_app()
-app.mount("/metrics", metrics_app)
+# Configurar métricas Prometheus (agrega os workers se PROMETHEUS_MULTIPROC_DIR estiver definida)
+setup_prometheus(app, "/metrics")
 
 # Métricas Prometheus customizadas
-REQUEST_COUNT = Counter(
-    'http_requests_total',
-    'Total de requisições HTTP',
-    ['method', 'endpoint', 'status']
-)
-
-REQUEST_DURATION = Histogram(
-    'http_request_duration_seconds',
-    'Duração das requisições HTTP',
-    ['method', 'endpoint']
-)
+# REQUEST_COUNT / REQUEST_DURATION ficam em middleware.metrics para não registrar o mesmo nome duas vezes
+from middleware.metrics import REQUEST_COUNT, REQUEST_DURATION
 
 ACTIVE_CONNECTIONS = Gauge(
     'websocket_active_connections',
     'Conexões WebSocket ativas',
-    ['tenant_id']
+    ['tenant_id'],
+    multiprocess_mode='livesum'  # Soma das conexões de cada worker vivo
 )
 
 # Importar middleware de métricas
@@ -71,7 +63,7 @@ ACTIVE_CONNECTIONS = Gauge(
 # app.add_middleware(MetricsMiddleware)
 
 # Importar routers
-from routers import tickets, auth, customers, metrics, operator_config, payment_sessions, websocket, ticket_service_progress
+from routers import tickets, auth, customers, metrics, operator_config, payment_sessions, websocket, ticket_service_progress, totem
 from database import get_db
 
 # Incluir routers
@@ -83,6 +75,18 @@ app.include_router(operator_config.router, prefix="/operator", tags=["operator"]
 app.include_router(payment_sessions.router, prefix="/payment-sessions", tags=["payments"])
 app.include_router(websocket.router, prefix="", tags=["websocket"])  # Sem prefixo para evitar /ws/ws
 app.include_router(ticket_service_progress.router, prefix="/api", tags=["ticket-service-progress"])
+app.include_router(totem.router, prefix="/totem", tags=["totem"])
+
+# Fila offline: a primeira rodada reprocessa o journal deixado por execuções anteriores
+from services.offline import offline_manager
+
+@app.on_event("startup")
+async def start_offline_sync():
+    await offline_manager.start_sync_task()
+
+@app.on_event("shutdown")
+async def stop_offline_sync():
+    await offline_manager.stop_sync_task()
 
 # Endpoint WebSocket de teste
 from fastapi import WebSocket
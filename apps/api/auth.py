@@ -1,21 +1,36 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+from sqlalchemy import event
 from datetime import datetime
 from typing import Optional
+import os
 
 from database import get_db
 from models import Operator, Tenant
 from schemas import OperatorCreate
-from security import verify_password, create_access_token, verify_token, get_password_hash
+from security import verify_token, password_hasher
+from services.operator_auth import OperatorAuthCache, OperatorPrincipal
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Token verificado -> operador (por processo); ver services/operator_auth.py
+operator_auth_cache = OperatorAuthCache(
+    ttl_seconds=float(os.getenv("OPERATOR_AUTH_CACHE_TTL", "60")),
+    max_entries=int(os.getenv("OPERATOR_AUTH_CACHE_SIZE", "4096"))
+)
+
+@event.listens_for(Operator, "after_update")
+@event.listens_for(Operator, "after_delete")
+def _invalidate_operator_auth(mapper, connection, target) -> None:
+    """Alteração/desativação do operador derruba os tokens dele em cache"""
+    operator_auth_cache.invalidate(target.id)
+
 async def get_current_operator(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
-) -> Operator:
-    """Get current operator from JWT token."""
+) -> OperatorPrincipal:
+    """Get current operator from JWT token (cached per token)."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -29,6 +44,10 @@ async def get_current_operator(
     operator_id: str = payload.get("sub")
     if operator_id is None:
         raise credentials_exception
+    
+    principal = operator_auth_cache.get(operator_id, token)
+    if principal is not None:
+        return principal
         
     operator = db.query(Operator).filter(Operator.id == operator_id).first()
     if operator is None:
@@ -39,19 +58,27 @@ async def get_current_operator(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive operator"
         )
-        
-    return operator
+    
+    principal = OperatorPrincipal.from_operator(operator)
+    operator_auth_cache.set(token, principal, expires_at=payload.get("exp"))
+    return principal
+
+async def authenticate_operator(db: Session, email: str, password: str) -> Optional[Operator]:
+    """Authenticate operator with email and password.
 
-def authenticate_operator(db: Session, email: str, password: str) -> Optional[Operator]:
-    """Authenticate operator with email and password."""
+    O bcrypt roda no pool do ``password_hasher``; se o custo configurado mudou,
+    o hash é regravado (commit junto com ``update_operator_last_login``)."""
     operator = db.query(Operator).filter(Operator.email == email).first()
     if not operator:
         return None
-    if not verify_password(password, operator.password_hash):
+    valid, new_hash = await password_hasher.verify(password, operator.password_hash)
+    if not valid:
         return None
+    if new_hash:
+        operator.password_hash = new_hash
     return operator
 
-def create_operator(db: Session, operator: OperatorCreate) -> Operator:
+async def create_operator(db: Session, operator: OperatorCreate) -> Operator:
     """Create new operator. Aceita tenant_id ou tenant_name."""
 
     # Resolve tenant_id
@@ -65,7 +92,7 @@ def create_operator(db: Session, operator: OperatorCreate) -> Operator:
     if not tenant_id:
         raise HTTPException(status_code=400, detail="tenant_id ou tenant_name obrigatório")
 
-    hashed_password = get_password_hash(operator.password)
+    hashed_password = await password_hasher.hash(operator.password)
     db_operator = Operator(
         tenant_id=tenant_id,
         name=operator.name,
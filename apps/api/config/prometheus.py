@@ -0,0 +1,125 @@
+"""Configuração do Prometheus com suporte ao modo multiprocess.
+
+Com vários workers (``uvicorn --workers N`` ou gunicorn) cada processo tem o seu
+próprio registry e o ``/metrics`` devolveria a visão de um worker aleatório.
+Quando ``PROMETHEUS_MULTIPROC_DIR`` está definida no ambiente *antes* do start
+dos processos, o ``prometheus_client`` grava os valores em arquivos mmap nesse
+diretório e o endpoint passa a agregar todos os workers.
+
+A variável precisa existir antes do primeiro ``import prometheus_client``
+(a classe de valor é escolhida na importação), portanto deve ser definida no
+ambiente do container e não em tempo de execução.
+"""
+
+import os
+import re
+import glob
+import shutil
+import logging
+from typing import Optional
+
+from prometheus_client import REGISTRY, CollectorRegistry, make_asgi_app, multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Arquivos do modo multiprocess seguem o padrão <tipo>_<pid>.db
+_PID_FILE_PATTERN = re.compile(r"_(\d+)\.db$")
+
+
+def get_multiproc_dir() -> Optional[str]:
+    """Retorna o diretório compartilhado entre os workers, se configurado"""
+    # O prometheus_client aceita também a grafia antiga em minúsculas
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
+
+def is_multiprocess_enabled() -> bool:
+    return bool(get_multiproc_dir())
+
+
+def prepare_multiproc_dir() -> None:
+    """Cria (ou esvazia) o diretório compartilhado.
+
+    Deve ser chamada uma única vez no processo master, antes de subir os
+    workers; arquivos de uma execução anterior inflariam os contadores."""
+    path = get_multiproc_dir()
+    if not path:
+        return
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path, exist_ok=True)
+    logger.info(f"Diretório multiprocess do Prometheus preparado em {path}")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Processo existe mas pertence a outro usuário
+        return True
+    return True
+
+
+def cleanup_dead_workers() -> int:
+    """Remove os arquivos de gauges ``live*`` de workers que já morreram.
+
+    Contadores e histogramas de workers mortos são mantidos de propósito para
+    que os totais continuem monotônicos. Retorna quantos PIDs foram limpos."""
+    path = get_multiproc_dir()
+    if not path:
+        return 0
+
+    dead_pids = set()
+    for filename in glob.glob(os.path.join(path, "*.db")):
+        match = _PID_FILE_PATTERN.search(filename)
+        if not match:
+            continue
+        pid = int(match.group(1))
+        if pid != os.getpid() and not _pid_alive(pid):
+            dead_pids.add(pid)
+
+    for pid in dead_pids:
+        multiprocess.mark_process_dead(pid, path)
+
+    if dead_pids:
+        logger.info(f"Arquivos Prometheus de {len(dead_pids)} worker(s) morto(s) removidos")
+    return len(dead_pids)
+
+
+def child_exit(server, worker) -> None:
+    """Hook ``child_exit`` do gunicorn (``child_exit = config.prometheus.child_exit``)"""
+    path = get_multiproc_dir()
+    if path:
+        multiprocess.mark_process_dead(worker.pid, path)
+
+
+def build_registry() -> CollectorRegistry:
+    """Registry usado pelo endpoint de exposição.
+
+    No modo multiprocess um registry novo agrega os arquivos de todos os
+    workers; caso contrário usa o registry global do processo."""
+    if not is_multiprocess_enabled():
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=get_multiproc_dir())
+    return registry
+
+
+def setup_prometheus(app, path: str = "/metrics") -> None:
+    """Monta o endpoint de métricas e limpa resíduos de workers mortos no startup"""
+    app.mount(path, make_asgi_app(registry=build_registry()))
+
+    if is_multiprocess_enabled():
+        @app.on_event("startup")
+        async def _cleanup_prometheus_files():
+            cleanup_dead_workers()
+
+        logger.info("Prometheus em modo multiprocess")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    prepare_multiproc_dir()
@@ -57,5 +57,30 @@ class Settings(BaseSettings):
     # Rate Limiting
     RATE_LIMIT_REQUESTS: int = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))
     RATE_LIMIT_PERIOD: int = int(os.getenv("RATE_LIMIT_PERIOD", "60"))  # em segundos
+    
+    # Webhook inbox (processamento assíncrono e durável)
+    WEBHOOK_INBOX_WORKERS: int = int(os.getenv("WEBHOOK_INBOX_WORKERS", "4"))
+    WEBHOOK_INBOX_MAX_ATTEMPTS: int = int(os.getenv("WEBHOOK_INBOX_MAX_ATTEMPTS", "5"))
+    WEBHOOK_INBOX_POLL_INTERVAL: float = float(os.getenv("WEBHOOK_INBOX_POLL_INTERVAL", "2"))
+    
+    # Poller de status de pagamentos pendentes (fallback para webhooks perdidos)
+    PAYMENT_POLLER_ENABLED: bool = os.getenv("PAYMENT_POLLER_ENABLED", "true").lower() == "true"
+    PAYMENT_POLL_INTERVAL: float = float(os.getenv("PAYMENT_POLL_INTERVAL", "15"))
+    PAYMENT_POLL_BATCH_SIZE: int = int(os.getenv("PAYMENT_POLL_BATCH_SIZE", "200"))
+    PAYMENT_POLL_CONCURRENCY: int = int(os.getenv("PAYMENT_POLL_CONCURRENCY", "8"))
+    PAYMENT_POLL_RATE_LIMIT: float = float(os.getenv("PAYMENT_POLL_RATE_LIMIT", "5"))  # req/s por provedor
+    
+    # Expiração de sessões de pagamento pendentes
+    PAYMENT_EXPIRY_SWEEP_INTERVAL: float = float(os.getenv("PAYMENT_EXPIRY_SWEEP_INTERVAL", "30"))
+    PAYMENT_EXPIRY_BATCH_SIZE: int = int(os.getenv("PAYMENT_EXPIRY_BATCH_SIZE", "500"))
+    # Validade da reserva de estoque dos extras de um ticket novo (ao vencer o estoque volta; o ticket segue pendente)
+    STOCK_RESERVATION_MINUTES: int = int(os.getenv("STOCK_RESERVATION_MINUTES", "60"))
+    
+    # Renderização de QR codes de pagamento
+    QR_RENDER_WORKERS: int = int(os.getenv("QR_RENDER_WORKERS", "2"))
+    QR_CACHE_SIZE: int = int(os.getenv("QR_CACHE_SIZE", "512"))
+    
+    # Journal local da fila offline (SQLite em modo WAL)
+    OFFLINE_JOURNAL_PATH: str = os.getenv("OFFLINE_JOURNAL_PATH", "data/offline_journal.db")
 
 settings = Settings() 
\ No newline at end of file
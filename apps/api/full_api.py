@@ -19,7 +19,7 @@ from fastapi.websockets import WebSocket, WebSocketDisconnect
 AVAILABLE_ROUTERS = [
     "auth", "tickets", "services", "payment_sessions", "webhooks", 
     "terminals", "metrics", "websocket", "operation", 
-    "operator_config", "notifications", "customers"
+    "operator_config", "notifications", "customers", "totem"
 ]
 
 # Dicionário para rastrear routers carregados
@@ -107,7 +107,8 @@ router_configs = {
     "operation": {"prefix": "/operation", "tags": ["operation"]},
     "operator_config": {"prefix": "/operator", "tags": ["operator-config"]},
     "notifications": {"prefix": "/notifications", "tags": ["notifications"]},
-    "customers": {"prefix": "/customers", "tags": ["customers"]}
+    "customers": {"prefix": "/customers", "tags": ["customers"]},
+    "totem": {"prefix": "/totem", "tags": ["totem"]}
 }
 
 # Incluir routers na aplicação
@@ -399,7 +400,7 @@ async def test_auth_endpoint():
         db = next(get_db())
         
         # Tentar autenticar
-        result = authenticate_operator(
+        result = await authenticate_operator(
             db=db,
             email="admin@exemplo.com",
             password="123456"
@@ -974,8 +975,10 @@ async def login_for_access_token(
         
         operator_id, name, email, password_hash, tenant_id, is_active, last_login_at, created_at, updated_at = result
         
-        # Verificar senha
-        if not bcrypt.checkpw(form_data.password.encode('utf-8'), password_hash.encode('utf-8')):
+        # Verificar senha (bcrypt fora do event loop)
+        from security import password_hasher
+        password_valid, _ = await password_hasher.verify(form_data.password, password_hash)
+        if not password_valid:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Email ou senha incorretos",
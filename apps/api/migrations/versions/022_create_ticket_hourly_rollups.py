@@ -0,0 +1,43 @@
+"""create ticket_hourly_rollups
+
+Revision ID: 022
+Revises: 021
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '022'
+down_revision = '021'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ticket_hourly_rollups',
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column('tenant_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('tenants.id'), nullable=False),
+        sa.Column('service_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('services.id'), nullable=False),
+        sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('completed_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('cancelled_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('revenue', sa.Numeric(12, 2), nullable=False, server_default='0'),
+        sa.Column('wait_seconds_sum', sa.Float, nullable=False, server_default='0'),
+        sa.Column('wait_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('service_seconds_sum', sa.Float, nullable=False, server_default='0'),
+        sa.Column('service_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint('tenant_id', 'service_id', 'bucket', name='uq_ticket_hourly_rollups_tenant_service_bucket'),
+    )
+
+    # Leituras são sempre por tenant + janela de tempo
+    op.create_index('idx_ticket_hourly_rollups_tenant_bucket', 'ticket_hourly_rollups', ['tenant_id', 'bucket'])
+
+
+def downgrade():
+    op.drop_index('idx_ticket_hourly_rollups_tenant_bucket', 'ticket_hourly_rollups')
+    op.drop_table('ticket_hourly_rollups')
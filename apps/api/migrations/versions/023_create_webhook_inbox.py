@@ -0,0 +1,42 @@
+"""create webhook_inbox
+
+Revision ID: 023
+Revises: 022
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '023'
+down_revision = '022'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'webhook_inbox',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('provider', sa.String(20), nullable=False),
+        sa.Column('transaction_id', sa.String(100), nullable=True),
+        sa.Column('event_type', sa.String(100), nullable=True),
+        sa.Column('event_timestamp', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('payload', postgresql.JSONB, nullable=False),
+        sa.Column('status', sa.String(20), nullable=False, server_default='pending'),  # pending, processing, done, failed
+        sa.Column('attempts', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('last_error', sa.Text, nullable=True),
+        sa.Column('received_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    )
+
+    # Workers buscam por status + próxima tentativa (SKIP LOCKED)
+    op.create_index('idx_webhook_inbox_status_next_attempt', 'webhook_inbox', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    op.drop_index('idx_webhook_inbox_status_next_attempt', 'webhook_inbox')
+    op.drop_table('webhook_inbox')
@@ -0,0 +1,30 @@
+"""create webhook_replay_ids
+
+Revision ID: 024
+Revises: 023
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '024'
+down_revision = '023'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Usada pela proteção contra replay quando WEBHOOK_REPLAY_BACKEND=postgres
+    op.create_table(
+        'webhook_replay_ids',
+        sa.Column('webhook_id', sa.String(64), primary_key=True),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_webhook_replay_ids_expires_at', 'webhook_replay_ids', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_webhook_replay_ids_expires_at', 'webhook_replay_ids')
+    op.drop_table('webhook_replay_ids')
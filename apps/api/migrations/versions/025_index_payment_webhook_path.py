@@ -0,0 +1,35 @@
+"""index payment webhook path
+
+Revision ID: 025
+Revises: 024
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '025'
+down_revision = '024'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Webhook localiza a sessão por transaction_id
+    op.create_index(
+        'idx_payment_sessions_transaction_id', 'payment_sessions', ['transaction_id'],
+        postgresql_where='transaction_id IS NOT NULL'
+    )
+    # Ticket gerado a partir da sessão (idempotência do webhook)
+    op.create_index(
+        'idx_tickets_payment_session_id', 'tickets', ['payment_session_id'],
+        postgresql_where='payment_session_id IS NOT NULL'
+    )
+    # MAX(ticket_number) por tenant
+    op.create_index('idx_tickets_tenant_ticket_number', 'tickets', ['tenant_id', 'ticket_number'])
+
+
+def downgrade():
+    op.drop_index('idx_tickets_tenant_ticket_number', 'tickets')
+    op.drop_index('idx_tickets_payment_session_id', 'tickets')
+    op.drop_index('idx_payment_sessions_transaction_id', 'payment_sessions')
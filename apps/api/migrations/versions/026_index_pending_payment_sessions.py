@@ -0,0 +1,26 @@
+"""index pending payment sessions by expiry
+
+Revision ID: 026
+Revises: 025
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '026'
+down_revision = '025'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Varredura de expiração e poller só olham sessões pendentes
+    op.create_index(
+        'idx_payment_sessions_pending_expires_at', 'payment_sessions', ['expires_at'],
+        postgresql_where="status = 'pending'"
+    )
+
+
+def downgrade():
+    op.drop_index('idx_payment_sessions_pending_expires_at', 'payment_sessions')
@@ -0,0 +1,88 @@
+"""add customer_cpf blind index
+
+Revision ID: 027
+Revises: 026
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '027'
+down_revision = '026'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _backfill(connection, table):
+    """Calcula o HMAC dos CPFs existentes (texto puro ou cifrados com Fernet)"""
+    from security import cpf_blind_index, decrypt_data
+
+    last_id = None
+    while True:
+        rows = connection.execute(sa.text(f"""
+            SELECT id, customer_cpf FROM {table}
+             WHERE customer_cpf IS NOT NULL AND customer_cpf_hash IS NULL
+               {"AND id > :last_id" if last_id else ""}
+             ORDER BY id
+             LIMIT :limit
+        """), {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for row in rows:
+            cpf = row.customer_cpf
+            if len(cpf) > 14:
+                try:
+                    cpf = decrypt_data(cpf)
+                except Exception:
+                    continue  # Cifrado com outra chave: fica sem índice
+            cpf_hash = cpf_blind_index(cpf)
+            if cpf_hash:
+                updates.append({"id": row.id, "cpf_hash": cpf_hash})
+
+        if updates:
+            connection.execute(
+                sa.text(f"UPDATE {table} SET customer_cpf_hash = :cpf_hash WHERE id = :id"),
+                updates
+            )
+
+
+def upgrade():
+    for table in ('tickets', 'payment_sessions'):
+        # CPF cifrado (Fernet) não cabe em 14 caracteres
+        op.alter_column(table, 'customer_cpf',
+                        existing_type=sa.String(length=14),
+                        type_=sa.String(length=255),
+                        existing_nullable=True)
+        op.add_column(table, sa.Column('customer_cpf_hash', sa.String(length=64), nullable=True))
+
+    connection = op.get_bind()
+    _backfill(connection, 'tickets')
+    _backfill(connection, 'payment_sessions')
+
+    # Busca por CPF vira uma sondagem de índice (tenant + HMAC)
+    op.create_index(
+        'idx_tickets_tenant_cpf_hash', 'tickets', ['tenant_id', 'customer_cpf_hash'],
+        postgresql_where='customer_cpf_hash IS NOT NULL'
+    )
+    op.create_index(
+        'idx_payment_sessions_tenant_cpf_hash', 'payment_sessions', ['tenant_id', 'customer_cpf_hash'],
+        postgresql_where='customer_cpf_hash IS NOT NULL'
+    )
+
+
+def downgrade():
+    op.drop_index('idx_payment_sessions_tenant_cpf_hash', 'payment_sessions')
+    op.drop_index('idx_tickets_tenant_cpf_hash', 'tickets')
+    for table in ('tickets', 'payment_sessions'):
+        op.drop_column(table, 'customer_cpf_hash')
+        op.alter_column(table, 'customer_cpf',
+                        existing_type=sa.String(length=255),
+                        type_=sa.String(length=14),
+                        existing_nullable=True)
@@ -0,0 +1,77 @@
+"""add normalized customer name search to tickets
+
+Revision ID: 028
+Revises: 027
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '028'
+down_revision = '027'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _backfill(connection):
+    """Preenche o nome normalizado (mesma função usada nas inserções)"""
+    from services.customer_search import normalize_search_text
+
+    last_id = None
+    while True:
+        rows = connection.execute(sa.text(f"""
+            SELECT id, customer_name FROM tickets
+             WHERE customer_name IS NOT NULL AND customer_name_search IS NULL
+               {"AND id > :last_id" if last_id else ""}
+             ORDER BY id
+             LIMIT :limit
+        """), {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = [
+            {"id": row.id, "name_search": normalize_search_text(row.customer_name)}
+            for row in rows
+        ]
+        connection.execute(
+            sa.text("UPDATE tickets SET customer_name_search = :name_search WHERE id = :id"),
+            updates
+        )
+
+
+def _trgm_available(connection) -> bool:
+    return bool(connection.execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).scalar())
+
+
+def upgrade():
+    op.add_column('tickets', sa.Column('customer_name_search', sa.String(length=100), nullable=True))
+
+    connection = op.get_bind()
+    _backfill(connection)
+
+    # Prefixo: LIKE 'termo%' por tenant
+    op.create_index(
+        'idx_tickets_tenant_name_search', 'tickets', ['tenant_id', 'customer_name_search'],
+        postgresql_ops={'customer_name_search': 'text_pattern_ops'}
+    )
+
+    # Trecho e semelhança: LIKE '%termo%' e operador % (pg_trgm)
+    if _trgm_available(connection):
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tickets_name_search_trgm "
+            "ON tickets USING gin (customer_name_search gin_trgm_ops)"
+        )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_tickets_name_search_trgm")
+    op.drop_index('idx_tickets_tenant_name_search', 'tickets')
+    op.drop_column('tickets', 'customer_name_search')
@@ -0,0 +1,100 @@
+"""create deduplicated customers table
+
+Revision ID: 029
+Revises: 028
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '029'
+down_revision = '028'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'customers',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('tenant_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('tenants.id'), nullable=False),
+        sa.Column('cpf_hash', sa.String(length=64), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('phone', sa.String(length=20), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('last_seen_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint('tenant_id', 'cpf_hash', name='uq_customers_tenant_cpf_hash'),
+    )
+    for table in ('tickets', 'payment_sessions', 'consents'):
+        op.add_column(table, sa.Column(
+            'customer_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('customers.id'), nullable=True
+        ))
+
+    # Um cliente por (tenant, CPF): nome/telefone do registro mais recente,
+    # datas de primeira e última passagem sobre tickets e sessões (027 já
+    # preencheu customer_cpf_hash)
+    op.execute("""
+        WITH sources AS (
+            SELECT tenant_id, customer_cpf_hash, customer_name, customer_phone, created_at
+              FROM tickets
+             WHERE customer_cpf_hash IS NOT NULL AND customer_name IS NOT NULL
+            UNION ALL
+            SELECT tenant_id, customer_cpf_hash, customer_name, customer_phone, created_at
+              FROM payment_sessions
+             WHERE customer_cpf_hash IS NOT NULL AND customer_name IS NOT NULL
+        ),
+        ranked AS (
+            SELECT *,
+                   MIN(created_at) OVER w AS first_seen,
+                   MAX(created_at) OVER w AS last_seen,
+                   ROW_NUMBER() OVER (w ORDER BY created_at DESC NULLS LAST) AS rn
+              FROM sources
+            WINDOW w AS (PARTITION BY tenant_id, customer_cpf_hash)
+        )
+        INSERT INTO customers (id, tenant_id, cpf_hash, name, phone, created_at, updated_at, last_seen_at)
+        SELECT gen_random_uuid(), tenant_id, customer_cpf_hash, customer_name, customer_phone,
+               COALESCE(first_seen, now()), now(), COALESCE(last_seen, now())
+          FROM ranked
+         WHERE rn = 1
+    """)
+    for table in ('tickets', 'payment_sessions'):
+        op.execute(f"""
+            UPDATE {table} AS t
+               SET customer_id = c.id
+              FROM customers AS c
+             WHERE c.tenant_id = t.tenant_id
+               AND c.cpf_hash = t.customer_cpf_hash
+        """)
+    op.execute("""
+        UPDATE consents AS co
+           SET customer_id = ps.customer_id
+          FROM payment_sessions AS ps
+         WHERE ps.id = co.payment_session_id
+           AND ps.customer_id IS NOT NULL
+    """)
+
+    op.create_index(
+        'idx_tickets_customer_created_at', 'tickets', ['customer_id', 'created_at'],
+        postgresql_where='customer_id IS NOT NULL'
+    )
+    op.create_index(
+        'idx_payment_sessions_customer_id', 'payment_sessions', ['customer_id'],
+        postgresql_where='customer_id IS NOT NULL'
+    )
+    op.create_index(
+        'idx_consents_customer_created_at', 'consents', ['customer_id', 'created_at'],
+        postgresql_where='customer_id IS NOT NULL'
+    )
+
+
+def downgrade():
+    op.drop_index('idx_consents_customer_created_at', 'consents')
+    op.drop_index('idx_payment_sessions_customer_id', 'payment_sessions')
+    op.drop_index('idx_tickets_customer_created_at', 'tickets')
+    for table in ('consents', 'payment_sessions', 'tickets'):
+        op.drop_column(table, 'customer_id')
+    op.drop_table('customers')
@@ -0,0 +1,39 @@
+"""unique operation config children per config
+
+Revision ID: 030
+Revises: 029
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '030'
+down_revision = '029'
+branch_labels = None
+depends_on = None
+
+CHILDREN = (
+    ('operation_config_services', 'service_id', 'uq_operation_config_services_config_service'),
+    ('operation_config_equipments', 'equipment_id', 'uq_operation_config_equipments_config_equipment'),
+    ('operation_config_extras', 'extra_id', 'uq_operation_config_extras_config_extra'),
+)
+
+
+def upgrade():
+    for table, key, constraint in CHILDREN:
+        # Duplicatas antigas: fica a linha mais recente (maior id)
+        op.execute(f"""
+            DELETE FROM {table} AS t
+             USING {table} AS newer
+             WHERE newer.operation_config_id = t.operation_config_id
+               AND newer.{key} = t.{key}
+               AND newer.id > t.id
+        """)
+        # Alvo do INSERT ... ON CONFLICT do save incremental da configuração
+        op.create_unique_constraint(constraint, table, ['operation_config_id', key])
+
+
+def downgrade():
+    for table, _, constraint in CHILDREN:
+        op.drop_constraint(constraint, table, type_='unique')
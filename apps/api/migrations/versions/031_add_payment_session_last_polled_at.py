@@ -0,0 +1,30 @@
+"""track when the poller last checked a payment session
+
+Revision ID: 031
+Revises: 030
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '031'
+down_revision = '030'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('payment_sessions', sa.Column('last_polled_at', sa.DateTime(timezone=True), nullable=True))
+    # Poller percorre as pendentes da consulta mais antiga para a mais recente
+    op.create_index(
+        'idx_payment_sessions_pending_last_polled_at', 'payment_sessions',
+        [sa.text('last_polled_at NULLS FIRST')],
+        postgresql_where="status = 'pending' AND transaction_id IS NOT NULL"
+    )
+
+
+def downgrade():
+    op.drop_index('idx_payment_sessions_pending_last_polled_at', 'payment_sessions')
+    op.drop_column('payment_sessions', 'last_polled_at')
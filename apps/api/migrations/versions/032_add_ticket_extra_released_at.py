@@ -0,0 +1,24 @@
+"""mark ticket extras whose stock reservation was released
+
+Revision ID: 032
+Revises: 031
+Create Date: 2026-10-21 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '032'
+down_revision = '031'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Devolução idempotente: cada linha volta ao estoque no máximo uma vez
+    op.add_column('ticket_extras', sa.Column('released_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column('ticket_extras', 'released_at')
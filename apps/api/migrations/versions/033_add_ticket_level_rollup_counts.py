@@ -0,0 +1,70 @@
+"""add per-ticket counts to ticket_hourly_rollups
+
+Revision ID: 033
+Revises: 032
+Create Date: 2026-10-21 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '033'
+down_revision = '032'
+branch_labels = None
+depends_on = None
+
+TICKET_COLUMNS = (
+    ('ticket_completed_count', sa.Integer),
+    ('ticket_cancelled_count', sa.Integer),
+    ('ticket_wait_seconds_sum', sa.Float),
+    ('ticket_wait_count', sa.Integer),
+    ('ticket_service_seconds_sum', sa.Float),
+    ('ticket_service_count', sa.Integer),
+)
+
+
+def upgrade():
+    for name, type_ in TICKET_COLUMNS:
+        op.add_column('ticket_hourly_rollups', sa.Column(name, type_, nullable=False, server_default='0'))
+
+    # Preenche as linhas existentes: cada ticket conta só na linha do primeiro serviço (menor id)
+    op.execute("""
+        UPDATE ticket_hourly_rollups r
+           SET ticket_completed_count = a.completed,
+               ticket_cancelled_count = a.cancelled,
+               ticket_wait_seconds_sum = a.wait_sum,
+               ticket_wait_count = a.wait_count,
+               ticket_service_seconds_sum = a.service_sum,
+               ticket_service_count = a.service_count
+          FROM (
+            SELECT t.tenant_id,
+                   ts.service_id,
+                   date_trunc('hour', COALESCE(t.completed_at, t.cancelled_at)) AS bucket,
+                   count(*) FILTER (WHERE t.status = 'completed') AS completed,
+                   count(*) FILTER (WHERE t.status = 'cancelled') AS cancelled,
+                   COALESCE(sum(extract(epoch FROM t.called_at - COALESCE(t.queued_at, t.created_at)))
+                            FILTER (WHERE t.status = 'completed'), 0) AS wait_sum,
+                   count(extract(epoch FROM t.called_at - COALESCE(t.queued_at, t.created_at)))
+                            FILTER (WHERE t.status = 'completed') AS wait_count,
+                   COALESCE(sum(extract(epoch FROM t.completed_at - t.started_at))
+                            FILTER (WHERE t.status = 'completed'), 0) AS service_sum,
+                   count(extract(epoch FROM t.completed_at - t.started_at))
+                            FILTER (WHERE t.status = 'completed') AS service_count
+              FROM tickets t
+              JOIN ticket_services ts ON ts.ticket_id = t.id
+             WHERE t.status IN ('completed', 'cancelled')
+               AND COALESCE(t.completed_at, t.cancelled_at) IS NOT NULL
+               AND ts.id = (SELECT first.id FROM ticket_services first
+                             WHERE first.ticket_id = t.id ORDER BY first.id LIMIT 1)
+             GROUP BY t.tenant_id, ts.service_id, 3
+          ) a
+         WHERE r.tenant_id = a.tenant_id
+           AND r.service_id = a.service_id
+           AND r.bucket = a.bucket
+    """)
+
+
+def downgrade():
+    for name, _ in reversed(TICKET_COLUMNS):
+        op.drop_column('ticket_hourly_rollups', name)
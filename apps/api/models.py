@@ -1,12 +1,13 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Numeric, JSON, Text, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Numeric, JSON, Text, Float, UniqueConstraint, Index, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import uuid
 import enum
 import datetime
 
 from database import Base
+from services.customer_search import normalize_search_text
 
 # --------------------------------------------------------
 # Enums auxiliares
@@ -22,6 +23,10 @@ class EquipmentStatus(enum.Enum):
     offline = "offline"
     maintenance = "maintenance"
 
+def _customer_name_search_default(context):
+    """Nome normalizado para a busca (services.customer_search)"""
+    return normalize_search_text(context.get_current_parameters().get("customer_name"))
+
 # --------------------------------------------------------
 # Novos modelos
 # --------------------------------------------------------
@@ -134,14 +139,28 @@ class Service(Base):
 class PaymentSession(Base):
     """Sessão de pagamento criada quando cliente escolhe serviço, antes do pagamento ser confirmado"""
     __tablename__ = "payment_sessions"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index("idx_payment_sessions_transaction_id", "transaction_id",
+              postgresql_where=text("transaction_id IS NOT NULL")),
+        Index("idx_payment_sessions_pending_expires_at", "expires_at",
+              postgresql_where=text("status = 'pending'")),
+        Index("idx_payment_sessions_tenant_cpf_hash", "tenant_id", "customer_cpf_hash",
+              postgresql_where=text("customer_cpf_hash IS NOT NULL")),
+        Index("idx_payment_sessions_customer_id", "customer_id",
+              postgresql_where=text("customer_id IS NOT NULL")),
+        Index("idx_payment_sessions_pending_last_polled_at", text("last_polled_at NULLS FIRST"),
+              postgresql_where=text("status = 'pending' AND transaction_id IS NOT NULL")),
+        {'extend_existing': True},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
     service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"), nullable=False)
     ticket_id = Column(UUID(as_uuid=True), ForeignKey("tickets.id"), nullable=True)  # Adicionado
     customer_name = Column(String(100), nullable=False)
-    customer_cpf = Column(String(14), nullable=True)  # Aceita CPF formatado (11 dígitos + formatação)
+    customer_cpf = Column(String(255), nullable=True)  # CPF (formatado ou cifrado com Fernet)
+    customer_cpf_hash = Column(String(64), nullable=True)  # Blind index: security.cpf_blind_index
+    customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"), nullable=True)
     customer_phone = Column(String(20), nullable=True)
     consent_version = Column(String(10), nullable=False)
     status = Column(String(20), nullable=False, default="pending")  # pending, paid, failed, expired
@@ -154,6 +173,7 @@ class PaymentSession(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     completed_at = Column(DateTime(timezone=True))
+    last_polled_at = Column(DateTime(timezone=True), nullable=True)  # Última consulta do poller ao provedor
 
     # Relationships
     tenant = relationship("Tenant", back_populates="payment_sessions")
@@ -164,7 +184,20 @@ class PaymentSession(Base):
 
 class Ticket(Base):
     __tablename__ = "tickets"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index("idx_tickets_payment_session_id", "payment_session_id",
+              postgresql_where=text("payment_session_id IS NOT NULL")),
+        Index("idx_tickets_tenant_ticket_number", "tenant_id", "ticket_number"),
+        Index("idx_tickets_tenant_cpf_hash", "tenant_id", "customer_cpf_hash",
+              postgresql_where=text("customer_cpf_hash IS NOT NULL")),
+        # Busca por prefixo do nome; o GIN com pg_trgm é criado pela migração 028
+        Index("idx_tickets_tenant_name_search", "tenant_id", "customer_name_search",
+              postgresql_ops={"customer_name_search": "text_pattern_ops"}),
+        # Histórico de visitas do cliente (mais recentes primeiro)
+        Index("idx_tickets_customer_created_at", "customer_id", "created_at",
+              postgresql_where=text("customer_id IS NOT NULL")),
+        {'extend_existing': True},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
@@ -177,7 +210,10 @@ class Ticket(Base):
     
     # Dados do cliente
     customer_name = Column(String(100), nullable=False)
-    customer_cpf = Column(String(14), nullable=True)  # Aceita CPF formatado (11 dígitos + formatação)
+    customer_cpf = Column(String(255), nullable=True)  # CPF (formatado ou cifrado com Fernet)
+    customer_cpf_hash = Column(String(64), nullable=True)  # Blind index: security.cpf_blind_index
+    customer_name_search = Column(String(100), nullable=True, default=_customer_name_search_default)  # Nome sem acentos/minúsculo
+    customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"), nullable=True)
     customer_phone = Column(String(20), nullable=True)
     consent_version = Column(String(10), nullable=False)
     
@@ -234,13 +270,38 @@ class Operator(Base):
     # Relationships
     tenant = relationship("Tenant", back_populates="operators")
 
+class CustomerProfile(Base):
+    """Cliente deduplicado por tenant (chave: blind index do CPF)"""
+    __tablename__ = "customers"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "cpf_hash", name="uq_customers_tenant_cpf_hash"),
+        {'extend_existing': True},
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
+    cpf_hash = Column(String(64), nullable=False)  # security.cpf_blind_index
+    name = Column(String(100), nullable=False)
+    phone = Column(String(20), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    last_seen_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    tenant = relationship("Tenant")
+
 class Consent(Base):
     __tablename__ = "consents"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index("idx_consents_customer_created_at", "customer_id", "created_at",
+              postgresql_where=text("customer_id IS NOT NULL")),
+        {'extend_existing': True},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
     payment_session_id = Column(UUID(as_uuid=True), ForeignKey("payment_sessions.id"), nullable=False)
+    customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"), nullable=True)
     version = Column(String(10), nullable=False)
     ip_address = Column(String(45))
     user_agent = Column(Text)
@@ -307,7 +368,10 @@ class OperationConfig(Base):
 
 class OperationConfigService(Base):
     __tablename__ = 'operation_config_services'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        UniqueConstraint('operation_config_id', 'service_id', name='uq_operation_config_services_config_service'),  # Alvo do upsert (services.operation_config)
+        {'extend_existing': True},
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     operation_config_id = Column(UUID(as_uuid=True), ForeignKey('operation_config.id'), nullable=False)
     service_id = Column(UUID(as_uuid=True), ForeignKey('services.id'), nullable=False)
@@ -321,7 +385,10 @@ class OperationConfigService(Base):
 
 class OperationConfigEquipment(Base):
     __tablename__ = 'operation_config_equipments'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        UniqueConstraint('operation_config_id', 'equipment_id', name='uq_operation_config_equipments_config_equipment'),  # Alvo do upsert (services.operation_config)
+        {'extend_existing': True},
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     operation_config_id = Column(UUID(as_uuid=True), ForeignKey('operation_config.id'), nullable=False)
     equipment_id = Column(UUID(as_uuid=True), ForeignKey('equipments.id'), nullable=False)
@@ -333,7 +400,10 @@ class OperationConfigEquipment(Base):
 
 class OperationConfigExtra(Base):
     __tablename__ = 'operation_config_extras'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        UniqueConstraint('operation_config_id', 'extra_id', name='uq_operation_config_extras_config_extra'),  # Alvo do upsert (services.operation_config)
+        {'extend_existing': True},
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     operation_config_id = Column(UUID(as_uuid=True), ForeignKey('operation_config.id'), nullable=False)
     extra_id = Column(UUID(as_uuid=True), ForeignKey('extras.id'), nullable=False)
@@ -352,6 +422,7 @@ class TicketExtra(Base):
     extra_id = Column(UUID(as_uuid=True), ForeignKey("extras.id"), nullable=False)
     quantity = Column(Integer, default=1, nullable=False)
     price = Column(Numeric(10,2), nullable=False)
+    released_at = Column(DateTime(timezone=True), nullable=True)  # Reserva de estoque devolvida (services.stock)
 
     ticket = relationship("Ticket", back_populates="extras")
     extra = relationship("Extra") 
@@ -402,4 +473,62 @@ class TicketServiceProgress(Base):
 
     # Relationships
     ticket_service = relationship("TicketService", back_populates="progress")
-    equipment = relationship("Equipment", foreign_keys=[equipment_id]) 
\ No newline at end of file
+    equipment = relationship("Equipment", foreign_keys=[equipment_id])
+
+# NOVO: Agregados por hora (tenant, serviço) mantidos incrementalmente ao finalizar tickets
+class TicketHourlyRollup(Base):
+    __tablename__ = "ticket_hourly_rollups"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "service_id", "bucket", name="uq_ticket_hourly_rollups_tenant_service_bucket"),
+        Index("idx_ticket_hourly_rollups_tenant_bucket", "tenant_id", "bucket"),
+        {'extend_existing': True}
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
+    service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"), nullable=False)
+    bucket = Column(DateTime(timezone=True), nullable=False)          # Hora (date_trunc) em que os tickets foram finalizados
+    completed_count = Column(Integer, nullable=False, default=0)
+    cancelled_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(12, 2), nullable=False, default=0)      # Soma dos preços dos serviços concluídos
+    wait_seconds_sum = Column(Float, nullable=False, default=0)       # Fila até chamada
+    wait_count = Column(Integer, nullable=False, default=0)
+    service_seconds_sum = Column(Float, nullable=False, default=0)    # Início até conclusão do atendimento
+    service_count = Column(Integer, nullable=False, default=0)
+    # Por ticket: somadas só na linha do primeiro serviço (totais do tenant sem contar o ticket por serviço)
+    ticket_completed_count = Column(Integer, nullable=False, default=0)
+    ticket_cancelled_count = Column(Integer, nullable=False, default=0)
+    ticket_wait_seconds_sum = Column(Float, nullable=False, default=0)
+    ticket_wait_count = Column(Integer, nullable=False, default=0)
+    ticket_service_seconds_sum = Column(Float, nullable=False, default=0)
+    ticket_service_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# NOVO: Caixa de entrada durável de webhooks (gravada no recebimento, processada por workers)
+class WebhookInbox(Base):
+    __tablename__ = "webhook_inbox"
+    __table_args__ = (
+        Index("idx_webhook_inbox_status_next_attempt", "status", "next_attempt_at"),
+        {'extend_existing': True}
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    provider = Column(String(20), nullable=False)
+    transaction_id = Column(String(100), nullable=True)
+    event_type = Column(String(100), nullable=True)
+    event_timestamp = Column(DateTime(timezone=True), nullable=True)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, processing, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)  # Também serve de lease em "processing"
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+# NOVO: IDs de webhooks já vistos (proteção contra replay compartilhada entre workers)
+class WebhookReplayId(Base):
+    __tablename__ = "webhook_replay_ids"
+    __table_args__ = {'extend_existing': True}
+
+    webhook_id = Column(String(64), primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
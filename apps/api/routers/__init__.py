@@ -11,6 +11,7 @@ from . import webhooks
 from . import terminals
 from . import operation
 from . import notifications
+from . import totem
 
 __all__ = [
     "auth",
@@ -24,5 +25,6 @@ __all__ = [
     "webhooks",
     "terminals",
     "operation",
-    "notifications"
+    "notifications",
+    "totem"
 ] 
\ No newline at end of file
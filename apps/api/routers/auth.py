@@ -8,6 +8,7 @@ from schemas import TokenWithOperator, OperatorCreate, Operator
 from models import Operator as DBOperator
 from auth import authenticate_operator, create_operator, update_operator_last_login
 from security import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from services.password_hasher import PasswordHasherBusyError
 
 router = APIRouter(
     tags=["authentication"]
@@ -19,7 +20,14 @@ async def login_for_access_token(
     db: Session = Depends(get_db)
 ):
     """Login endpoint to get JWT token."""
-    operator = authenticate_operator(db, form_data.username, form_data.password)
+    try:
+        operator = await authenticate_operator(db, form_data.username, form_data.password)
+    except PasswordHasherBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, try again",
+            headers={"Retry-After": "1"},
+        )
     if not operator:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -62,4 +70,4 @@ async def register_operator(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
-    return create_operator(db, operator) 
\ No newline at end of file
+    return await create_operator(db, operator) 
\ No newline at end of file
@@ -1,15 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from typing import Optional
+from sqlalchemy import and_, select, tuple_
+from typing import List, Optional
 from uuid import UUID
 from datetime import datetime, timedelta
 import re
 import logging
 
 from database import get_db
-from models import PaymentSession, Ticket, Consent
-from schemas import Customer
+from models import Ticket, Consent, CustomerProfile
+from schemas import Customer, CustomerSearchPage, CustomerVisit
+from security import cpf_blind_index
+from services.customer_search import MAX_SEARCH_LIMIT, search_customers_by_name
 
 # Configurar logger
 logger = logging.getLogger(__name__)
@@ -102,118 +104,53 @@ async def search_customer(
         
         logger.info(f"🔍 Buscando por CPF: {cpf_clean}")
         
-        # PRIMEIRO: Buscar em Ticket (dados reais dos clientes)
-        logger.info(f"🔍 DEBUG - Executando query em Ticket...")
+        # Cadastro deduplicado: sondagem única em (tenant_id, cpf_hash)
+        customer = db.query(CustomerProfile).filter(
+            CustomerProfile.tenant_id == tenant_id,
+            CustomerProfile.cpf_hash == cpf_blind_index(cpf_clean)
+        ).first()
         
-        # Buscar tanto por CPF normalizado quanto formatado
-        logger.info(f"🔍 DEBUG - Buscando por CPF normalizado: '{cpf_clean}'")
-        logger.info(f"🔍 DEBUG - Buscando por CPF original: '{search_term}'")
-        
-        # Primeiro, vamos verificar se existem tickets com CPF
-        all_tickets_with_cpf = db.query(Ticket).filter(
-            and_(
-                Ticket.tenant_id == tenant_id,
-                Ticket.customer_cpf.isnot(None)
-            )
-        ).all()
-        
-        logger.info(f"🔍 DEBUG - Total de tickets com CPF: {len(all_tickets_with_cpf)}")
-        for t in all_tickets_with_cpf[:3]:
-            logger.info(f"🔍 DEBUG - Ticket com CPF: '{t.customer_cpf}' (nome: {t.customer_name})")
-        
-        ticket = db.query(Ticket).filter(
-            and_(
-                Ticket.tenant_id == tenant_id,
-                or_(
-                    Ticket.customer_cpf == cpf_clean,  # CPF sem formatação
-                    Ticket.customer_cpf == search_term   # CPF com formatação original
-                )
-            )
-        ).order_by(Ticket.created_at.desc()).first()
-        
-        logger.info(f"🔍 DEBUG - Resultado da busca em Ticket: {ticket}")
-        
-        if ticket:
-            logger.info(f"✅ Cliente encontrado em Ticket: {ticket.customer_name}")
+        if customer:
+            logger.info(f"✅ Cliente encontrado: {customer.name}")
             return Customer(
-                name=ticket.customer_name,
-                cpf=ticket.customer_cpf,
-                phone=ticket.customer_phone
-            )
-        
-        # SEGUNDO: Buscar em PaymentSession (apenas como fallback)
-        logger.info(f"🔍 DEBUG - Executando query em PaymentSession...")
-        payment_session = db.query(PaymentSession).filter(
-            and_(
-                PaymentSession.tenant_id == tenant_id,
-                or_(
-                    PaymentSession.customer_cpf == cpf_clean,  # CPF sem formatação
-                    PaymentSession.customer_cpf == search_term   # CPF com formatação original
-                )
-            )
-        ).order_by(PaymentSession.created_at.desc()).first()
-        
-        logger.info(f"🔍 DEBUG - Resultado da busca em PaymentSession: {payment_session}")
-        
-        if payment_session:
-            logger.info(f"✅ Cliente encontrado em PaymentSession (fallback): {payment_session.customer_name}")
-            return Customer(
-                name=payment_session.customer_name,
-                cpf=payment_session.customer_cpf,
-                phone=payment_session.customer_phone
+                name=customer.name,
+                cpf=cpf_clean,
+                phone=customer.phone
             )
         
         logger.info(f"ℹ️ Cliente não encontrado para CPF: {cpf_clean}")
         return None
     
     else:
-        # Busca por nome (case insensitive)
+        # Busca por nome: mesma busca ranqueada de /search/names, só o melhor resultado
         logger.info(f"🔍 Buscando por nome: {search_term}")
-        name_search = f"%{search_term}%"
-        
-        logger.info(f"🔍 DEBUG - name_search: '{name_search}'")
-        
-        # PRIMEIRO: Buscar em Ticket (dados reais dos clientes)
-        logger.info(f"🔍 DEBUG - Executando query em Ticket por nome...")
-        ticket = db.query(Ticket).filter(
-            and_(
-                Ticket.tenant_id == tenant_id,
-                Ticket.customer_name.ilike(name_search)
-            )
-        ).order_by(Ticket.created_at.desc()).first()
+        page = search_customers_by_name(db, tenant_id, search_term, limit=1)
         
-        logger.info(f"🔍 DEBUG - Resultado da busca em Ticket por nome: {ticket}")
-        
-        if ticket:
-            logger.info(f"✅ Cliente encontrado em Ticket: {ticket.customer_name}")
-            return Customer(
-                name=ticket.customer_name,
-                cpf=ticket.customer_cpf,
-                phone=ticket.customer_phone
-            )
-        
-        # SEGUNDO: Buscar em PaymentSession (apenas como fallback)
-        logger.info(f"🔍 DEBUG - Executando query em PaymentSession por nome...")
-        payment_session = db.query(PaymentSession).filter(
-            and_(
-                PaymentSession.tenant_id == tenant_id,
-                PaymentSession.customer_name.ilike(name_search)
-            )
-        ).order_by(PaymentSession.created_at.desc()).first()
-        
-        logger.info(f"🔍 DEBUG - Resultado da busca em PaymentSession por nome: {payment_session}")
-        
-        if payment_session:
-            logger.info(f"✅ Cliente encontrado em PaymentSession (fallback): {payment_session.customer_name}")
-            return Customer(
-                name=payment_session.customer_name,
-                cpf=payment_session.customer_cpf,
-                phone=payment_session.customer_phone
-            )
+        if page["items"]:
+            customer = page["items"][0]
+            logger.info(f"✅ Cliente encontrado em Ticket: {customer['name']}")
+            return Customer(**customer)
         
         logger.info(f"ℹ️ Cliente não encontrado para nome: {search_term}")
         return None
 
+@router.get("/search/names", response_model=CustomerSearchPage)
+async def search_customer_names(
+    q: str = Query(..., min_length=3, description="Trecho do nome (acentos e maiúsculas são ignorados)"),
+    tenant_id: UUID = Query(..., description="ID do tenant"),
+    limit: int = Query(10, ge=1, le=MAX_SEARCH_LIMIT, description="Itens por página"),
+    cursor: Optional[str] = Query(None, description="next_cursor da página anterior"),
+    db: Session = Depends(get_db)
+):
+    """
+    Lista clientes cujo nome casa com o termo: prefixos primeiro, depois por semelhança.
+    Um item por nome (dados do ticket mais recente); paginação por cursor.
+    """
+    try:
+        return search_customers_by_name(db, tenant_id, q, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/debug/tickets")
 async def debug_tickets(
     tenant_id: UUID = Query(...),
@@ -228,30 +165,32 @@ async def debug_tickets(
     total_tickets = db.query(Ticket).filter(Ticket.tenant_id == tenant_id).count()
     logger.info(f"🔍 DEBUG - Total de tickets: {total_tickets}")
     
-    # Buscar tickets com CPF
-    tickets_with_cpf = db.query(Ticket).filter(
+    # Buscar tickets com CPF (apenas contagem + amostra)
+    tickets_with_cpf_query = db.query(Ticket).filter(
         and_(
             Ticket.tenant_id == tenant_id,
             Ticket.customer_cpf.isnot(None)
         )
-    ).all()
+    )
+    tickets_with_cpf = tickets_with_cpf_query.count()
+    examples = tickets_with_cpf_query.order_by(Ticket.created_at.desc()).limit(5).all()
     
-    logger.info(f"🔍 DEBUG - Tickets com CPF: {len(tickets_with_cpf)}")
+    logger.info(f"🔍 DEBUG - Tickets com CPF: {tickets_with_cpf}")
     
     # Mostrar alguns exemplos
-    for i, ticket in enumerate(tickets_with_cpf[:5]):
+    for i, ticket in enumerate(examples):
         logger.info(f"🔍 DEBUG - Ticket {i+1}: {ticket.customer_name}, CPF: {ticket.customer_cpf}")
     
     return {
         "total_tickets": total_tickets,
-        "tickets_with_cpf": len(tickets_with_cpf),
+        "tickets_with_cpf": tickets_with_cpf,
         "examples": [
             {
                 "name": ticket.customer_name,
                 "cpf": ticket.customer_cpf,
                 "phone": ticket.customer_phone
             }
-            for ticket in tickets_with_cpf[:5]
+            for ticket in examples
         ]
     }
 
@@ -277,18 +216,13 @@ async def get_last_consent(
         logger.warning(f"❌ CPF inválido para busca de consentimento: {cpf}")
         return None
     
-    logger.info(f"🔍 DEBUG - Buscando consentimento por CPF: '{cpf_clean}' (original: '{cpf}')")
-    
-    # Buscar consentimento em PaymentSession
+    # Consentimento mais recente do cliente (idx_consents_customer_created_at)
     consent = db.query(Consent).join(
-        PaymentSession, 
-        Consent.payment_session_id == PaymentSession.id
+        CustomerProfile,
+        Consent.customer_id == CustomerProfile.id
     ).filter(
-        Consent.tenant_id == tenant_id,
-        or_(
-            PaymentSession.customer_cpf == cpf_clean,  # CPF sem formatação
-            PaymentSession.customer_cpf == cpf          # CPF com formatação original
-        ),
+        CustomerProfile.tenant_id == tenant_id,
+        CustomerProfile.cpf_hash == cpf_blind_index(cpf_clean),
         Consent.signature.isnot(None),
         Consent.created_at >= cutoff
     ).order_by(Consent.created_at.desc()).first()
@@ -301,4 +235,35 @@ async def get_last_consent(
         }
     
     logger.info(f"ℹ️ Nenhum consentimento válido encontrado para CPF: {cpf}")
-    return None 
\ No newline at end of file
+    return None
+
+@router.get("/visits", response_model=List[CustomerVisit])
+async def get_customer_visits(
+    tenant_id: UUID = Query(...),
+    cpf: str = Query(..., description="CPF do cliente"),
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[UUID] = Query(None, description="id da última visita da página anterior"),
+    db: Session = Depends(get_db)
+):
+    """
+    Histórico de visitas (tickets) do cliente, mais recentes primeiro.
+    """
+    cpf_clean = normalize_cpf(cpf)
+    if not validate_cpf(cpf_clean):
+        raise HTTPException(status_code=400, detail="CPF inválido")
+    
+    query = db.query(Ticket).join(
+        CustomerProfile,
+        Ticket.customer_id == CustomerProfile.id
+    ).filter(
+        CustomerProfile.tenant_id == tenant_id,
+        CustomerProfile.cpf_hash == cpf_blind_index(cpf_clean)
+    )
+    if after:
+        # Keyset: continua depois da visita (created_at, id) informada
+        last = db.query(Ticket.created_at, Ticket.id).filter(Ticket.id == after).subquery()
+        query = query.filter(
+            tuple_(Ticket.created_at, Ticket.id) < select(last.c.created_at, last.c.id).scalar_subquery()
+        )
+    
+    return query.order_by(Ticket.created_at.desc(), Ticket.id.desc()).limit(limit).all()
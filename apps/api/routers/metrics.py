@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from datetime import datetime, timedelta
 from services.metrics import MetricsService
 from auth import get_current_operator
 from models import Operator
-from database import get_db
+from database import get_db, SessionLocal
 from sqlalchemy.orm import Session
 
 router = APIRouter()
@@ -38,22 +39,35 @@ async def get_service_metrics(
 async def export_metrics(
     start_date: datetime,
     end_date: datetime,
-    current_operator: Operator = Depends(get_current_operator),
-    db: Session = Depends(get_db)
+    compress: bool = False,
+    current_operator: Operator = Depends(get_current_operator)
 ):
-    """Exporta métricas em formato CSV"""
-    metrics_service = MetricsService(db)
-    csv_data = await metrics_service.export_metrics_csv(
-        current_operator.tenant_id,
-        start_date,
-        end_date
-    )
-    
-    return Response(
-        content=csv_data,
-        media_type="text/csv",
+    """Exporta métricas em formato CSV (streaming, opcionalmente em gzip)"""
+    tenant_id = current_operator.tenant_id
+
+    def generate():
+        # Sessão própria: a do Depends(get_db) é fechada antes do corpo ser enviado
+        db = SessionLocal()
+        try:
+            yield from MetricsService(db).stream_metrics_csv(
+                tenant_id,
+                start_date,
+                end_date,
+                compress=compress
+            )
+        finally:
+            db.close()
+
+    filename = f"metrics_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.csv"
+    if compress:
+        filename += ".gz"
+
+    # Gerador síncrono: o Starlette itera em threadpool, sem bloquear o event loop
+    return StreamingResponse(
+        generate(),
+        media_type="application/gzip" if compress else "text/csv",
         headers={
-            "Content-Disposition": f"attachment; filename=metrics_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.csv"
+            "Content-Disposition": f"attachment; filename={filename}"
         }
     )
 
@@ -5,6 +5,9 @@ from datetime import datetime
 from pydantic import BaseModel, Field, validator
 from database import get_db
 from auth import get_current_operator
+from services.payment.factory import PaymentAdapterFactory
+from services.catalog import catalog_cache, serialize_operation_status
+from services.operation_config import apply_operation_config
 import threading
 from models import Equipment, Service, Extra, OperationConfig, OperationConfigEquipment, OperationConfigExtra, OperationStatusModel, OperationConfigService
 from uuid import UUID
@@ -108,18 +111,7 @@ async def get_operation_info(request: Request, db: Session = Depends(get_db)):
     if not tenant_id:
         raise HTTPException(status_code=400, detail="tenant_id é obrigatório")
     status_obj = db.query(OperationStatusModel).filter(OperationStatusModel.tenant_id == tenant_id).first()
-    if not status_obj:
-        return {"is_operating": False, "service_duration": 10, "equipment_counts": {}}
-    return {
-        "is_operating": status_obj.is_operating,
-        "service_duration": status_obj.service_duration,
-        "equipment_counts": status_obj.equipment_counts,
-        "operator_id": str(status_obj.operator_id) if status_obj.operator_id else None,
-        "operator_name": status_obj.operator_name,
-        "started_at": status_obj.started_at.isoformat() if status_obj.started_at else None,
-        "ended_at": status_obj.ended_at.isoformat() if status_obj.ended_at else None,
-        "updated_at": status_obj.updated_at.isoformat() if status_obj.updated_at else None,
-    }
+    return serialize_operation_status(status_obj)
 
 @router.post("/start", summary="Inicia uma operação")
 async def start_operation(req: OperationStartRequest, db: Session = Depends(get_db)):
@@ -212,115 +204,42 @@ async def save_operation_config(
     cfg: OperationConfigIn,
     db: Session = Depends(get_db)
 ):
-    # Remove configurações antigas garantindo cascata correta
-    old_cfgs = db.query(OperationConfig).filter(OperationConfig.tenant_id == cfg.tenant_id).all()
-    for oc in old_cfgs:
-        db.delete(oc)
-    db.commit()
-    op_cfg = OperationConfig(
-        tenant_id=cfg.tenant_id,
-        operator_id=cfg.operator_id,
-        payment_modes=cfg.payment_modes or [],
-        payment_config=cfg.payment_config or {},
-    )
-    db.add(op_cfg)
-    db.commit()
-    db.refresh(op_cfg)
-
-    # Adicionar serviços
-    for s in cfg.services:
-        svc = OperationConfigService(
-            operation_config_id=op_cfg.id,
-            service_id=s.service_id,
-            active=s.active,
-            duration=s.duration,
-            price=s.price,
-            equipment_count=s.equipment_count,
-        )
-        db.add(svc)
-
-    # Adicionar equipamentos
-    for e in cfg.equipments:
-        eq = OperationConfigEquipment(
-            operation_config_id=op_cfg.id,
-            equipment_id=e.equipment_id,
-            active=e.active,
-            quantity=e.quantity,
-        )
-        db.add(eq)
-
-    # Adicionar extras
-    for x in cfg.extras:
-        # Buscar o extra atual para sincronizar o estoque
-        current_extra = db.query(Extra).filter(Extra.id == x.extra_id).first()
-        if current_extra:
-            # Sincronizar o estoque da tabela extras com a configuração
-            current_extra.stock = x.stock
-            db.add(current_extra)
-            logger.info(f"🔍 DEBUG - Sincronizando estoque do extra {current_extra.name}: {x.stock}")
-        
-        ex = OperationConfigExtra(
-            operation_config_id=op_cfg.id,
-            extra_id=x.extra_id,
-            active=x.active,
-            stock=x.stock,
-            price=x.price,
-        )
-        db.add(ex)
+    # Aplica só a diferença (upsert/delete em lote); commit único no final
+    try:
+        apply_operation_config(db, cfg)
 
-    db.commit()
-
-    # --- Atualizar status dos equipamentos ---
-    equipment_ids_active = [e.equipment_id for e in cfg.equipments if e.active]
-    db.query(Equipment).filter(Equipment.id.in_(equipment_ids_active)).update(
-        {Equipment.status: "online"}, synchronize_session=False
-    )
-    db.query(Equipment).filter(~Equipment.id.in_(equipment_ids_active)).update(
-        {Equipment.status: "offline"}, synchronize_session=False
-    )
-
-    # --- Atualizar status dos serviços ---
-    service_ids_active = [s.service_id for s in cfg.services if s.active]
-    db.query(Service).filter(Service.id.in_(service_ids_active)).update(
-        {Service.is_active: True}, synchronize_session=False
-    )
-    db.query(Service).filter(~Service.id.in_(service_ids_active)).update(
-        {Service.is_active: False}, synchronize_session=False
-    )
+        # --- Atualizar ou criar status da operação ---
+        status_obj = db.query(OperationStatusModel).filter(OperationStatusModel.tenant_id == cfg.tenant_id).first()
+        now = datetime.utcnow()
+        if not status_obj:
+            status_obj = OperationStatusModel(
+                tenant_id=cfg.tenant_id,
+                is_operating=True,
+                service_duration=cfg.services[0].duration if cfg.services else 10,
+                equipment_counts={str(e.equipment_id): e.quantity for e in cfg.equipments},
+                operator_id=cfg.operator_id,
+                operator_name=None,
+                started_at=now,
+                ended_at=None,
+                updated_at=now,
+            )
+            db.add(status_obj)
+        else:
+            status_obj.is_operating = True
+            status_obj.service_duration = cfg.services[0].duration if cfg.services else 10
+            status_obj.equipment_counts = {str(e.equipment_id): e.quantity for e in cfg.equipments}
+            status_obj.operator_id = cfg.operator_id
+            status_obj.updated_at = now
+            status_obj.ended_at = None
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
-    # --- Atualizar status dos extras ---
-    extra_ids_active = [x.extra_id for x in cfg.extras if x.active]
-    db.query(Extra).filter(Extra.id.in_(extra_ids_active)).update(
-        {Extra.is_active: True}, synchronize_session=False
-    )
-    db.query(Extra).filter(~Extra.id.in_(extra_ids_active)).update(
-        {Extra.is_active: False}, synchronize_session=False
-    )
-
-    # --- Atualizar ou criar status da operação ---
-    status_obj = db.query(OperationStatusModel).filter(OperationStatusModel.tenant_id == cfg.tenant_id).first()
-    now = datetime.utcnow()
-    if not status_obj:
-        status_obj = OperationStatusModel(
-            tenant_id=cfg.tenant_id,
-            is_operating=True,
-            service_duration=cfg.services[0].duration if cfg.services else 10,
-            equipment_counts={str(e.equipment_id): e.quantity for e in cfg.equipments},
-            operator_id=cfg.operator_id,
-            operator_name=None,
-            started_at=now,
-            ended_at=None,
-            updated_at=now,
-        )
-        db.add(status_obj)
-    else:
-        status_obj.is_operating = True
-        status_obj.service_duration = cfg.services[0].duration if cfg.services else 10
-        status_obj.equipment_counts = {str(e.equipment_id): e.quantity for e in cfg.equipments}
-        status_obj.operator_id = cfg.operator_id
-        status_obj.updated_at = now
-        status_obj.ended_at = None
-    db.commit()
+    # payment_config pode ter mudado: descarta adaptadores de pagamento em cache
+    PaymentAdapterFactory.invalidate_tenant(cfg.tenant_id)
+    # Ativação de serviços/extras é feita com UPDATE em massa (sem eventos do ORM)
+    catalog_cache.invalidate(cfg.tenant_id)
 
     return {"message": "Configuração salva com sucesso"}
 
@@ -1,11 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
 import uuid
-import qrcode
-import io
-import base64
 import json
 import logging
 import os
@@ -14,12 +11,20 @@ from database import get_db
 from models import PaymentSession, Service, Tenant, Ticket, Consent, TicketService, TicketExtra
 from schemas import PaymentSessionCreate, PaymentSession as PaymentSessionSchema, PaymentSessionWithQR, PaymentSessionList, Ticket as TicketSchema
 from auth import get_current_operator
-from security import encrypt_data, decrypt_data
+from security import encrypt_data, decrypt_data, cpf_blind_index
 from services.payment.factory import PaymentAdapterFactory
 from services.printer_service import printer_manager
 from constants import TicketStatus, PaymentSessionStatus
 from services.queue_manager import get_queue_manager
 from services.websocket import websocket_manager
+from services.metrics import record_ticket_created, record_payment_processed
+from services.payment_status import confirm_paid_session, create_ticket_from_payment_session, is_duplicate_delivery
+from services.customer_profiles import upsert_customer
+from services.payment_poller import payment_status_poller
+from services.payment_expiry import UNPAID_CANCELLATION_REASONS, cancel_unpaid_tickets, payment_expiry_sweeper
+from services.catalog import catalog_cache
+from services.qr_codes import QR_FORMATS, QRCodeRenderer
+from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
@@ -27,29 +32,46 @@ router = APIRouter(
     tags=["payment-sessions"]
 )
 
-def generate_qr_code(payment_link: str) -> str:
-    """Generate QR code from payment link."""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(payment_link)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    
-    return f"data:image/png;base64,{img_str}"
+QR_FORMAT_PATTERN = f"^({'|'.join(QR_FORMATS)})$"
+
+qr_code_renderer = QRCodeRenderer(
+    max_workers=settings.QR_RENDER_WORKERS,
+    cache_size=settings.QR_CACHE_SIZE
+)
+
+@router.on_event("startup")
+async def start_payment_background_tasks():
+    """Inicia a expiração de sessões e o poller de pendentes (fallback para webhooks perdidos)"""
+    payment_expiry_sweeper.start()
+    if settings.PAYMENT_POLLER_ENABLED:
+        payment_status_poller.start()
+
+@router.on_event("shutdown")
+async def close_payment_adapters():
+    """Para as tarefas de fundo e fecha os pools HTTP dos adaptadores de pagamento em cache"""
+    await payment_status_poller.stop()
+    await payment_expiry_sweeper.stop()
+    await PaymentAdapterFactory.close_all()
+    qr_code_renderer.shutdown()
+
+async def _with_qr_code(payment_session: PaymentSession, qr_format: str) -> PaymentSessionWithQR:
+    """Serializa a sessão com o QR code do link de pagamento no formato pedido.
+
+    ``png``/``svg`` vão em ``qr_code``; ``matrix`` vai em ``qr_matrix`` para o
+    totem desenhar localmente."""
+    response = PaymentSessionWithQR.from_orm(payment_session)
+    if payment_session.payment_link:
+        rendered = await qr_code_renderer.render(payment_session.payment_link, qr_format)
+        if qr_format == "matrix":
+            response.qr_matrix = rendered
+        else:
+            response.qr_code = rendered
+    return response
 
-@router.post("", response_model=PaymentSessionSchema)
+@router.post("", response_model=PaymentSessionWithQR)
 async def create_payment_session(
     session_in: PaymentSessionCreate,
+    qr_format: str = Query("png", pattern=QR_FORMAT_PATTERN),
     db: Session = Depends(get_db)
 ):
     # Suporte a simulação de pagamento
@@ -60,6 +82,11 @@ async def create_payment_session(
             service_id=session_in.service_id,
             customer_name=session_in.customer_name,
             customer_cpf=encrypt_data(session_in.customer_cpf) if session_in.customer_cpf else None,
+            customer_cpf_hash=cpf_blind_index(session_in.customer_cpf),
+            customer_id=upsert_customer(
+                db, session_in.tenant_id, session_in.customer_name,
+                cpf=session_in.customer_cpf, phone=session_in.customer_phone
+            ),
             customer_phone=session_in.customer_phone,
             consent_version=session_in.consent_version,
             payment_method=session_in.payment_method,
@@ -94,6 +121,11 @@ async def create_payment_session(
         service_id=session_in.service_id,
         customer_name=session_in.customer_name,
         customer_cpf=encrypt_data(session_in.customer_cpf) if session_in.customer_cpf else None,
+        customer_cpf_hash=cpf_blind_index(session_in.customer_cpf),
+        customer_id=upsert_customer(
+            db, TEMP_TENANT_ID, session_in.customer_name,
+            cpf=session_in.customer_cpf, phone=session_in.customer_phone
+        ),
         customer_phone=session_in.customer_phone,
         consent_version=session_in.consent_version,
         payment_method=session_in.payment_method,
@@ -110,6 +142,7 @@ async def create_payment_session(
     db_consent = Consent(
         tenant_id=TEMP_TENANT_ID,
         payment_session_id=db_payment_session.id,
+        customer_id=db_payment_session.customer_id,
         version=session_in.consent_version,
         signature=getattr(session_in, 'signature', None)  # Salva assinatura se enviada
     )
@@ -134,7 +167,8 @@ async def create_payment_session(
     payment_link = None
     if hasattr(tenant, 'payment_adapter') and tenant.payment_adapter:
         try:
-            adapter = PaymentAdapterFactory.create_adapter(
+            adapter = PaymentAdapterFactory.get_adapter(
+                tenant.id,
                 tenant.payment_adapter,
                 tenant.payment_config or {}
             )
@@ -161,12 +195,8 @@ async def create_payment_session(
             # Log error but continue - pode usar pagamento manual
             print(f"Error creating payment: {e}")
     
-    # Generate QR code if payment link exists
-    response = PaymentSessionSchema.from_orm(db_payment_session)
-    if payment_link:
-        response.qr_code = generate_qr_code(payment_link)
-    
-    return response
+    # Generate QR code if payment link exists (fora do event loop, com cache por link)
+    return await _with_qr_code(db_payment_session, qr_format)
 
 @router.post("/{session_id}/simulate-payment-success", response_model=TicketSchema, include_in_schema=os.environ.get("APP_ENV") == "development")
 async def simulate_payment_success(
@@ -183,7 +213,9 @@ async def simulate_payment_success(
             detail="Endpoint not found"
         )
 
-    payment_session = db.query(PaymentSession).filter(PaymentSession.id == session_id).first()
+    payment_session = db.query(PaymentSession).filter(
+        PaymentSession.id == session_id
+    ).with_for_update().first()
     if not payment_session:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Payment session not found")
 
@@ -195,24 +227,15 @@ async def simulate_payment_success(
     payment_session.completed_at = datetime.utcnow()
     
     # Create ticket from session
-    ticket = await create_ticket_from_payment_session(payment_session, db)
+    ticket = create_ticket_from_payment_session(payment_session, db)
     
     # Commit changes
     db.commit()
     db.refresh(ticket)
+    record_ticket_created(ticket, [payment_session.service_id])
     
     # Notify via WebSocket
-    await websocket_manager.broadcast_to_tenant(
-        tenant_id=str(payment_session.tenant_id),
-        message={
-            "type": "payment_update",
-            "data": {
-                "id": str(payment_session.id),
-                "status": "paid",
-                "ticket_id": str(ticket.id)
-            }
-        }
-    )
+    await _notify_payment_update(payment_session, ticket)
 
     return ticket
 
@@ -222,7 +245,11 @@ async def payment_webhook(
     request: Request,
     db: Session = Depends(get_db)
 ):
-    """Handle payment webhook from payment provider."""
+    """Handle payment webhook from payment provider.
+    
+    Sessão (travada com FOR UPDATE), ticket e status são gravados em um único
+    commit; reentregas do mesmo transaction_id/status são reconhecidas sem
+    efeitos colaterais. Notificações só são enviadas depois do commit."""
     
     try:
         # Get webhook data
@@ -247,10 +274,10 @@ async def payment_webhook(
                 detail="Missing status in webhook"
             )
         
-        # Get payment session by transaction_id
+        # Get payment session by transaction_id (índice + lock até o commit)
         payment_session = db.query(PaymentSession).filter(
             PaymentSession.transaction_id == transaction_id
-        ).first()
+        ).with_for_update().first()
         
         if not payment_session:
             logger.error(f"❌ Payment session not found for transaction_id: {transaction_id}")
@@ -259,6 +286,17 @@ async def payment_webhook(
                 detail=f"Payment session not found for transaction_id: {transaction_id}"
             )
         
+        # Idempotência: reentrega do mesmo status (ou pagamento já convertido em ticket)
+        if is_duplicate_delivery(payment_session, payment_status):
+            db.rollback()  # Libera o lock
+            logger.info(f"🔁 Duplicate webhook for session {payment_session.id} ({payment_status}), ignoring")
+            return {
+                "status": "already_processed",
+                "message": f"Webhook already processed - status is {payment_session.status}",
+                "payment_session_id": str(payment_session.id),
+                "ticket_id": str(payment_session.ticket_id) if payment_session.ticket_id else None
+            }
+        
         # Log current state
         logger.info(f"🔍 Processing webhook for payment session {payment_session.id}")
         logger.info(f"   Current status: {payment_session.status}")
@@ -273,15 +311,20 @@ async def payment_webhook(
         # Handle different payment statuses
         if payment_status == PaymentSessionStatus.PAID.value:
             logger.info(f"💰 Payment confirmed for session {payment_session.id}")
-            payment_session.completed_at = datetime.utcnow()
+            payment_session.completed_at = payment_session.completed_at or datetime.utcnow()
             
             # 🎯 INTEGRAÇÃO PRINCIPAL: Criar ticket automaticamente após pagamento confirmado
             try:
-                ticket = await create_ticket_from_payment_session(payment_session, db)
-                logger.info(f"🎫 Ticket #{ticket.ticket_number} created from payment session {payment_session.id}")
+                ticket, created = confirm_paid_session(payment_session, db)
                 
-                # Commit all changes
+                # Sessão + ticket em um único commit
                 db.commit()
+                logger.info(f"🎫 Ticket #{ticket.ticket_number} ready from payment session {payment_session.id}")
+                if created:
+                    record_ticket_created(ticket, [payment_session.service_id])
+                if old_status != PaymentSessionStatus.PAID.value:  # Já contado na entrega parcial
+                    record_payment_processed(payment_session)
+                await _notify_payment_update(payment_session, ticket)
                 
                 return {
                     "status": "success",
@@ -297,10 +340,16 @@ async def payment_webhook(
                 db.rollback()
                 
                 # Update only payment session status
+                payment_session = db.query(PaymentSession).filter(
+                    PaymentSession.transaction_id == transaction_id
+                ).with_for_update().first()
                 payment_session.status = PaymentSessionStatus.PAID.value
-                payment_session.completed_at = datetime.utcnow()
+                payment_session.completed_at = payment_session.completed_at or datetime.utcnow()
                 payment_session.webhook_data = webhook_data
                 db.commit()
+                if old_status != PaymentSessionStatus.PAID.value:
+                    record_payment_processed(payment_session)
+                await _notify_payment_update(payment_session)
                 
                 # Return error but acknowledge webhook
                 return {
@@ -325,8 +374,20 @@ async def payment_webhook(
         else:
             logger.warning(f"⚠️ Unknown payment status: {payment_status} for session {payment_session.id}")
         
+        # Sessão encerrada sem pagamento: cancela o ticket que ela reservava e devolve o estoque
+        released = []
+        if payment_session.ticket_id and payment_status in UNPAID_CANCELLATION_REASONS:
+            released = cancel_unpaid_tickets(
+                db, [payment_session.ticket_id], UNPAID_CANCELLATION_REASONS[payment_status]
+            )
+        
         # Commit payment session updates
         db.commit()
+        if released:
+            catalog_cache.invalidate(payment_session.tenant_id)  # Estoque de extras devolvido
+        if payment_status == PaymentSessionStatus.FAILED.value:
+            record_payment_processed(payment_session)
+        await _notify_payment_update(payment_session)
         
         logger.info(f"✅ Webhook processed successfully for session {payment_session.id}")
         logger.info(f"   Status changed: {old_status} → {payment_status}")
@@ -348,6 +409,26 @@ async def payment_webhook(
             detail=f"Error processing webhook: {str(e)}"
         )
 
+async def _notify_payment_update(payment_session: PaymentSession, ticket: Optional[Ticket] = None):
+    """Notifica o tenant (após o commit) sobre a mudança da sessão e o novo ticket"""
+    tenant_id = str(payment_session.tenant_id)
+    try:
+        await websocket_manager.broadcast_to_tenant(
+            tenant_id=tenant_id,
+            message={
+                "type": "payment_update",
+                "data": {
+                    "id": str(payment_session.id),
+                    "status": payment_session.status,
+                    "ticket_id": str(ticket.id) if ticket else None
+                }
+            }
+        )
+        if ticket:
+            await websocket_manager.broadcast_ticket_update(tenant_id, ticket)
+    except Exception as e:
+        logger.error(f"❌ Error broadcasting payment update for session {payment_session.id}: {e}")
+
 @router.post("/webhook/simulate")
 async def simulate_webhook(
     transaction_id: str,
@@ -388,65 +469,6 @@ async def simulate_webhook(
     # Call the actual webhook handler
     return await payment_webhook(mock_request, db)
 
-async def create_ticket_from_payment_session(payment_session: PaymentSession, db: Session):
-    """Cria ticket automaticamente após pagamento confirmado."""
-    
-    try:
-        # Get next ticket number for this tenant
-        last_ticket = db.query(Ticket).filter(
-            Ticket.tenant_id == payment_session.tenant_id
-        ).order_by(Ticket.ticket_number.desc()).first()
-        
-        ticket_number = 1 if not last_ticket else last_ticket.ticket_number + 1
-        
-        # Create ticket with IN_QUEUE status (pagamento já confirmado, ir direto para fila)
-        ticket = Ticket(
-            tenant_id=payment_session.tenant_id,
-            payment_session_id=payment_session.id,
-            ticket_number=ticket_number,
-            status=TicketStatus.IN_QUEUE.value,  # Ir direto para fila
-            customer_name=payment_session.customer_name,
-            customer_cpf=payment_session.customer_cpf,
-            customer_phone=payment_session.customer_phone,
-            consent_version=payment_session.consent_version,
-            print_attempts=0,
-            queued_at=datetime.utcnow()  # Definir queued_at imediatamente
-        )
-        
-        db.add(ticket)
-        db.flush()  # Para obter o ID do ticket
-        
-        # ✅ CORREÇÃO: Criar associações na tabela ticket_services para múltiplos serviços
-        from models import TicketService
-        
-        # Buscar todos os serviços da sessão de pagamento
-        # Por enquanto, criar apenas o serviço principal, mas preparar para múltiplos
-        services_to_add = [payment_session.service_id]
-        
-        # TODO: Implementar suporte a múltiplos serviços na PaymentSession
-        # Por enquanto, usar apenas o service_id principal
-        
-        for service_id in services_to_add:
-            ticket_service = TicketService(
-                ticket_id=ticket.id,
-                service_id=service_id,
-                price=payment_session.amount / len(services_to_add)  # Dividir valor entre serviços
-            )
-            db.add(ticket_service)
-            logger.info(f"🔍 DEBUG - Criada associação ticket_service para ticket {ticket.id} com service_id {service_id}")
-        
-        db.commit()
-        db.refresh(ticket)
-        
-        logger.info(f"🎯 Ticket #{ticket.ticket_number} created successfully from payment session {payment_session.id} and moved to queue")
-        return ticket
-        
-    except Exception as e:
-        logger.error(f"❌ Critical error creating ticket from payment session {payment_session.id}: {e}")
-        # Reverter transação se possível
-        db.rollback()
-        raise e
-
 async def _handle_print_success(ticket: Ticket, db: Session):
     """Manipula o sucesso da impressão, movendo ticket para IN_QUEUE"""
     try:
@@ -477,9 +499,10 @@ async def _handle_print_success(ticket: Ticket, db: Session):
     except Exception as e:
         logger.error(f"❌ Error handling print success for ticket #{ticket.ticket_number}: {e}")
 
-@router.get("/{session_id}", response_model=PaymentSessionSchema)
+@router.get("/{session_id}", response_model=PaymentSessionWithQR)
 async def get_payment_session(
     session_id: uuid.UUID,
+    qr_format: str = Query("png", pattern=QR_FORMAT_PATTERN),
     db: Session = Depends(get_db)
 ):
     """Get payment session by ID."""
@@ -491,7 +514,7 @@ async def get_payment_session(
             detail="Payment session not found"
         )
         
-    return session
+    return await _with_qr_code(session, qr_format)
 
 @router.get("", response_model=PaymentSessionList)
 async def list_payment_sessions(
@@ -1,18 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import uuid
 from pydantic import BaseModel
 
 from database import get_db
-from models import Service, Operator, Extra
+from models import Service, Operator
 from schemas import ServiceCreate, Service as ServiceSchema, ServiceList, Extra as ExtraSchema
 from auth import get_current_operator
+from services.catalog import catalog_cache, etag_matches, load_public_catalog, register_catalog_invalidation
 
 router = APIRouter(
     tags=["services"]
 )
 
+# Escritas em Service/Extra/OperationConfig/OperationStatusModel invalidam o catálogo do tenant
+register_catalog_invalidation()
+
 class PublicService(ServiceSchema):
     pass
 
@@ -48,35 +52,28 @@ async def create_service(
     
     return db_service
 
+def _build_public_catalog(db: Session, tenant_id: uuid.UUID) -> bytes:
+    """Serviços e extras ativos + modos de pagamento, já serializados em JSON"""
+    return PublicConfig.model_validate(
+        load_public_catalog(db, tenant_id), from_attributes=True
+    ).model_dump_json().encode()
+
 @router.get("/public", response_model=PublicConfig)
 async def get_public_services_and_extras(
     tenant_id: uuid.UUID,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
     Retorna serviços e extras ativos para exibição pública (totem).
+    Resposta em cache por tenant; com ``If-None-Match`` igual ao ETag retorna 304.
     """
-    services = db.query(Service).filter(
-        Service.tenant_id == tenant_id,
-        Service.is_active == True
-    ).all()
-
-    extras = db.query(Extra).filter(
-        Extra.tenant_id == tenant_id,
-        Extra.is_active == True,
-        Extra.stock > 0
-    ).all()
-
-    # Tentar obter payment_modes da OperationConfig mais recente
-    from models import OperationConfig  # import inline para evitar import circular no topo
-    op_cfg = db.query(OperationConfig).filter(OperationConfig.tenant_id == tenant_id).order_by(OperationConfig.created_at.desc()).first()
-    payment_modes = op_cfg.payment_modes if op_cfg else []
-
-    return {
-        "services": services,
-        "extras": extras,
-        "payment_modes": payment_modes or []
-    }
+    entry = catalog_cache.get_or_build(tenant_id, lambda: _build_public_catalog(db, tenant_id))
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
 
 @router.get("", response_model=ServiceList)
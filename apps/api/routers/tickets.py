@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import case
+from sqlalchemy import case, and_, func, or_
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 import logging
@@ -30,11 +30,12 @@ from schemas import (
     TicketServiceItem
 )
 from auth import get_current_operator
+from security import cpf_blind_index
 from services.websocket import websocket_manager
 from services.printer_service import printer_manager
 from database import get_db
 from constants import (
-    TicketStatus, can_transition, get_valid_transitions, 
+    TicketStatus, PaymentSessionStatus, can_transition, get_valid_transitions, 
     TICKET_STATE_CATEGORIES, TICKET_STATUS_DESCRIPTIONS, TICKET_STATUS_COLORS,
     QueueSortOrder, QueuePriority, get_status_info as get_status_info_func,
     get_waiting_time_status, PRIORITY_DESCRIPTIONS, PRIORITY_COLORS
@@ -44,12 +45,20 @@ from services.payment.factory import PaymentAdapterFactory
 from services.payment.terminal_manager import TerminalManager
 from services.notification_service import OperatorNotificationService as NotificationService
 from services.logging import setup_logging
+from services.metrics import record_ticket_created, record_ticket_status_changed
+from services.ticket_numbers import next_ticket_number
+from services.customer_profiles import upsert_customer
+from services.rollups import record_ticket_finished, get_rollup_summary
+from services.cache import TTLCache
+from services.catalog import catalog_cache
+from services.stock import InsufficientStockError, release_ticket_extras, reserve_extras, reserve_released_extras
+from services.payment_expiry import RESERVATION_PAYMENT_METHOD
+from config.settings import settings
 from models import Extra
 from models import Tenant
 from models import OperationConfig
 from models import TicketServiceProgress
 
-# Import do MercadoPagoAdapter será feito localmente quando necessário
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +66,12 @@ router = APIRouter(
     tags=["tickets"]
 )
 
+def _same_customer(ticket: Ticket):
+    """Filtro "mesmo cliente": blind index do CPF quando houver, senão o nome"""
+    if ticket.customer_cpf_hash:
+        return Ticket.customer_cpf_hash == ticket.customer_cpf_hash
+    return Ticket.customer_name == ticket.customer_name
+
 class CallTicketRequest(BaseModel):
     equipment_id: str
 
@@ -598,6 +613,8 @@ async def get_next_ticket(
     next_ticket.updated_at = datetime.now(timezone.utc)
     db.commit()
     db.refresh(next_ticket)
+    logger.info(f"🔄 Ticket #{next_ticket.ticket_number} status changed: {old_status} → {next_ticket.status}")
+    record_ticket_status_changed(next_ticket, [ts.service_id for ts in next_ticket.services])
     # Buscar informações do equipamento se houver
     equipment_name = None
     if next_ticket.equipment_id:
@@ -872,11 +889,18 @@ async def update_ticket_status(
     if status_update.operator_notes:
         ticket.operator_notes = status_update.operator_notes
     
+    # Rollups horários na mesma transação da finalização
+    if new_status in (TicketStatus.COMPLETED, TicketStatus.CANCELLED):
+        record_ticket_finished(db, ticket)
+    
     db.commit()
     db.refresh(ticket)
     
     logger.info(f"🔄 Ticket #{ticket.ticket_number} status changed: {old_status} → {new_status.value}")
     
+    if new_status in (TicketStatus.CALLED, TicketStatus.COMPLETED):
+        record_ticket_status_changed(ticket, [ts.service_id for ts in ticket.services])
+    
     # Notificar via WebSocket (se disponível)
     try:
         # Broadcast da atualização do ticket
@@ -1136,8 +1160,9 @@ async def call_ticket_service(
 
     # Atualizar status global do ticket para 'called' para refletir em "Meus Tickets",
     # mantendo independência por serviço nas filas (tratada no frontend por serviceProgress)
+    ticket_called = ticket.status != TicketStatus.CALLED.value
     try:
-        if ticket.status != TicketStatus.CALLED.value:
+        if ticket_called:
             ticket.status = TicketStatus.CALLED.value
             ticket.called_at = datetime.now(timezone.utc)
     except Exception:
@@ -1154,6 +1179,10 @@ async def call_ticket_service(
     db.refresh(equipment)
     db.refresh(ticket)
     
+    # Mesma métrica de espera do PATCH /status (só na primeira chamada do ticket)
+    if ticket_called:
+        record_ticket_status_changed(ticket, [ts.service_id for ts in ticket.services])
+    
     # Buscar informações do serviço
     service = db.query(Service).filter(Service.id == request.service_id).first()
     service_name = service.name if service else "Serviço"
@@ -1577,20 +1606,10 @@ async def cancel_ticket(
                 progress.equipment_id = None
                 liberated_equipments.append(equipment)
     
-    # Restaurar estoque dos extras se o ticket foi cancelado
-    if ticket and ticket.extras:
-        for ticket_extra in ticket.extras:
-            # Restaurar estoque na tabela extras
-            extra_model = db.query(Extra).filter(Extra.id == ticket_extra.extra_id).first()
-            if extra_model:
-                extra_model.stock += ticket_extra.quantity
-            
-            # Restaurar estoque na tabela operation_config_extras
-            operation_config_extra = db.query(OperationConfigExtra).filter(
-                OperationConfigExtra.extra_id == ticket_extra.extra_id
-            ).first()
-            if operation_config_extra:
-                operation_config_extra.stock += ticket_extra.quantity
+    # Devolver a reserva de estoque dos extras do ticket cancelado
+    released_extras = bool(ticket and ticket.extras)
+    if released_extras:
+        release_ticket_extras(db, [ticket.id])
         
     # Atualizar status do ticket
     status_update = TicketStatusUpdate(
@@ -1602,6 +1621,8 @@ async def cancel_ticket(
     
     # ✅ NOVO: Commit das alterações
     db.commit()
+    if released_extras:
+        catalog_cache.invalidate(ticket.tenant_id)
         
     # ✅ NOVO: Broadcast de atualização para todos os equipamentos liberados
     for equipment in liberated_equipments:
@@ -1687,72 +1708,101 @@ async def get_status_info():
         "workflow": "paid → printing → in_queue → called → in_progress → completed"
     }
 
-@router.get("/dashboard")
-async def get_dashboard_stats(
-    db: Session = Depends(get_db),
-    current_operator = Depends(get_current_operator)
-):
-    """Retorna estatísticas do dashboard para o operador"""
+# Dashboard é consultado em polling pelos painéis: resultado por tenant/janela vale alguns segundos
+DASHBOARD_CACHE_TTL_SECONDS = 5
+DASHBOARD_LIST_LIMIT = 200
+_dashboard_cache = TTLCache(ttl_seconds=DASHBOARD_CACHE_TTL_SECONDS, max_entries=512)
+
+ACTIVE_STATUSES = [
+    TicketStatus.IN_QUEUE.value,
+    TicketStatus.CALLED.value,
+    TicketStatus.IN_PROGRESS.value
+]
+PROBLEM_STATUSES = [
+    TicketStatus.PRINT_ERROR.value,
+    TicketStatus.EXPIRED.value
+]
+
+def _build_dashboard_stats(db: Session, tenant_id, start: datetime, end: datetime) -> dict:
+    """Monta o dashboard com consultas agregadas (sem materializar os tickets)"""
+    in_window = and_(
+        Ticket.tenant_id == tenant_id,
+        Ticket.created_at >= start,
+        Ticket.created_at < end
+    )
     
-    # Buscar todos os tickets do tenant
-    tickets = db.query(Ticket).filter(
-        Ticket.tenant_id == current_operator.tenant_id
-    ).all()
+    # Contagem total e por status em uma única linha (count(*) FILTER)
+    counts = db.query(
+        func.count().label("total"),
+        *[func.count().filter(Ticket.status == s.value).label(s.value) for s in TicketStatus]
+    ).filter(in_window).one()._asdict()
     
     # Estatísticas por status
     stats_by_status = {}
-    for status in TicketStatus:
-        count = len([t for t in tickets if t.status == status.value])
-        stats_by_status[status.value] = {
-            "count": count,
-            "description": TICKET_STATUS_DESCRIPTIONS.get(status, ""),
-            "color": TICKET_STATUS_COLORS.get(status, "#000000")
+    for ticket_status in TicketStatus:
+        stats_by_status[ticket_status.value] = {
+            "count": counts[ticket_status.value],
+            "description": TICKET_STATUS_DESCRIPTIONS.get(ticket_status, ""),
+            "color": TICKET_STATUS_COLORS.get(ticket_status, "#000000")
         }
     
     # Estatísticas por categoria
-    stats_by_category = {}
-    for category, statuses in TICKET_STATE_CATEGORIES.items():
-        count = len([t for t in tickets if TicketStatus(t.status) in statuses])
-        stats_by_category[category] = count
-    
-    # Tickets ativos (precisam de atenção)
-    active_tickets = [t for t in tickets if t.status in [
-        TicketStatus.IN_QUEUE.value,
-        TicketStatus.CALLED.value,
-        TicketStatus.IN_PROGRESS.value
-    ]]
-    
-    # Tickets com problemas
-    problem_tickets = [t for t in tickets if t.status in [
-        TicketStatus.PRINT_ERROR.value,
-        TicketStatus.EXPIRED.value
-    ]]
-    
-    # Estatísticas de hoje
-    today = datetime.utcnow().date()
-    today_tickets = [t for t in tickets if t.created_at.date() == today]
-    today_completed = [t for t in today_tickets if t.status == TicketStatus.COMPLETED.value]
-    
-    # Tempo médio de atendimento (tickets completados hoje)
-    avg_service_time = None
-    if today_completed:
-        service_times = []
-        for ticket in today_completed:
-            if ticket.started_at and ticket.completed_at:
-                service_time = (ticket.completed_at - ticket.started_at).total_seconds() / 60  # em minutos
-                service_times.append(service_time)
-        
-        if service_times:
-            avg_service_time = sum(service_times) / len(service_times)
-   
+    stats_by_category = {
+        category: sum(counts[s.value] for s in statuses)
+        for category, statuses in TICKET_STATE_CATEGORIES.items()
+    }
+    
+    # Fila ativa é estado atual (independe da janela): contagem e lista com o mesmo filtro
+    is_active = and_(
+        Ticket.tenant_id == tenant_id,
+        Ticket.status.in_(ACTIVE_STATUSES)
+    )
+    active_count = db.query(func.count()).select_from(Ticket).filter(is_active).scalar()
+    active_tickets = db.query(
+        Ticket.id, Ticket.ticket_number, Ticket.customer_name, Ticket.status, Ticket.created_at
+    ).filter(is_active).order_by(Ticket.created_at).limit(DASHBOARD_LIST_LIMIT).all()
+    
+    # Tickets com problemas dentro da janela
+    problem_tickets = db.query(
+        Ticket.id, Ticket.ticket_number, Ticket.customer_name, Ticket.status, Ticket.created_at
+    ).filter(
+        in_window,
+        Ticket.status.in_(PROBLEM_STATUSES)
+    ).order_by(Ticket.created_at.desc()).limit(DASHBOARD_LIST_LIMIT).all()
+    
+    # Concluídos e tempo médio de atendimento vêm dos rollups horários
+    rollup = get_rollup_summary(db, tenant_id, start, end)
+    avg_service_time = (
+        rollup["avg_service_seconds"] / 60  # em minutos
+        if rollup["avg_service_seconds"] is not None else None
+    )
+    
+    now = datetime.now(timezone.utc)
+    
+    # "today_*" são sempre de hoje (UTC), mesmo com outra janela
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today_end = today_start + timedelta(days=1)
+    if (start, end) == (today_start, today_end):
+        today_total, today_completed = counts["total"], rollup["completed"]
+    else:
+        today_total = db.query(func.count()).select_from(Ticket).filter(
+            Ticket.tenant_id == tenant_id,
+            Ticket.created_at >= today_start,
+            Ticket.created_at < today_end
+        ).scalar()
+        today_completed = get_rollup_summary(db, tenant_id, today_start, today_end)["completed"]
     
     return {
+        "window": {
+            "start": start.isoformat(),
+            "end": end.isoformat()
+        },
         "summary": {
-            "total_tickets": len(tickets),
-            "active_tickets": len(active_tickets),
-            "problem_tickets": len(problem_tickets),
-            "today_tickets": len(today_tickets),
-            "today_completed": len(today_completed),
+            "total_tickets": counts["total"],
+            "active_tickets": active_count,
+            "problem_tickets": sum(counts[s] for s in PROBLEM_STATUSES),
+            "today_tickets": today_total,
+            "today_completed": today_completed,
             "avg_service_time_minutes": round(avg_service_time, 1) if avg_service_time else None
         },
         "by_status": stats_by_status,
@@ -1764,7 +1814,7 @@ async def get_dashboard_stats(
                 "customer_name": t.customer_name,
                 "status": t.status,
                 "created_at": t.created_at.isoformat(),
-                "waiting_time_minutes": round((datetime.utcnow() - t.created_at).total_seconds() / 60, 1)
+                "waiting_time_minutes": round((now - t.created_at).total_seconds() / 60, 1)
             }
             for t in active_tickets
         ],
@@ -1779,29 +1829,58 @@ async def get_dashboard_stats(
             }
             for t in problem_tickets
         ]
-    } 
+    }
+
+@router.get("/dashboard")
+async def get_dashboard_stats(
+    start: Optional[datetime] = Query(None, description="Início da janela (padrão: hoje 00:00 UTC)"),
+    end: Optional[datetime] = Query(None, description="Fim da janela, exclusivo (padrão: start + 1 dia)"),
+    db: Session = Depends(get_db),
+    current_operator = Depends(get_current_operator)
+):
+    """Retorna estatísticas do dashboard para o operador.
+    
+    Contagens são da janela [start, end) (padrão: hoje); a fila ativa (lista e
+    ``summary.active_tickets``) é o estado atual e ``today_*`` são sempre de hoje."""
+    
+    if start is None:
+        start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if end is None:
+        end = start + timedelta(days=1)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="Janela inválida: 'end' deve ser maior que 'start'")
+    
+    tenant_id = current_operator.tenant_id
+    return _dashboard_cache.get_or_set(
+        (str(tenant_id), start.isoformat(), end.isoformat()),
+        lambda: _build_dashboard_stats(db, tenant_id, start, end)
+    )
 
 @router.post("", response_model=TicketOut)
 async def create_ticket(
     ticket_in: TicketCreate,
     db: Session = Depends(get_db)
 ):
-    # Debug: Log dos dados recebidos
     # Get next ticket number for this tenant
-    last_ticket = db.query(Ticket).filter(
-        Ticket.tenant_id == ticket_in.tenant_id
-    ).order_by(Ticket.ticket_number.desc()).first()
+    ticket_number = next_ticket_number(db, ticket_in.tenant_id)
     
-    ticket_number = 1 if not last_ticket else last_ticket.ticket_number + 1
+    # Cadastro deduplicado do cliente (por CPF)
+    cpf_hash = cpf_blind_index(ticket_in.customer_cpf)
+    customer_id = upsert_customer(
+        db, ticket_in.tenant_id, ticket_in.customer_name,
+        phone=ticket_in.customer_phone, cpf_hash=cpf_hash
+    )
     
     # Create ticket with PENDING_PAYMENT status (aguardando confirmação de pagamento)
     ticket = Ticket(
         tenant_id=ticket_in.tenant_id,
-        payment_session_id=None,  # Não há payment session neste fluxo
+        payment_session_id=None,  # Não há payment session neste fluxo (exceto reserva/consentimento abaixo)
         ticket_number=ticket_number,
         status=TicketStatus.PENDING_PAYMENT.value,  # Novo status inicial
         customer_name=ticket_in.customer_name,
         customer_cpf=ticket_in.customer_cpf,
+        customer_cpf_hash=cpf_hash,
+        customer_id=customer_id,
         customer_phone=ticket_in.customer_phone,
         consent_version=ticket_in.consent_version,
         print_attempts=0
@@ -1809,15 +1888,48 @@ async def create_ticket(
     db.add(ticket)
     db.flush()  # para garantir que ticket.id está disponível
 
-    # SALVAR ASSINATURA NA TABELA CONSENT (se fornecida)
-    if ticket_in.signature:
-        
-        # Criar um PaymentSession temporário para vincular o consentimento
-        # (já que Consent precisa de payment_session_id)
+    # Adicionar serviços associados
+    for service_item in ticket_in.services:
+        ticket_service = TicketService(
+            ticket_id=ticket.id,
+            service_id=service_item.service_id,
+            price=service_item.price
+        )
+        db.add(ticket_service)
+
+    # Adicionar extras
+    for extra in ticket_in.extras:
+        ticket_extra = TicketExtra(
+            ticket_id=ticket.id,
+            extra_id=extra.extra_id,
+            quantity=extra.quantity,
+            price=extra.price
+        )
+        db.add(ticket_extra)
+    
+    # Reservar estoque de todos os extras em um único UPDATE condicional
+    try:
+        reserved = reserve_extras(db, ticket_in.tenant_id, [(extra.extra_id, extra.quantity) for extra in ticket_in.extras])
+    except InsufficientStockError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Estoque insuficiente", "extra_ids": e.extra_ids}
+        )
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Sessão temporária: vincula o consentimento (Consent precisa de
+    # payment_session_id) e, se houve reserva de extras, segura o estoque até
+    # create-payment criar a sessão do gateway ou o operador confirmar o
+    # pagamento. Se vencer antes, o sweeper devolve o estoque (sem cancelar o ticket).
+    if ticket_in.signature or reserved:
         # Pegar o service_id do primeiro serviço do ticket
         service_id = ticket_in.services[0].service_id if ticket_in.services else None
         
         if not service_id:
+            db.rollback()
             raise HTTPException(
                 status_code=400, 
                 detail="Ticket deve ter pelo menos um serviço para criar payment session"
@@ -1826,80 +1938,46 @@ async def create_ticket(
         temp_payment_session = PaymentSession(
             tenant_id=ticket_in.tenant_id,
             service_id=service_id,  # Usar o service_id do primeiro serviço
+            ticket_id=ticket.id if reserved else None,
             customer_name=ticket_in.customer_name,
             customer_cpf=ticket_in.customer_cpf,
+            customer_cpf_hash=cpf_hash,
+            customer_id=customer_id,
             customer_phone=ticket_in.customer_phone,
             consent_version=ticket_in.consent_version,
-            payment_method="none",  # Temporário
+            payment_method=RESERVATION_PAYMENT_METHOD,  # Temporário
             amount=0.0,  # Será atualizado quando o pagamento for criado
             status="pending",
-            expires_at=datetime.utcnow() + timedelta(hours=1)
+            expires_at=datetime.utcnow() + (
+                timedelta(minutes=settings.STOCK_RESERVATION_MINUTES) if reserved else timedelta(hours=1)
+            )
         )
         db.add(temp_payment_session)
         db.flush()  # para garantir que temp_payment_session.id está disponível
         
-        # Criar o consentimento
-        consent = Consent(
-            tenant_id=ticket_in.tenant_id,
-            payment_session_id=temp_payment_session.id,
-            version=ticket_in.consent_version,
-            signature=ticket_in.signature,
-            ip_address=None,  # Pode ser adicionado se necessário
-            user_agent=None   # Pode ser adicionado se necessário
-        )
-        db.add(consent)
-        
         # Vincular o ticket ao payment session temporário
         ticket.payment_session_id = temp_payment_session.id
-        
-        logger.info(f"✅ Assinatura salva com sucesso para ticket {ticket.id}")
 
-    # Adicionar serviços associados
-    for service_item in ticket_in.services:
-        ticket_service = TicketService(
-            ticket_id=ticket.id,
-            service_id=service_item.service_id,
-            price=service_item.price
-        )
-        db.add(ticket_service)
+        # SALVAR ASSINATURA NA TABELA CONSENT (se fornecida)
+        if ticket_in.signature:
+            consent = Consent(
+                tenant_id=ticket_in.tenant_id,
+                payment_session_id=temp_payment_session.id,
+                customer_id=customer_id,
+                version=ticket_in.consent_version,
+                signature=ticket_in.signature,
+                ip_address=None,  # Pode ser adicionado se necessário
+                user_agent=None   # Pode ser adicionado se necessário
+            )
+            db.add(consent)
+            
+            logger.info(f"✅ Assinatura salva com sucesso para ticket {ticket.id}")
 
-    # Adicionar extras
-    for extra in ticket_in.extras:
-        ticket_extra = TicketExtra(
-            ticket_id=ticket.id,
-            extra_id=extra.extra_id,
-            quantity=extra.quantity,
-            price=extra.price
-        )
-        db.add(ticket_extra)
-    
     db.commit()
     db.refresh(ticket)
-    
-    # Decrementar estoque dos extras
-    for extra_item in ticket_in.extras:
-        
-        # Decrementar estoque na tabela extras
-        extra_model = db.query(Extra).filter(Extra.id == extra_item.extra_id).first()
-        if extra_model:
-            old_stock = extra_model.stock
-            extra_model.stock = max(0, extra_model.stock - extra_item.quantity)
-        else:
-            pass
-            logger.warning(f"⚠️ WARNING - Extra não encontrado na tabela extras: {extra_item.extra_id}")
-        
-        # Decrementar estoque na tabela operation_config_extras
-        operation_config_extra = db.query(OperationConfigExtra).filter(
-            OperationConfigExtra.extra_id == extra_item.extra_id
-        ).first()
-        if operation_config_extra:
-            old_config_stock = operation_config_extra.stock
-            operation_config_extra.stock = max(0, operation_config_extra.stock - extra_item.quantity)
-        else:
-            pass
-            logger.warning(f"⚠️ WARNING - Extra não encontrado na tabela operation_config_extras: {extra_item.extra_id}")
-    
-    db.commit()
+    if ticket_in.extras:
+        catalog_cache.invalidate(ticket_in.tenant_id)  # SQL direto não dispara os eventos do ORM
+    record_ticket_created(ticket, [item.service_id for item in ticket_in.services])
 
     # Broadcast da atualização da fila para todos os clientes
     try:
@@ -1919,10 +1997,6 @@ async def create_ticket(
     # Converter extras para schema de saída
     extras_out = []
     for te in ticket.extras:
-        # Buscar o extra para obter o nome
-        extra = db.query(Extra).filter(Extra.id == te.extra_id).first()
-        extra_name = extra.name if extra else f"Extra {te.extra_id}"
-        
         extras_out.append(TicketExtraOut(
             id=te.id,
             extra_id=te.extra_id,
@@ -1973,6 +2047,16 @@ async def create_payment_for_ticket(
     # Pegar o service_id do primeiro serviço do ticket
     service_id = ticket.services[0].service_id if ticket.services else None
 
+    # A nova sessão assume a reserva de estoque do ticket: as pendentes anteriores
+    # (ex.: a sessão de reserva criada com o ticket) são encerradas sem devolver estoque
+    db.query(PaymentSession).filter(
+        PaymentSession.ticket_id == ticket.id,
+        PaymentSession.status == PaymentSessionStatus.PENDING.value
+    ).update({
+        PaymentSession.status: PaymentSessionStatus.CANCELLED.value,
+        PaymentSession.updated_at: func.now()
+    }, synchronize_session=False)
+
     # Criar a sessão de pagamento
     payment_session = PaymentSession(
         tenant_id=ticket.tenant_id,
@@ -1980,6 +2064,8 @@ async def create_payment_for_ticket(
         ticket_id=ticket.id,
         customer_name=ticket.customer_name,
         customer_cpf=ticket.customer_cpf,
+        customer_cpf_hash=ticket.customer_cpf_hash,
+        customer_id=ticket.customer_id,
         customer_phone=ticket.customer_phone,
         consent_version=ticket.consent_version,
         payment_method=payload.payment_method,
@@ -2012,10 +2098,8 @@ async def create_payment_for_ticket(
                 logger.error(f"❌ Token de acesso do Mercado Pago não configurado")
                 raise HTTPException(status_code=400, detail="Token de acesso do Mercado Pago não configurado")
             
-            # Importar e usar o adaptador do Mercado Pago
-            from services.payment.adapters.mercadopago import MercadoPagoAdapter
-            
-            adapter = MercadoPagoAdapter(mercadopago_config)
+            # Adaptador do Mercado Pago em cache por tenant (reaproveita o pool HTTP)
+            adapter = PaymentAdapterFactory.get_adapter(ticket.tenant_id, "mercadopago", mercadopago_config)
             
             # Preparar metadados para a preferência
             metadata = {
@@ -2105,11 +2189,32 @@ async def confirm_payment(
     if ticket.payment_confirmed:
         return {"status": "already_confirmed"}
 
+    # Reserva de extras vencida (estoque devolvido pelo sweeper): reserva de novo
+    try:
+        rereserved = reserve_released_extras(db, ticket.tenant_id, ticket.id)
+    except InsufficientStockError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Estoque insuficiente", "extra_ids": e.extra_ids}
+        )
+
     # Confirmar pagamento e mover para fila
     ticket.payment_confirmed = True
     ticket.status = TicketStatus.IN_QUEUE.value
     ticket.queued_at = datetime.now(timezone.utc)
     ticket.updated_at = datetime.now(timezone.utc)
+
+    # Encerra a sessão temporária (reserva/consentimento) para ela não vencer depois
+    db.query(PaymentSession).filter(
+        or_(PaymentSession.id == ticket.payment_session_id, PaymentSession.ticket_id == ticket.id),
+        PaymentSession.payment_method == RESERVATION_PAYMENT_METHOD,
+        PaymentSession.status == PaymentSessionStatus.PENDING.value
+    ).update({
+        PaymentSession.status: PaymentSessionStatus.PAID.value,
+        PaymentSession.completed_at: func.now(),
+        PaymentSession.updated_at: func.now()
+    }, synchronize_session=False)
     
     # ✅ CORREÇÃO: Garantir que o ticket tenha serviços associados na tabela ticket_services
     if not ticket.services:
@@ -2139,6 +2244,8 @@ async def confirm_payment(
         
     
     db.commit()
+    if rereserved:
+        catalog_cache.invalidate(ticket.tenant_id)  # SQL direto não dispara os eventos do ORM
 
     logger.info(f"🎯 Ticket #{ticket.ticket_number} pagamento confirmado e movido para fila")
 
@@ -2394,7 +2501,7 @@ async def call_ticket_intelligent(
             # Buscar outros tickets do mesmo cliente que têm o MESMO SERVIÇO em andamento
             conflicting_services = db.query(TicketServiceProgress).join(TicketService).join(Ticket).filter(
                 Ticket.tenant_id == current_operator.tenant_id,
-                Ticket.customer_name == ticket.customer_name,
+                _same_customer(ticket),
                 Ticket.id != ticket_id,  # Excluir o ticket atual
                 TicketService.service_id == request.service_id,  # MESMO SERVIÇO
                 TicketServiceProgress.status == "in_progress"
@@ -2517,7 +2624,7 @@ async def check_ticket_conflicts(
     # Buscar outros tickets do mesmo cliente que têm o MESMO SERVIÇO em andamento
     customer_same_service_in_progress = db.query(TicketServiceProgress).join(TicketService).join(Ticket).filter(
         Ticket.tenant_id == current_operator.tenant_id,
-        Ticket.customer_name == ticket.customer_name,
+        _same_customer(ticket),
         Ticket.id != ticket_id,  # Excluir o ticket atual
         TicketService.service_id == service_id,  # ✅ MESMO SERVIÇO específico
         TicketServiceProgress.status == "in_progress"
@@ -0,0 +1,71 @@
+# 🖥️ Bootstrap do totem
+
+from fastapi import APIRouter, Depends, Header, Response, status
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+import hashlib
+import uuid
+from pydantic import BaseModel
+
+from database import get_db
+from models import OperationStatusModel
+from schemas import Service as ServiceSchema, Extra as ExtraSchema
+from services.catalog import (
+    catalog_cache,
+    etag_matches,
+    load_public_catalog,
+    register_catalog_invalidation,
+    serialize_operation_status,
+)
+
+router = APIRouter(
+    tags=["totem"]
+)
+
+# O bundle depende de Service/Extra/OperationConfig/OperationStatusModel
+register_catalog_invalidation()
+
+class TotemBootstrap(BaseModel):
+    version: str
+    tenant_id: uuid.UUID
+    services: List[ServiceSchema]
+    extras: List[ExtraSchema]
+    payment_modes: List[str] = []
+    operation_status: Dict[str, Any]
+
+
+def _build_bootstrap(db: Session, tenant_id: uuid.UUID) -> bytes:
+    """Catálogo + status da operação em um único JSON; ``version`` é o hash do conteúdo"""
+    status_obj = db.query(OperationStatusModel).filter(
+        OperationStatusModel.tenant_id == tenant_id
+    ).first()
+    bundle = TotemBootstrap.model_validate({
+        "version": "",
+        "tenant_id": tenant_id,
+        **load_public_catalog(db, tenant_id),
+        "operation_status": serialize_operation_status(status_obj),
+    }, from_attributes=True)
+
+    content = bundle.model_dump_json(exclude={"version"}).encode()
+    bundle.version = hashlib.sha256(content).hexdigest()[:16]
+    return bundle.model_dump_json().encode()
+
+
+@router.get("/bootstrap", response_model=TotemBootstrap)
+async def get_totem_bootstrap(
+    tenant_id: uuid.UUID,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Tudo que o totem precisa ao iniciar (serviços, extras com estoque, modos de
+    pagamento e status da operação) em uma única resposta versionada.
+    Montada uma vez por tenant e reaproveitada até a configuração mudar;
+    com ``If-None-Match`` igual ao ETag retorna 304.
+    """
+    entry = catalog_cache.get_or_build(tenant_id, lambda: _build_bootstrap(db, tenant_id), kind="bootstrap")
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
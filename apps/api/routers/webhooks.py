@@ -1,10 +1,10 @@
 # 🔐 Router de Webhooks com Validação Avançada
 
-from fastapi import APIRouter, Request, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, Request, HTTPException, Depends
 from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
 from typing import Dict, Any, Optional
 import logging
-import json
 from datetime import datetime
 
 from services.webhook_validator import (
@@ -13,6 +13,8 @@ from services.webhook_validator import (
     get_mercadopago_config, get_pagbank_config
 )
 from services.printer_service import printer_manager, ReceiptData, ReceiptType
+from services.webhook_inbox import enqueue_webhook, webhook_inbox_worker
+from database import get_db
 
 logger = logging.getLogger(__name__)
 
@@ -64,9 +66,9 @@ async def get_request_body(request: Request) -> bytes:
 @router.post("/sicredi")
 async def sicredi_webhook(
     request: Request,
-    background_tasks: BackgroundTasks,
     client_ip: str = Depends(get_client_ip),
-    body: bytes = Depends(get_request_body)
+    body: bytes = Depends(get_request_body),
+    db: Session = Depends(get_db)
 ):
     """🏦 Webhook do Sicredi"""
     return await process_webhook(
@@ -74,15 +76,15 @@ async def sicredi_webhook(
         request=request,
         body=body,
         client_ip=client_ip,
-        background_tasks=background_tasks
+        db=db
     )
 
 @router.post("/stone")
 async def stone_webhook(
     request: Request,
-    background_tasks: BackgroundTasks,
     client_ip: str = Depends(get_client_ip),
-    body: bytes = Depends(get_request_body)
+    body: bytes = Depends(get_request_body),
+    db: Session = Depends(get_db)
 ):
     """🪨 Webhook do Stone"""
     return await process_webhook(
@@ -90,15 +92,15 @@ async def stone_webhook(
         request=request,
         body=body,
         client_ip=client_ip,
-        background_tasks=background_tasks
+        db=db
     )
 
 @router.post("/pagseguro")
 async def pagseguro_webhook(
     request: Request,
-    background_tasks: BackgroundTasks,
     client_ip: str = Depends(get_client_ip),
-    body: bytes = Depends(get_request_body)
+    body: bytes = Depends(get_request_body),
+    db: Session = Depends(get_db)
 ):
     """💳 Webhook do PagSeguro"""
     return await process_webhook(
@@ -106,15 +108,15 @@ async def pagseguro_webhook(
         request=request,
         body=body,
         client_ip=client_ip,
-        background_tasks=background_tasks
+        db=db
     )
 
 @router.post("/mercadopago")
 async def mercadopago_webhook(
     request: Request,
-    background_tasks: BackgroundTasks,
     client_ip: str = Depends(get_client_ip),
-    body: bytes = Depends(get_request_body)
+    body: bytes = Depends(get_request_body),
+    db: Session = Depends(get_db)
 ):
     """💰 Webhook do MercadoPago"""
     return await process_webhook(
@@ -122,15 +124,15 @@ async def mercadopago_webhook(
         request=request,
         body=body,
         client_ip=client_ip,
-        background_tasks=background_tasks
+        db=db
     )
 
 @router.post("/pagbank")
 async def pagbank_webhook(
     request: Request,
-    background_tasks: BackgroundTasks,
     client_ip: str = Depends(get_client_ip),
-    body: bytes = Depends(get_request_body)
+    body: bytes = Depends(get_request_body),
+    db: Session = Depends(get_db)
 ):
     """🏧 Webhook do PagBank"""
     return await process_webhook(
@@ -138,7 +140,7 @@ async def pagbank_webhook(
         request=request,
         body=body,
         client_ip=client_ip,
-        background_tasks=background_tasks
+        db=db
     )
 
 # === Processamento de Webhook ===
@@ -148,7 +150,7 @@ async def process_webhook(
     request: Request,
     body: bytes,
     client_ip: str,
-    background_tasks: BackgroundTasks
+    db: Session
 ) -> JSONResponse:
     """🔍 Processa webhook com validação completa"""
     
@@ -186,13 +188,21 @@ async def process_webhook(
         # Log de sucesso
         logger.info(f"✅ Webhook validated: {provider.value} - {result.transaction_id}")
         
-        # Processa webhook em background
-        background_tasks.add_task(
-            process_webhook_background,
-            provider=provider,
-            result=result,
-            payload_data=json.loads(body.decode()) if body else {}
-        )
+        # Persiste na inbox e confirma; o processamento fica com os workers.
+        # Se a gravação falhar, o ID de replay é liberado para o provedor reenviar.
+        try:
+            entry = enqueue_webhook(
+                db,
+                provider=provider.value,
+                payload=result.payload_data or {},
+                transaction_id=result.transaction_id,
+                event_type=result.event_type,
+                event_timestamp=result.timestamp
+            )
+        except Exception:
+            db.rollback()
+            webhook_validator.release_replay(result)
+            raise
         
         # Retorna resposta de sucesso
         return JSONResponse(
@@ -200,6 +210,7 @@ async def process_webhook(
             content={
                 "status": "success",
                 "provider": provider.value,
+                "inbox_id": str(entry.id),
                 "transaction_id": result.transaction_id,
                 "event_type": result.event_type,
                 "timestamp": result.timestamp.isoformat() if result.timestamp else None
@@ -218,32 +229,34 @@ async def process_webhook(
             }
         )
 
-async def process_webhook_background(
-    provider: WebhookProvider,
-    result: WebhookValidationResult,
-    payload_data: Dict[str, Any]
-):
-    """🔄 Processa webhook em background"""
+async def process_inbox_entry(entry: Dict[str, Any]):
+    """🔄 Processa um webhook reivindicado da inbox (exceções geram retry)"""
     
-    try:
-        logger.info(f"🔄 Processing webhook: {provider.value} - {result.transaction_id}")
-        
-        if result.event_type in ["payment.approved", "transaction.approved"]:
-            await handle_payment_approved(provider, result, payload_data)
-        
-        elif result.event_type in ["payment.failed", "transaction.failed"]:
-            await handle_payment_failed(provider, result, payload_data)
-        
-        elif result.event_type in ["payment.cancelled", "transaction.cancelled"]:
-            await handle_payment_cancelled(provider, result, payload_data)
-        
-        else:
-            logger.info(f"ℹ️ Unhandled event type: {result.event_type}")
-        
-        logger.info(f"✅ Webhook processed: {provider.value} - {result.transaction_id}")
-        
-    except Exception as e:
-        logger.error(f"❌ Background processing error: {e}")
+    provider = WebhookProvider(entry["provider"])
+    result = WebhookValidationResult(
+        is_valid=True,
+        provider=provider,
+        transaction_id=entry["transaction_id"],
+        event_type=entry["event_type"],
+        timestamp=entry["event_timestamp"]
+    )
+    payload_data = entry["payload"] or {}
+    
+    logger.info(f"🔄 Processing webhook: {provider.value} - {result.transaction_id}")
+    
+    if result.event_type in ["payment.approved", "transaction.approved"]:
+        await handle_payment_approved(provider, result, payload_data)
+    
+    elif result.event_type in ["payment.failed", "transaction.failed"]:
+        await handle_payment_failed(provider, result, payload_data)
+    
+    elif result.event_type in ["payment.cancelled", "transaction.cancelled"]:
+        await handle_payment_cancelled(provider, result, payload_data)
+    
+    else:
+        logger.info(f"ℹ️ Unhandled event type: {result.event_type}")
+    
+    logger.info(f"✅ Webhook processed: {provider.value} - {result.transaction_id}")
 
 async def handle_payment_approved(
     provider: WebhookProvider,
@@ -334,10 +347,24 @@ async def webhook_status():
         "replay_protection": {
             "enabled": True,
             "max_age": webhook_validator._replay_protection.max_age,
-            "cached_webhooks": len(webhook_validator._replay_protection._processed_webhooks)
+            "cached_webhooks": len(webhook_validator._replay_protection),
+            "max_entries": webhook_validator._replay_protection.max_entries,
+            "shared_backend": type(webhook_validator._replay_protection.backend).__name__
+            if webhook_validator._replay_protection.backend else None
         }
     }
 
+# === Ciclo de vida da inbox ===
+
+@router.on_event("startup")
+async def start_webhook_inbox():
+    """Inicia o pool de workers da inbox junto com a aplicação"""
+    webhook_inbox_worker.start(process_inbox_entry)
+
+@router.on_event("shutdown")
+async def stop_webhook_inbox():
+    await webhook_inbox_worker.stop()
+
 # Inicializa validadores
 async def init_webhooks():
     """Inicializa sistema de webhooks"""
@@ -320,7 +320,8 @@ class PaymentForTicket(BaseModel):
     payment_method: str = Field(..., pattern=r"^(credit|debit|pix|tap|mercadopago)$")
 
 class PaymentSessionWithQR(PaymentSession):
-    qr_code: Optional[str] = None
+    qr_code: Optional[str] = None  # PNG (data URI) ou SVG
+    qr_matrix: Optional[List[str]] = None  # Linhas "0"/"1" para renderizar no totem
     preference_id: Optional[str] = None
 
 class TicketWithService(Ticket):
@@ -466,4 +467,18 @@ class Customer(BaseModel):
     phone: Optional[str] = None
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+class CustomerSearchPage(BaseModel):
+    items: List[Customer]
+    next_cursor: Optional[str] = None
+
+class CustomerVisit(BaseModel):
+    id: UUID
+    ticket_number: int
+    status: str
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -3,9 +3,14 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
 from cryptography.fernet import Fernet
+import hashlib
+import hmac
 import os
+import re
 from dotenv import load_dotenv
 
+from services.password_hasher import PasswordHasher
+
 load_dotenv()
 
 # JWT Settings
@@ -17,11 +22,28 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", Fernet.generate_key())
 fernet = Fernet(ENCRYPTION_KEY)
 
+# Blind index: chave própria (estável entre workers e deploys) para HMAC de CPFs.
+# Sem BLIND_INDEX_KEY, deriva uma chave do JWT_SECRET com separação de domínio.
+BLIND_INDEX_KEY = (
+    os.getenv("BLIND_INDEX_KEY")
+    or hmac.new(SECRET_KEY.encode(), b"cpf-blind-index", hashlib.sha256).hexdigest()
+).encode()
+
 # Password hashing
+# Mudar BCRYPT_ROUNDS faz as senhas serem regravadas no próximo login (verify_and_update)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 pwd_context = CryptContext(
     schemes=["bcrypt"], 
     deprecated="auto",
-    bcrypt__rounds=12
+    bcrypt__rounds=BCRYPT_ROUNDS
+)
+
+# Hash/verificação assíncronos (pool dedicado + limite de concorrência) para as rotas
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    max_concurrent=int(os.getenv("PASSWORD_HASH_MAX_CONCURRENT", "8")),
+    acquire_timeout=float(os.getenv("PASSWORD_HASH_ACQUIRE_TIMEOUT", "5"))
 )
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -46,12 +68,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 def verify_token(token: str) -> Optional[dict]:
     """Verify JWT token."""
     try:
-        print(f"🔍 Verificando token com SECRET_KEY: {SECRET_KEY[:20]}...")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        print(f"✅ Token decodificado com sucesso: {payload}")
-        return payload
-    except JWTError as e:
-        print(f"❌ Erro ao decodificar token: {str(e)}")
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
         return None
 
 def encrypt_data(data: str) -> str:
@@ -62,6 +80,19 @@ def decrypt_data(encrypted_data: str) -> str:
     """Decrypt sensitive data."""
     return fernet.decrypt(encrypted_data.encode()).decode()
 
+def cpf_blind_index(cpf: Optional[str]) -> Optional[str]:
+    """HMAC-SHA256 do CPF normalizado (só dígitos), para busca por igualdade.
+
+    O Fernet é aleatório e não permite comparar CPFs cifrados; o blind index
+    é determinístico, indexável e não revela o CPF sem a chave. Retorna
+    ``None`` se o valor não tiver 11 dígitos."""
+    if not cpf:
+        return None
+    digits = re.sub(r"[^0-9]", "", cpf)
+    if len(digits) != 11:
+        return None
+    return hmac.new(BLIND_INDEX_KEY, digits.encode(), hashlib.sha256).hexdigest()
+
 # Row Level Security (RLS) Policies
 def get_tenant_policy(tenant_id: str) -> str:
     """Generate RLS policy for tenant isolation."""
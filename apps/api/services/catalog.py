@@ -0,0 +1,169 @@
+# 🗂️ Catálogo público do totem em cache
+
+"""Cache por tenant da resposta de ``/services/public`` e de ``/totem/bootstrap``.
+
+O catálogo (serviços, extras, modos de pagamento e status da operação) muda
+poucas vezes por dia, mas todo totem o consulta em polling e na
+inicialização. A entrada guarda o JSON já serializado e um ETag (hash do conteúdo, então é o mesmo em todos os workers); o totem
+manda ``If-None-Match`` e recebe ``304`` enquanto nada mudou.
+
+Invalidação:
+
+- ``register_catalog_invalidation`` escuta insert/update/delete do ORM em
+  ``Service``, ``Extra``, ``OperationConfig`` e ``OperationStatusModel`` e
+  descarta o tenant (todas as variantes) após o commit (um rollback não
+  invalida nada; com savepoints vale o desfecho da transação externa);
+- escritas em massa/SQL direto chamam ``catalog_cache.invalidate`` após o
+  commit;
+- o TTL limita a defasagem entre workers.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from services.cache import TTLCache
+
+_DIRTY_KEY = "catalog_dirty_tenants"
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    body: bytes
+    etag: str
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara ``If-None-Match`` (lista, ``*`` ou ETags fracos ``W/``) com o ETag atual"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class CatalogCache:
+    """🗂️ Resposta serializada + ETag por chave (tenant)"""
+
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 1024):
+        self._cache = TTLCache(ttl_seconds=ttl_seconds, max_entries=max_entries)
+
+    @staticmethod
+    def _key(tenant_id: Any, kind: str):
+        return (str(tenant_id), kind)
+
+    def get(self, tenant_id: Any, kind: str = "public") -> Optional[CatalogEntry]:
+        return self._cache.get(self._key(tenant_id, kind))
+
+    def get_or_build(self, tenant_id: Any, build: Callable[[], bytes], kind: str = "public") -> CatalogEntry:
+        """Entrada em cache ou ``build()`` (JSON serializado) guardado com o ETag"""
+        entry = self.get(tenant_id, kind)
+        if entry is None:
+            body = build()
+            entry = CatalogEntry(body=body, etag=make_etag(body))
+            self._cache.set(self._key(tenant_id, kind), entry)
+        return entry
+
+    def invalidate(self, tenant_id: Any) -> None:
+        """Descarta todas as variantes em cache do tenant"""
+        self._cache.invalidate_prefix(str(tenant_id))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+# === Instância Global ===
+catalog_cache = CatalogCache(
+    ttl_seconds=float(os.getenv("CATALOG_CACHE_TTL", "60")),
+    max_entries=int(os.getenv("CATALOG_CACHE_SIZE", "1024"))
+)
+
+
+def load_public_catalog(db, tenant_id) -> Dict[str, Any]:
+    """Serviços e extras ativos (ORM) e modos de pagamento da OperationConfig mais recente"""
+    from models import Extra, OperationConfig, Service
+
+    services = db.query(Service).filter(
+        Service.tenant_id == tenant_id,
+        Service.is_active == True
+    ).all()
+
+    extras = db.query(Extra).filter(
+        Extra.tenant_id == tenant_id,
+        Extra.is_active == True,
+        Extra.stock > 0
+    ).all()
+
+    op_cfg = db.query(OperationConfig).filter(
+        OperationConfig.tenant_id == tenant_id
+    ).order_by(OperationConfig.created_at.desc()).first()
+    payment_modes = op_cfg.payment_modes if op_cfg else []
+
+    return {
+        "services": services,
+        "extras": extras,
+        "payment_modes": payment_modes or []
+    }
+
+
+def serialize_operation_status(status_obj) -> Dict[str, Any]:
+    """Status persistido da operação no formato de ``GET /operation``"""
+    if not status_obj:
+        return {"is_operating": False, "service_duration": 10, "equipment_counts": {}}
+    return {
+        "is_operating": status_obj.is_operating,
+        "service_duration": status_obj.service_duration,
+        "equipment_counts": status_obj.equipment_counts,
+        "operator_id": str(status_obj.operator_id) if status_obj.operator_id else None,
+        "operator_name": status_obj.operator_name,
+        "started_at": status_obj.started_at.isoformat() if status_obj.started_at else None,
+        "ended_at": status_obj.ended_at.isoformat() if status_obj.ended_at else None,
+        "updated_at": status_obj.updated_at.isoformat() if status_obj.updated_at else None,
+    }
+
+
+_registered = False
+
+
+def register_catalog_invalidation() -> None:
+    """Liga os eventos do ORM que invalidam o catálogo (idempotente)"""
+    global _registered
+    if _registered:
+        return
+    _registered = True
+
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session, object_session
+
+    from models import Extra, OperationConfig, OperationStatusModel, Service
+
+    def _mark_dirty(mapper, connection, target) -> None:
+        session = object_session(target)
+        if session is not None and target.tenant_id is not None:
+            session.info.setdefault(_DIRTY_KEY, set()).add(str(target.tenant_id))
+
+    for model in (Service, Extra, OperationConfig, OperationStatusModel):
+        for name in ("after_insert", "after_update", "after_delete"):
+            event.listen(model, name, _mark_dirty)
+
+    @event.listens_for(Session, "after_commit")
+    def _invalidate_after_commit(session) -> None:
+        if session.in_nested_transaction():
+            return  # RELEASE de savepoint: espera o commit da transação externa
+        for tenant_id in session.info.pop(_DIRTY_KEY, ()):
+            catalog_cache.invalidate(tenant_id)
+
+    @event.listens_for(Session, "after_soft_rollback")
+    def _discard_on_rollback(session, previous_transaction) -> None:
+        # Rollback de savepoint: a transação externa continua e ainda pode
+        # commitar outras escritas do tenant (invalidar a mais é inofensivo)
+        if previous_transaction.nested:
+            return
+        session.info.pop(_DIRTY_KEY, None)
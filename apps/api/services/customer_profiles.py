@@ -0,0 +1,83 @@
+"""Cadastro deduplicado de clientes (tabela ``customers``).
+
+Um cliente por tenant e CPF: a chave é o blind index do CPF normalizado
+(``security.cpf_blind_index``), então o CPF em si não é copiado para cá.
+Tickets, sessões de pagamento e consentimentos apontam para o cliente por
+``customer_id``; busca por CPF, último consentimento e histórico de visitas
+partem de ``(tenant_id, cpf_hash)`` e seguem por índice.
+
+``upsert_customer`` é chamado na criação de tickets/sessões, dentro da
+transação do chamador (``ON CONFLICT`` resolve criações concorrentes);
+``upsert_customers`` faz o mesmo para um lote (sincronização offline) em um
+único statement.
+"""
+
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import CustomerProfile
+from security import cpf_blind_index
+
+
+def customer_key(tenant_id, cpf_hash: str) -> Tuple[str, str]:
+    """Chave de ``upsert_customers`` (tenant como UUID textual minúsculo)"""
+    return (str(tenant_id).lower(), cpf_hash)
+
+
+def upsert_customer(
+    db: Session,
+    tenant_id,
+    name: Optional[str],
+    cpf: Optional[str] = None,
+    phone: Optional[str] = None,
+    cpf_hash: Optional[str] = None
+):
+    """Cria ou atualiza o cliente do CPF e retorna seu ``id`` (``None`` sem CPF válido)"""
+    ids = upsert_customers(db, [{
+        "tenant_id": tenant_id,
+        "cpf_hash": cpf_hash or cpf_blind_index(cpf),
+        "name": name,
+        "phone": phone,
+    }])
+    return next(iter(ids.values()), None)
+
+
+def upsert_customers(db: Session, customers: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, str], Any]:
+    """Versão em lote de ``upsert_customer``: um único ``INSERT ... ON CONFLICT``.
+
+    ``customers`` são dicts com ``tenant_id``, ``cpf_hash``, ``name`` e
+    ``phone``; entradas sem CPF ou nome são ignoradas. O mesmo cliente
+    repetido no lote vira uma linha só (vale o último nome e o último
+    telefone informado). Retorna o ``id`` por ``customer_key(tenant_id, cpf_hash)``."""
+    values: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for customer in customers:
+        if not customer.get("cpf_hash") or not customer.get("name"):
+            continue
+        key = customer_key(customer["tenant_id"], customer["cpf_hash"])
+        previous = values.get(key)
+        values[key] = {
+            "tenant_id": customer["tenant_id"],
+            "cpf_hash": customer["cpf_hash"],
+            "name": customer["name"],
+            "phone": customer.get("phone") or (previous["phone"] if previous else None),
+        }
+    if not values:
+        return {}
+
+    stmt = insert(CustomerProfile).values(list(values.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CustomerProfile.tenant_id, CustomerProfile.cpf_hash],
+        set_={
+            "name": stmt.excluded.name,
+            "phone": func.coalesce(stmt.excluded.phone, CustomerProfile.phone),
+            "last_seen_at": func.now(),
+            "updated_at": func.now(),
+        }
+    ).returning(CustomerProfile.id, CustomerProfile.tenant_id, CustomerProfile.cpf_hash)
+    return {
+        customer_key(tenant_id, cpf_hash): customer_id
+        for customer_id, tenant_id, cpf_hash in db.execute(stmt)
+    }
@@ -0,0 +1,157 @@
+# 🔎 Busca de clientes por nome
+
+"""Busca ranqueada de clientes pelo nome, com paginação por cursor.
+
+O nome é normalizado (sem acentos, minúsculo, espaços simples) na coluna
+``tickets.customer_name_search``. Os índices da migração 028 cobrem os dois
+modos de casamento:
+
+- prefixo (``LIKE 'termo%'``): B-tree ``text_pattern_ops`` por tenant;
+- trecho/semelhança (``LIKE '%termo%'`` e ``%``): GIN ``gin_trgm_ops``
+  (só quando a extensão ``pg_trgm`` está disponível no servidor).
+
+Cada nome distinto aparece uma vez, com os dados do ticket mais recente.
+Ordem: prefixos primeiro, depois maior semelhança, depois nome. O cursor
+carrega a chave da última linha (``rank``, ``score``, ``nome``) e a página
+seguinte continua dali (keyset), sem ``OFFSET``.
+"""
+
+import base64
+import json
+import logging
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+MAX_SEARCH_LIMIT = 50
+
+_trgm_available: Optional[bool] = None
+
+
+def normalize_search_text(value: Optional[str]) -> Optional[str]:
+    """Texto para busca: sem acentos, minúsculo e com espaços simples"""
+    if not value:
+        return None
+    folded = unicodedata.normalize("NFKD", value)
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return " ".join(folded.lower().split()) or None
+
+
+def escape_like(value: str) -> str:
+    """Escapa curingas do LIKE (``\\`` é o escape padrão do Postgres)"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def encode_cursor(rank: int, score: float, name_key: str) -> str:
+    raw = json.dumps([rank, round(score, 6), name_key], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, float, str]:
+    """Inverso de ``encode_cursor``; ``ValueError`` se o cursor for inválido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, score, name_key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(rank), float(score), str(name_key)
+    except Exception as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+
+
+def _has_trgm(db: Session) -> bool:
+    global _trgm_available
+    if _trgm_available is None:
+        _trgm_available = bool(db.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).scalar())
+        if not _trgm_available:
+            logger.warning("⚠️ pg_trgm indisponível: busca por nome sem semelhança (apenas trechos)")
+    return _trgm_available
+
+
+def _search_sql(trgm: bool, with_cursor: bool) -> str:
+    if trgm:
+        match = "(customer_name_search LIKE :contains OR customer_name_search % :term)"
+        score = "similarity(customer_name_search, :term)"
+    else:
+        match = "customer_name_search LIKE :contains"
+        score = "1.0 / strpos(customer_name_search, :term)"  # Quanto mais cedo o trecho, melhor
+
+    keyset = ""
+    if with_cursor:
+        keyset = "WHERE (rank, -score, name_key) > (:cursor_rank, -CAST(:cursor_score AS float8), :cursor_name)"
+
+    return f"""
+        WITH matches AS (
+            SELECT DISTINCT ON (customer_name_search)
+                   customer_name_search AS name_key,
+                   customer_name, customer_cpf, customer_phone,
+                   CASE WHEN customer_name_search LIKE :prefix THEN 0 ELSE 1 END AS rank,
+                   CAST(ROUND(CAST({score} AS numeric), 6) AS float8) AS score
+              FROM tickets
+             WHERE tenant_id = :tenant_id
+               AND {match}
+             ORDER BY customer_name_search, created_at DESC
+        )
+        SELECT * FROM matches
+        {keyset}
+        ORDER BY rank, score DESC, name_key
+        LIMIT :limit
+    """
+
+
+def _plain_cpf(cpf: Optional[str]) -> Optional[str]:
+    if cpf and len(cpf) > 14:
+        from security import decrypt_data
+        try:
+            return decrypt_data(cpf)
+        except Exception:
+            return None
+    return cpf
+
+
+def search_customers_by_name(
+    db: Session,
+    tenant_id: UUID,
+    term: str,
+    limit: int = 10,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """Retorna ``{"items": [{"name", "cpf", "phone"}], "next_cursor"}``"""
+    term_key = normalize_search_text(term)
+    if not term_key:
+        return {"items": [], "next_cursor": None}
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+
+    escaped = escape_like(term_key)
+    params: Dict[str, Any] = {
+        "tenant_id": str(tenant_id),
+        "term": term_key,
+        "prefix": f"{escaped}%",
+        "contains": f"%{escaped}%",
+        "limit": limit + 1,
+    }
+    if cursor:
+        params["cursor_rank"], params["cursor_score"], params["cursor_name"] = decode_cursor(cursor)
+
+    rows = db.execute(text(_search_sql(_has_trgm(db), bool(cursor))), params).mappings().all()
+
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(last["rank"], last["score"], last["name_key"])
+
+    items: List[Dict[str, Optional[str]]] = [
+        {
+            "name": row["customer_name"],
+            "cpf": _plain_cpf(row["customer_cpf"]),  # Só as linhas devolvidas são decifradas
+            "phone": row["customer_phone"],
+        }
+        for row in page
+    ]
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,13 +1,21 @@
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from models import Ticket, PaymentSession as Payment, Service
+from sqlalchemy import func, and_, distinct, select, cast, String
+from models import Ticket, PaymentSession as Payment, Service, TicketService
+from services.rollups import get_rollup_summary, get_daily_rollups
 from prometheus_client import Counter, Histogram, Gauge
 import logging
+import csv
+import io
+import zlib
 
 logger = logging.getLogger(__name__)
 
+# Exportação CSV: linhas buscadas por ida ao cursor e tamanho aproximado de cada bloco enviado
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
 # Métricas Prometheus
 TICKET_CREATED = Counter(
     'totem_ticket_created_total',
@@ -50,15 +58,82 @@ PAYMENT_PROCESSING_TIME = Histogram(
 QUEUE_LENGTH = Gauge(
     'totem_queue_length',
     'Current length of the queue',
-    ['service_id']
+    ['service_id'],
+    multiprocess_mode='livemostrecent'  # Valor global: vale a última escrita entre os workers vivos
 )
 
+def _seconds_between(start: Optional[datetime], end: Optional[datetime]) -> Optional[float]:
+    """Diferença em segundos tolerando mistura de datetimes naive (UTC) e aware"""
+    if start is None or end is None:
+        return None
+    if (start.tzinfo is None) != (end.tzinfo is None):
+        start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+        end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    return (end - start).total_seconds()
+
+
+# ------------------------------------------------------------------
+# Caminho de eventos: os contadores Prometheus só são incrementados aqui,
+# no momento em que o fato acontece (nunca ao consultar relatórios).
+# ------------------------------------------------------------------
+
+def record_ticket_created(ticket: Ticket, service_ids: Iterable[Any]) -> None:
+    """Registra a criação de um ticket (um incremento por serviço do ticket)"""
+    try:
+        for service_id in service_ids:
+            TICKET_CREATED.labels(service_id=str(service_id), status=ticket.status).inc()
+    except Exception as e:
+        logger.warning(f"Falha ao registrar métrica de ticket criado: {e}")
+
+
+def record_ticket_status_changed(ticket: Ticket, service_ids: Iterable[Any]) -> None:
+    """Registra chamadas (tempo de espera) e conclusões de tickets"""
+    try:
+        service_ids = [str(service_id) for service_id in service_ids]
+        if ticket.status == "called":
+            wait_time = _seconds_between(ticket.queued_at or ticket.created_at, ticket.called_at)
+            if wait_time is not None:
+                for service_id in service_ids:
+                    TICKET_WAIT_TIME.labels(service_id=service_id).observe(wait_time)
+        elif ticket.status == "completed":
+            for service_id in service_ids:
+                TICKET_COMPLETED.labels(service_id=service_id).inc()
+    except Exception as e:
+        logger.warning(f"Falha ao registrar métrica de status do ticket: {e}")
+
+
+def record_payment_processed(payment: Payment) -> None:
+    """Registra o resultado de um pagamento recebido do provedor"""
+    try:
+        PAYMENT_PROCESSED.labels(
+            status=payment.status,
+            payment_method=payment.payment_method
+        ).inc()
+
+        if payment.status == "paid":
+            PAYMENT_AMOUNT.labels(
+                status=payment.status,
+                payment_method=payment.payment_method
+            ).inc(float(payment.amount or 0))
+
+        processing_time = _seconds_between(payment.created_at, payment.completed_at or payment.updated_at)
+        if processing_time is not None:
+            PAYMENT_PROCESSING_TIME.labels(
+                payment_method=payment.payment_method
+            ).observe(processing_time)
+    except Exception as e:
+        logger.warning(f"Falha ao registrar métrica de pagamento: {e}")
+
+
 class MetricsService:
     def __init__(self, db: Session):
         self.db = db
 
     async def get_daily_metrics(self, tenant_id: str, date: datetime = None) -> Dict[str, Any]:
-        """Obtém métricas diárias para um tenant"""
+        """Obtém métricas diárias para um tenant.
+
+        Tudo é agregado no banco (três queries com GROUP BY/FILTER), então o
+        custo não depende de quantos tickets o tenant vendeu no dia."""
         if date is None:
             date = datetime.utcnow()
 
@@ -66,190 +141,205 @@ class MetricsService:
         end_date = start_date + timedelta(days=1)
 
         try:
-            # Métricas de tickets
-            tickets = self.db.query(Ticket).filter(
-                and_(
-                    Ticket.tenant_id == tenant_id,
-                    Ticket.created_at >= start_date,
-                    Ticket.created_at < end_date
-                )
-            ).all()
+            called = Ticket.status == "called"
+            service_seconds = func.extract("epoch", Ticket.updated_at - Ticket.created_at)
+            ticket_window = and_(
+                Ticket.tenant_id == tenant_id,
+                Ticket.created_at >= start_date,
+                Ticket.created_at < end_date
+            )
+
+            # Tickets por hora (distribuição, total e tempo de atendimento)
+            hour = func.date_trunc("hour", Ticket.created_at).label("hour")
+            hourly_rows = self.db.query(
+                hour,
+                func.count().label("total"),
+                func.count().filter(called).label("called"),
+                func.sum(service_seconds).filter(called).label("service_seconds")
+            ).filter(ticket_window).group_by(hour).all()
+
+            hourly_distribution = {str(h).zfill(2): 0 for h in range(24)}
+            total_tickets = 0
+            called_tickets = 0
+            total_service_seconds = 0.0
+            for row in hourly_rows:
+                hourly_distribution[str(row.hour.hour).zfill(2)] += row.total
+                total_tickets += row.total
+                called_tickets += row.called
+                total_service_seconds += float(row.service_seconds or 0)
+
+            avg_service_time = total_service_seconds / called_tickets if called_tickets else 0
+
+            # Tickets por serviço (um ticket pode ter vários serviços)
+            service_rows = self.db.query(
+                TicketService.service_id,
+                func.count(distinct(Ticket.id)).label("total"),
+                func.count(distinct(Ticket.id)).filter(Ticket.status == "paid").label("paid"),
+                func.count(distinct(Ticket.id)).filter(called).label("called"),
+                func.count(distinct(Ticket.id)).filter(Ticket.status == "cancelled").label("cancelled")
+            ).join(
+                TicketService, TicketService.ticket_id == Ticket.id
+            ).filter(ticket_window).group_by(TicketService.service_id).all()
+
+            service_metrics = {
+                str(row.service_id): {
+                    "total": row.total,
+                    "paid": row.paid,
+                    "called": row.called,
+                    "cancelled": row.cancelled
+                }
+                for row in service_rows
+            }
 
-            # Métricas de pagamentos
-            payments = self.db.query(Payment).filter(
+            # Pagamentos do dia em uma única linha
+            paid = Payment.status == "paid"
+            payment_row = self.db.query(
+                func.count().label("total"),
+                func.count().filter(paid).label("successful"),
+                func.count().filter(Payment.status == "failed").label("failed"),
+                func.coalesce(func.sum(Payment.amount).filter(paid), 0).label("total_amount"),
+                func.coalesce(func.avg(Payment.amount).filter(paid), 0).label("average_amount")
+            ).filter(
                 and_(
                     Payment.tenant_id == tenant_id,
                     Payment.created_at >= start_date,
                     Payment.created_at < end_date
                 )
-            ).all()
-
-            # Agrupa tickets por serviço
-            service_metrics = {}
-            for ticket in tickets:
-                if ticket.service_id not in service_metrics:
-                    service_metrics[ticket.service_id] = {
-                        "total": 0,
-                        "paid": 0,
-                        "called": 0,
-                        "cancelled": 0
-                    }
-                service_metrics[ticket.service_id]["total"] += 1
-                service_metrics[ticket.service_id][ticket.status] += 1
-
-                # Atualiza métricas Prometheus
-                TICKET_CREATED.labels(
-                    service_id=str(ticket.service_id),
-                    status=ticket.status
-                ).inc()
-
-                if ticket.status == "called":
-                    TICKET_COMPLETED.labels(
-                        service_id=str(ticket.service_id)
-                    ).inc()
-                    
-                    wait_time = (ticket.updated_at - ticket.created_at).total_seconds()
-                    TICKET_WAIT_TIME.labels(
-                        service_id=str(ticket.service_id)
-                    ).observe(wait_time)
-
-            # Calcula métricas de pagamento
+            ).one()
+
             payment_metrics = {
-                "total": len(payments),
-                "successful": len([p for p in payments if p.status == "paid"]),
-                "failed": len([p for p in payments if p.status == "failed"]),
-                "total_amount": sum(p.amount for p in payments if p.status == "paid"),
-                "average_amount": sum(p.amount for p in payments if p.status == "paid") / len([p for p in payments if p.status == "paid"]) if len([p for p in payments if p.status == "paid"]) > 0 else 0
+                "total": payment_row.total,
+                "successful": payment_row.successful,
+                "failed": payment_row.failed,
+                "total_amount": float(payment_row.total_amount),
+                "average_amount": float(payment_row.average_amount)
             }
 
-            # Atualiza métricas Prometheus de pagamento
-            for payment in payments:
-                PAYMENT_PROCESSED.labels(
-                    status=payment.status,
-                    payment_method=payment.payment_method
-                ).inc()
-
-                if payment.status == "paid":
-                    PAYMENT_AMOUNT.labels(
-                        status=payment.status,
-                        payment_method=payment.payment_method
-                    ).inc(payment.amount)
-
-                processing_time = (payment.updated_at - payment.created_at).total_seconds()
-                PAYMENT_PROCESSING_TIME.labels(
-                    payment_method=payment.payment_method
-                ).observe(processing_time)
-
-            # Calcula tempo médio de atendimento
-            completed_tickets = [t for t in tickets if t.status == "called"]
-            avg_service_time = sum(
-                (t.updated_at - t.created_at).total_seconds()
-                for t in completed_tickets
-            ) / len(completed_tickets) if completed_tickets else 0
-
-            # Atualiza métricas da fila
-            for service_id in service_metrics:
-                QUEUE_LENGTH.labels(
-                    service_id=str(service_id)
-                ).set(service_metrics[service_id]["total"] - service_metrics[service_id]["called"])
+            # Gauge é idempotente: pode ser ajustado a partir da consulta
+            for service_id, counts in service_metrics.items():
+                QUEUE_LENGTH.labels(service_id=service_id).set(counts["total"] - counts["called"])
 
             return {
                 "date": date.strftime("%Y-%m-%d"),
                 "tickets": {
-                    "total": len(tickets),
+                    "total": total_tickets,
                     "by_service": service_metrics,
                     "avg_service_time": avg_service_time
                 },
                 "payments": payment_metrics,
-                "hourly_distribution": self._get_hourly_distribution(tickets)
+                "hourly_distribution": hourly_distribution
             }
 
         except Exception as e:
             logger.error(f"Error getting daily metrics: {str(e)}", exc_info=e)
             raise
 
-    def _get_hourly_distribution(self, tickets: List[Ticket]) -> Dict[str, int]:
-        """Calcula distribuição de tickets por hora"""
-        distribution = {str(h).zfill(2): 0 for h in range(24)}
-        for ticket in tickets:
-            hour = ticket.created_at.hour
-            distribution[str(hour).zfill(2)] += 1
-        return distribution
-
     async def get_service_metrics(self, tenant_id: str, service_id: str, days: int = 30) -> Dict[str, Any]:
-        """Obtém métricas específicas de um serviço"""
+        """Obtém métricas específicas de um serviço a partir dos rollups horários.
+
+        Considera tickets finalizados (concluídos ou cancelados) na janela."""
         try:
             end_date = datetime.utcnow()
             start_date = end_date - timedelta(days=days)
 
-            tickets = self.db.query(Ticket).filter(
-                and_(
-                    Ticket.tenant_id == tenant_id,
-                    Ticket.service_id == service_id,
-                    Ticket.created_at >= start_date,
-                    Ticket.created_at < end_date
-                )
-            ).all()
+            summary = get_rollup_summary(self.db, tenant_id, start_date, end_date, service_id=service_id)
+            daily = get_daily_rollups(self.db, tenant_id, start_date, end_date, service_id=service_id)
+
+            completed = summary["completed"]
+            total_tickets = completed + summary["cancelled"]
 
             return {
-                "total_tickets": len(tickets),
-                "completion_rate": len([t for t in tickets if t.status == "called"]) / len(tickets) if tickets else 0,
-                "average_wait_time": sum(
-                    (t.updated_at - t.created_at).total_seconds()
-                    for t in tickets if t.status == "called"
-                ) / len([t for t in tickets if t.status == "called"]) if [t for t in tickets if t.status == "called"] else 0,
-                "daily_trend": self._get_daily_trend(tickets)
+                "total_tickets": total_tickets,
+                "completion_rate": completed / total_tickets if total_tickets else 0,
+                "average_wait_time": summary["avg_wait_seconds"] or 0,
+                "daily_trend": {
+                    date: day["completed"] + day["cancelled"]
+                    for date, day in daily.items()
+                }
             }
 
         except Exception as e:
             logger.error(f"Error getting service metrics: {str(e)}", exc_info=e)
             raise
 
-    def _get_daily_trend(self, tickets: List[Ticket]) -> Dict[str, int]:
-        """Calcula tendência diária de tickets"""
-        trend = {}
-        for ticket in tickets:
-            date = ticket.created_at.strftime("%Y-%m-%d")
-            if date not in trend:
-                trend[date] = 0
-            trend[date] += 1
-        return trend
-
-    async def export_metrics_csv(self, tenant_id: str, start_date: datetime, end_date: datetime) -> str:
-        """Exporta métricas em formato CSV"""
-        try:
-            tickets = self.db.query(Ticket).filter(
-                and_(
-                    Ticket.tenant_id == tenant_id,
-                    Ticket.created_at >= start_date,
-                    Ticket.created_at < end_date
-                )
-            ).all()
-
-            # Cria cabeçalho do CSV
-            csv_lines = [
-                "date,service_id,status,created_at,updated_at,customer_name,payment_status,payment_amount"
-            ]
-
-            # Adiciona linhas de dados
-            for ticket in tickets:
-                payment = self.db.query(Payment).filter(
-                    Payment.ticket_id == ticket.id
-                ).first()
-
-                csv_lines.append(
-                    f"{ticket.created_at.strftime('%Y-%m-%d')},"
-                    f"{ticket.service_id},"
-                    f"{ticket.status},"
-                    f"{ticket.created_at.isoformat()},"
-                    f"{ticket.updated_at.isoformat()},"
-                    f"{ticket.customer_name},"
-                    f"{payment.status if payment else 'N/A'},"
-                    f"{payment.amount if payment else '0.00'}"
-                )
+    def stream_metrics_csv(
+        self,
+        tenant_id: str,
+        start_date: datetime,
+        end_date: datetime,
+        compress: bool = False,
+        batch_size: int = EXPORT_BATCH_SIZE
+    ) -> Iterator[bytes]:
+        """Gera o CSV de métricas em blocos, lendo com cursor no servidor.
+
+        A memória fica limitada a ``batch_size`` linhas do cursor mais um bloco
+        de saída; com ``compress`` cada bloco sai já comprimido em gzip."""
+        service_ids = select(
+            func.string_agg(cast(TicketService.service_id, String), ";")
+        ).where(TicketService.ticket_id == Ticket.id).scalar_subquery()
+
+        # DISTINCT ON mantém um pagamento por ticket (o primeiro encontrado), como antes
+        rows = self.db.query(
+            Ticket.created_at,
+            service_ids.label("service_id"),
+            Ticket.status,
+            Ticket.updated_at,
+            Ticket.customer_name,
+            Payment.status.label("payment_status"),
+            Payment.amount.label("payment_amount")
+        ).outerjoin(
+            Payment, Payment.ticket_id == Ticket.id
+        ).filter(
+            and_(
+                Ticket.tenant_id == tenant_id,
+                Ticket.created_at >= start_date,
+                Ticket.created_at < end_date
+            )
+        ).distinct(
+            Ticket.created_at, Ticket.id
+        ).order_by(
+            Ticket.created_at, Ticket.id
+        ).yield_per(batch_size)
+
+        compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> formato gzip
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+
+        def flush() -> bytes:
+            data = buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+            return compressor.compress(data) if compressor else data
 
-            return "\n".join(csv_lines)
+        try:
+            writer.writerow([
+                "date", "service_id", "status", "created_at", "updated_at",
+                "customer_name", "payment_status", "payment_amount"
+            ])
+
+            for row in rows:
+                writer.writerow([
+                    row.created_at.strftime("%Y-%m-%d"),
+                    row.service_id or "",
+                    row.status,
+                    row.created_at.isoformat(),
+                    row.updated_at.isoformat() if row.updated_at else "",
+                    row.customer_name,
+                    row.payment_status or "N/A",
+                    row.payment_amount if row.payment_amount is not None else "0.00"
+                ])
+
+                if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                    chunk = flush()
+                    if chunk:
+                        yield chunk
+
+            chunk = flush()
+            if compressor:
+                chunk += compressor.flush()
+            if chunk:
+                yield chunk
 
         except Exception as e:
             logger.error(f"Error exporting metrics CSV: {str(e)}", exc_info=e)
-            raise 
\ No newline at end of file
+            raise
@@ -1,86 +1,191 @@
-from typing import Dict, List, Any, Optional
-import json
+from typing import Dict, List, Any, Optional, Callable
 import asyncio
+import uuid
+from collections import defaultdict
 from datetime import datetime
 import logging
 from models import Ticket, PaymentSession as Payment
-from database import get_db
+from security import cpf_blind_index
+from services.customer_profiles import customer_key, upsert_customers
+from services.offline_journal import OfflineJournal
+from sqlalchemy import Table
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
 
+# Tipo da entrada no journal -> tabela de destino
+_SYNC_TARGETS: Dict[str, Table] = {
+    "ticket": Ticket.__table__,
+    "payment": Payment.__table__,
+}
+
 class OfflineQueue:
-    def __init__(self):
-        self.tickets: List[Dict[str, Any]] = []
-        self.payments: List[Dict[str, Any]] = []
+    """Fila offline persistida em um journal SQLite local.
+
+    Entradas sobrevivem a reinícios: o que ficou pendente é sincronizado na
+    próxima execução de ``sync``. A sincronização grava lotes com
+    ``INSERT ... ON CONFLICT (id) DO NOTHING`` (cada entrada recebe o ``id``
+    ao entrar na fila), então reprocessar um lote já gravado é inofensivo."""
+
+    def __init__(
+        self,
+        journal_path: Optional[str] = None,
+        batch_size: int = 500,
+        session_factory: Optional[Callable[[], Session]] = None
+    ):
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self._session_factory = session_factory
+        self._journal: Optional[OfflineJournal] = None
         self.sync_in_progress = False
+        self.last_sync: Optional[datetime] = None
+
+    @property
+    def journal(self) -> OfflineJournal:
+        if self._journal is None:
+            if self.journal_path is None:
+                from config.settings import settings
+                self.journal_path = settings.OFFLINE_JOURNAL_PATH
+            self._journal = OfflineJournal(self.journal_path)
+        return self._journal
+
+    def _new_session(self) -> Session:
+        if self._session_factory is None:
+            from database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    async def _append(self, kind: str, data: Dict[str, Any]) -> None:
+        data.setdefault("id", str(uuid.uuid4()))
+        if data.get("customer_cpf") and not data.get("customer_cpf_hash"):
+            data["customer_cpf_hash"] = cpf_blind_index(data["customer_cpf"])
+        data["created_at"] = datetime.utcnow().isoformat()
+        data["status"] = "pending"
+        await asyncio.to_thread(self.journal.append, kind, data)
 
     async def add_ticket(self, ticket_data: Dict[str, Any]):
         """Adiciona um ticket à fila offline"""
-        ticket_data["created_at"] = datetime.utcnow().isoformat()
-        ticket_data["status"] = "pending"
-        self.tickets.append(ticket_data)
+        await self._append("ticket", ticket_data)
         logger.info(f"Ticket added to offline queue: {ticket_data['ticket_number']}")
 
     async def add_payment(self, payment_data: Dict[str, Any]):
         """Adiciona um pagamento à fila offline"""
-        payment_data["created_at"] = datetime.utcnow().isoformat()
-        payment_data["status"] = "pending"
-        self.payments.append(payment_data)
+        await self._append("payment", payment_data)
         logger.info(f"Payment added to offline queue: {payment_data['transaction_id']}")
 
-    async def sync(self, db: Session):
-        """Sincroniza a fila offline com o banco de dados"""
-        if self.sync_in_progress:
-            logger.warning("Sync already in progress")
-            return
+    @staticmethod
+    def _insert(db: Session, table: Table, rows: List[Dict[str, Any]]) -> None:
+        """INSERT em lote ignorando IDs já gravados (linhas agrupadas por conjunto de colunas)"""
+        customer_ids = {}
+        if "customer_id" in table.c:
+            # Clientes distintos do lote em um único upsert
+            customer_ids = upsert_customers(db, [
+                {
+                    "tenant_id": row.get("tenant_id"),
+                    "cpf_hash": row["customer_cpf_hash"],
+                    "name": row.get("customer_name"),
+                    "phone": row.get("customer_phone"),
+                }
+                for row in rows
+                if row.get("customer_cpf_hash") and not row.get("customer_id")
+            ])
 
-        self.sync_in_progress = True
-        try:
-            # Sincroniza tickets
-            for ticket_data in self.tickets[:]:
+        groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+        for row in rows:
+            if row.get("customer_cpf_hash") and not row.get("customer_id") and "customer_id" in table.c:
+                # Cópia: o lote pode ser refeito linha a linha após um rollback
+                row = {**row, "customer_id": customer_ids.get(customer_key(row.get("tenant_id"), row["customer_cpf_hash"]))}
+            groups[tuple(sorted(row))].append(row)
+        for group in groups.values():
+            db.execute(insert(table).on_conflict_do_nothing(index_elements=[table.c.id]), group)
+
+    def _sync_kind(self, db: Session, kind: str) -> int:
+        table = _SYNC_TARGETS[kind]
+        columns = set(table.c.keys())
+        synced = 0
+        after_seq = 0
+
+        while True:
+            batch = self.journal.pending(kind, self.batch_size, after_seq)
+            if not batch:
+                break
+            after_seq = batch[-1][0]
+            rows = [(seq, {key: value for key, value in payload.items() if key in columns}) for seq, payload in batch]
+
+            if len(rows) > 1:
                 try:
-                    ticket = Ticket(**ticket_data)
-                    db.add(ticket)
+                    self._insert(db, table, [row for _, row in rows])
                     db.commit()
-                    self.tickets.remove(ticket_data)
-                    logger.info(f"Ticket synced: {ticket.ticket_number}")
-                except Exception as e:
-                    logger.error(f"Error syncing ticket: {str(e)}")
+                    self.journal.ack([seq for seq, _ in rows])
+                    synced += len(rows)
                     continue
+                except Exception as e:
+                    db.rollback()
+                    logger.warning(f"Offline batch of {len(rows)} {kind}(s) failed, retrying row by row: {str(e)}")
 
-            # Sincroniza pagamentos
-            for payment_data in self.payments[:]:
+            # Isola as entradas problemáticas sem perder o restante do lote
+            for seq, row in rows:
                 try:
-                    payment = Payment(**payment_data)
-                    db.add(payment)
+                    self._insert(db, table, [row])
                     db.commit()
-                    self.payments.remove(payment_data)
-                    logger.info(f"Payment synced: {payment.transaction_id}")
+                    self.journal.ack([seq])
+                    synced += 1
                 except Exception as e:
-                    logger.error(f"Error syncing payment: {str(e)}")
-                    continue
+                    db.rollback()
+                    self.journal.mark_failed(seq, str(e))
+                    logger.error(f"Error syncing offline {kind} #{seq}: {str(e)}")
+
+        if synced:
+            logger.info(f"{synced} offline {kind}(s) synced")
+        return synced
+
+    def _sync_all(self, db: Optional[Session]) -> int:
+        owns_session = db is None
+        if owns_session:
+            db = self._new_session()
+        try:
+            return sum(self._sync_kind(db, kind) for kind in _SYNC_TARGETS)
+        finally:
+            if owns_session:
+                db.close()
+
+    async def sync(self, db: Optional[Session] = None) -> int:
+        """Sincroniza a fila offline com o banco de dados.
 
+        Sem ``db`` abre e fecha a própria sessão. Retorna quantas entradas foram gravadas."""
+        if self.sync_in_progress:
+            logger.warning("Sync already in progress")
+            return 0
+
+        self.sync_in_progress = True
+        try:
+            synced = await asyncio.to_thread(self._sync_all, db)
+            self.last_sync = datetime.utcnow()
+            return synced
         finally:
             self.sync_in_progress = False
 
     def get_queue_status(self) -> Dict[str, Any]:
         """Retorna o status atual da fila offline"""
+        counts = self.journal.counts()
         return {
-            "tickets_count": len(self.tickets),
-            "payments_count": len(self.payments),
+            "tickets_count": counts.get("ticket", {}).get("pending", 0),
+            "payments_count": counts.get("payment", {}).get("pending", 0),
+            "failed_count": sum(kind["failed"] for kind in counts.values()),
             "sync_in_progress": self.sync_in_progress,
-            "last_sync": datetime.utcnow().isoformat() if not self.sync_in_progress else None
+            "last_sync": self.last_sync.isoformat() if self.last_sync else None
         }
 
 class OfflineManager:
-    def __init__(self):
-        self.queue = OfflineQueue()
+    def __init__(self, queue: Optional[OfflineQueue] = None, sync_interval: float = 60.0):
+        self.queue = queue or OfflineQueue()
         self.is_online = True
+        self.sync_interval = sync_interval
         self._sync_task = None
 
     async def start_sync_task(self):
-        """Inicia a tarefa de sincronização periódica"""
+        """Inicia a tarefa de sincronização periódica (a primeira rodada reprocessa o journal)"""
         if self._sync_task is None:
             self._sync_task = asyncio.create_task(self._periodic_sync())
 
@@ -95,14 +200,13 @@ class OfflineManager:
         while True:
             try:
                 if self.is_online:
-                    db = next(get_db())
-                    await self.queue.sync(db)
-                await asyncio.sleep(60)  # Sincroniza a cada minuto
+                    await self.queue.sync()
+                await asyncio.sleep(self.sync_interval)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in periodic sync: {str(e)}")
-                await asyncio.sleep(60)
+                await asyncio.sleep(self.sync_interval)
 
     def set_online_status(self, status: bool):
         """Define o status de conexão do sistema"""
@@ -151,4 +255,4 @@ class OfflineManager:
             }
 
 # Instância global do gerenciador offline
-offline_manager = OfflineManager() 
\ No newline at end of file
+offline_manager = OfflineManager()
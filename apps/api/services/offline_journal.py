@@ -0,0 +1,94 @@
+"""Journal local (SQLite em modo WAL) da fila offline.
+
+Cada ticket/pagamento recebido sem conexão com o banco principal é gravado
+aqui antes de a requisição responder, então nada se perde se o processo cair.
+Na volta da conexão (ou no próximo start) as entradas são lidas em ordem de
+chegada, em lotes, e removidas só depois de confirmadas no Postgres.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS offline_entries (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT
+    )
+"""
+
+class OfflineJournal:
+    """Fila persistente por tipo (``ticket``, ``payment``...).
+
+    Entradas que falham ``max_attempts`` vezes deixam de ser entregues
+    (``failed``) e ficam no arquivo para análise manual."""
+
+    def __init__(self, path: str, max_attempts: int = 5):
+        self.path = path
+        self.max_attempts = max_attempts
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # Entrada confirmada sobrevive a queda de energia
+        self._conn.execute(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def append(self, kind: str, payload: Dict[str, Any]) -> int:
+        """Grava uma entrada (commit imediato) e retorna o número de sequência"""
+        data = json.dumps(payload, default=str)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO offline_entries (kind, payload, created_at) VALUES (?, ?, ?)",
+                (kind, data, datetime.utcnow().isoformat())
+            )
+            return cursor.lastrowid
+
+    def pending(self, kind: str, limit: int = 500, after_seq: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        """Próximo lote ``[(seq, payload)]`` em ordem de chegada"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, payload FROM offline_entries "
+                "WHERE kind = ? AND attempts < ? AND seq > ? ORDER BY seq LIMIT ?",
+                (kind, self.max_attempts, after_seq, limit)
+            ).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+
+    def ack(self, seqs: List[int]) -> None:
+        """Remove entradas já gravadas no banco principal"""
+        if not seqs:
+            return
+        placeholders = ", ".join("?" * len(seqs))
+        with self._lock:
+            self._conn.execute(f"DELETE FROM offline_entries WHERE seq IN ({placeholders})", list(seqs))
+
+    def mark_failed(self, seq: int, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE offline_entries SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                (error[:500], seq)
+            )
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """``{kind: {"pending": n, "failed": n}}``"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, SUM(attempts < ?), SUM(attempts >= ?) FROM offline_entries GROUP BY kind",
+                (self.max_attempts, self.max_attempts)
+            ).fetchall()
+        return {kind: {"pending": pending or 0, "failed": failed or 0} for kind, pending, failed in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
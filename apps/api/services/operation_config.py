@@ -0,0 +1,198 @@
+"""Gravação incremental da configuração de operação (``OperationConfig``).
+
+``apply_operation_config`` compara o que o painel enviou com o que está no
+banco e aplica só a diferença, na transação do chamador:
+
+- a configuração do tenant é travada (``FOR UPDATE``) e atualizada no lugar
+  (configurações antigas duplicadas são removidas);
+- serviços/equipamentos/extras da configuração: um
+  ``INSERT ... ON CONFLICT DO UPDATE`` em lote para as linhas novas ou
+  alteradas e um ``DELETE`` para as que saíram;
+- ``services.is_active``, ``extras.is_active``/``stock`` e
+  ``equipments.status`` do tenant só são atualizados onde o valor muda.
+
+Salvar a mesma configuração duas vezes não escreve nenhuma linha filha.
+Tudo é só ``flush``: o router grava o status da operação e faz o commit.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import (
+    Equipment,
+    EquipmentStatus,
+    Extra,
+    OperationConfig,
+    OperationConfigEquipment,
+    OperationConfigExtra,
+    OperationConfigService,
+    Service,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OperationConfigDiff:
+    """Quantidade de linhas escritas por tabela"""
+    created: bool = False
+    upserted: Dict[str, int] = field(default_factory=dict)
+    deleted: Dict[str, int] = field(default_factory=dict)
+    updated: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def changed(self) -> bool:
+        return self.created or any(self.upserted.values()) or any(self.deleted.values()) or any(self.updated.values())
+
+
+def _money(value: Any) -> Decimal:
+    return Decimal(str(value or 0)).quantize(Decimal("0.01"))
+
+
+def _sync_children(
+    db: Session,
+    model,
+    config_id,
+    key: str,
+    desired: Dict[Any, Dict[str, Any]],
+    diff: OperationConfigDiff
+) -> None:
+    """Upsert em lote das linhas novas/alteradas e delete das removidas"""
+    table = model.__table__
+    columns = [name for name in next(iter(desired.values()), {})]
+    current = {
+        row[key]: row
+        for row in db.execute(
+            select(table).where(table.c.operation_config_id == config_id)
+        ).mappings()
+    }
+
+    rows = [
+        {"operation_config_id": config_id, key: item_key, **values}
+        for item_key, values in desired.items()
+        if item_key not in current or any(
+            _money(current[item_key][name]) != _money(value) if name == "price" else current[item_key][name] != value
+            for name, value in values.items()
+        )
+    ]
+    if rows:
+        stmt = insert(table).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.operation_config_id, table.c[key]],
+            set_={name: stmt.excluded[name] for name in columns}
+        ))
+
+    removed = [item_key for item_key in current if item_key not in desired]
+    if removed:
+        db.execute(delete(table).where(
+            table.c.operation_config_id == config_id,
+            table.c[key].in_(removed)
+        ))
+
+    diff.upserted[table.name] = len(rows)
+    diff.deleted[table.name] = len(removed)
+
+
+def _update_changed(
+    db: Session,
+    model,
+    tenant_id,
+    columns: Iterable[str],
+    desired_for: Callable[[Any], Dict[str, Any]],
+    diff: OperationConfigDiff
+) -> None:
+    """UPDATE por PK (executemany) só das linhas do tenant cujo valor difere de ``desired_for(id)``"""
+    columns = list(columns)
+    current: List[Tuple] = db.execute(
+        select(model.id, *(getattr(model, name) for name in columns)).where(model.tenant_id == tenant_id)
+    ).all()
+
+    changes = []
+    for row in current:
+        values = desired_for(row[0])
+        changed = {name: values[name] for i, name in enumerate(columns) if name in values and row[i + 1] != values[name]}
+        if changed:
+            changes.append({"id": row[0], **changed})
+
+    # executemany exige o mesmo conjunto de colunas em cada grupo
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for change in changes:
+        groups.setdefault(tuple(sorted(change)), []).append(change)
+    for group in groups.values():
+        db.execute(update(model), group)
+
+    diff.updated[model.__tablename__] = len(changes)
+
+
+def apply_operation_config(db: Session, cfg) -> OperationConfigDiff:
+    """Aplica ``cfg`` (``OperationConfigIn``) como diferença sobre a configuração atual.
+
+    Só faz ``flush``: o chamador completa a transação com um único commit."""
+    diff = OperationConfigDiff()
+    configs = db.query(OperationConfig).filter(
+        OperationConfig.tenant_id == cfg.tenant_id
+    ).order_by(OperationConfig.created_at.desc()).with_for_update().all()
+
+    if configs:
+        op_cfg, stale = configs[0], configs[1:]
+        for old in stale:
+            db.delete(old)  # Cascata remove os filhos
+        if cfg.operator_id is not None:
+            op_cfg.operator_id = cfg.operator_id
+        op_cfg.payment_modes = cfg.payment_modes or []
+        op_cfg.payment_config = cfg.payment_config or {}
+    else:
+        op_cfg = OperationConfig(
+            tenant_id=cfg.tenant_id,
+            operator_id=cfg.operator_id,
+            payment_modes=cfg.payment_modes or [],
+            payment_config=cfg.payment_config or {},
+        )
+        db.add(op_cfg)
+        diff.created = True
+    db.flush()
+
+    services = {
+        s.service_id: {"active": s.active, "duration": s.duration, "price": s.price, "equipment_count": s.equipment_count}
+        for s in cfg.services
+    }
+    equipments = {
+        e.equipment_id: {"active": e.active, "quantity": e.quantity}
+        for e in cfg.equipments
+    }
+    extras = {
+        x.extra_id: {"active": x.active, "stock": x.stock, "price": x.price}
+        for x in cfg.extras
+    }
+    _sync_children(db, OperationConfigService, op_cfg.id, "service_id", services, diff)
+    _sync_children(db, OperationConfigEquipment, op_cfg.id, "equipment_id", equipments, diff)
+    _sync_children(db, OperationConfigExtra, op_cfg.id, "extra_id", extras, diff)
+
+    # Catálogo/equipamentos do tenant: ativo = presente e ativo na configuração
+    active_services = {key for key, values in services.items() if values["active"]}
+    active_equipments = {key for key, values in equipments.items() if values["active"]}
+
+    def extra_values(extra_id):
+        if extra_id not in extras:
+            return {"is_active": False}
+        # Estoque da tabela extras acompanha o da configuração
+        return {"is_active": bool(extras[extra_id]["active"]), "stock": extras[extra_id]["stock"]}
+
+    _update_changed(db, Service, cfg.tenant_id, ["is_active"],
+                    lambda service_id: {"is_active": service_id in active_services}, diff)
+    _update_changed(db, Extra, cfg.tenant_id, ["is_active", "stock"], extra_values, diff)
+    _update_changed(db, Equipment, cfg.tenant_id, ["status"], lambda equipment_id: {
+        "status": EquipmentStatus.online if equipment_id in active_equipments else EquipmentStatus.offline
+    }, diff)
+
+    logger.info(
+        f"⚙️ Diferença da configuração de operação do tenant {cfg.tenant_id} "
+        f"(upserts={diff.upserted}, deletes={diff.deleted}, updates={diff.updated})"
+    )
+    return diff
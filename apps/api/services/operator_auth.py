@@ -0,0 +1,71 @@
+"""Cache de autenticação de operadores.
+
+``get_current_operator`` (``auth.py``) valida o JWT a cada requisição, mas só
+vai ao banco na primeira vez que vê o token: o operador resolvido vira um
+``OperatorPrincipal`` imutável guardado por ``(operator_id, token)`` até o
+menor entre o TTL do cache e a expiração do token.
+
+Atualizar, desativar ou remover o operador (eventos do ORM registrados em
+``auth.py``) descarta todas as entradas dele no processo; nos demais workers
+o TTL limita a defasagem.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional
+from uuid import UUID
+
+from services.cache import TTLCache
+
+
+@dataclass(frozen=True)
+class OperatorPrincipal:
+    """Dados do operador autenticado usados pelas rotas (desacoplado da sessão do ORM)"""
+    id: UUID
+    tenant_id: UUID
+    name: str
+    email: str
+    is_active: bool = True
+
+    @classmethod
+    def from_operator(cls, operator: Any) -> "OperatorPrincipal":
+        return cls(
+            id=operator.id,
+            tenant_id=operator.tenant_id,
+            name=operator.name,
+            email=operator.email,
+            is_active=bool(operator.is_active),
+        )
+
+
+class OperatorAuthCache:
+    """🔐 Token verificado -> ``OperatorPrincipal`` (LRU com TTL)"""
+
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 4096):
+        self._cache = TTLCache(ttl_seconds=ttl_seconds, max_entries=max_entries)
+
+    @staticmethod
+    def _key(operator_id: Any, token: str) -> Hashable:
+        return (str(operator_id), token)
+
+    def get(self, operator_id: Any, token: str) -> Optional[OperatorPrincipal]:
+        return self._cache.get(self._key(operator_id, token))
+
+    def set(self, token: str, principal: OperatorPrincipal, expires_at: Optional[float] = None) -> None:
+        """Guarda o operador do token; ``expires_at`` (epoch, claim ``exp``) limita o TTL"""
+        ttl = self._cache.ttl_seconds
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+            if ttl <= 0:
+                return
+        self._cache.set(self._key(principal.id, token), principal, ttl_seconds=ttl)
+
+    def invalidate(self, operator_id: Any) -> None:
+        """Descarta todos os tokens em cache do operador"""
+        self._cache.invalidate_prefix(str(operator_id))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
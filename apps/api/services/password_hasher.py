@@ -0,0 +1,92 @@
+# 🔑 Hash de senhas fora do event loop
+
+"""Hash e verificação de senhas (bcrypt) em um pool de threads dedicado.
+
+Cada verificação com custo 12 leva centenas de milissegundos de CPU; rodando
+no event loop, uma leva de logins na troca de turno trava WebSockets e
+demais requisições. Aqui:
+
+- o trabalho vai para um ``ThreadPoolExecutor`` pequeno e exclusivo (o
+  bcrypt libera o GIL, então o loop segue atendendo);
+- um semáforo limita quantas operações podem estar em andamento/na fila;
+  quem espera mais que ``acquire_timeout`` recebe ``PasswordHasherBusyError``
+  (o login responde 503) em vez de empilhar trabalho indefinidamente;
+- ``verify`` devolve também o novo hash quando o custo configurado mudou
+  (``CryptContext.verify_and_update``), para o chamador regravar a senha.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple, TypeVar
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PasswordHasherBusyError(Exception):
+    """Muitas operações de senha simultâneas (proteção contra rajadas de login)"""
+
+
+class PasswordHasher:
+    """🔑 bcrypt em executor próprio com limite de concorrência"""
+
+    def __init__(
+        self,
+        context: CryptContext,
+        max_workers: int = 2,
+        max_concurrent: int = 8,
+        acquire_timeout: float = 5.0
+    ):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_concurrent = max_concurrent
+        self.acquire_timeout = acquire_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Password hasher saturado ({self.max_concurrent} operações em andamento)")
+            raise PasswordHasherBusyError("Muitas tentativas de login simultâneas")
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """``(válida, novo_hash)``; ``novo_hash`` só vem quando o hash salvo usa outro custo/esquema"""
+        if not hashed_password:
+            return False, None
+        return await self._run(self._verify_and_update, password, hashed_password)
+
+    def _verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        try:
+            return self.context.verify_and_update(password, hashed_password)
+        except ValueError:
+            return False, None  # Hash em formato desconhecido
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -55,6 +55,13 @@ class PaymentAdapter(ABC):
         """Verifica o status de uma transação."""
         pass
     
+    async def check_session_status(self, transaction_id: str, payment_session_id: str) -> str:
+        """Verifica o status da transação de uma sessão de pagamento.
+
+        Provedores que localizam o pagamento pela referência externa (o id da
+        sessão) sobrescrevem; por padrão consulta pelo ``transaction_id``."""
+        return await self.check_status(transaction_id)
+    
     @abstractmethod
     async def cancel_payment(self, transaction_id: str) -> bool:
         """Cancela uma transação pendente."""
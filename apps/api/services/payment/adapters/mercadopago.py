@@ -1,16 +1,47 @@
-import mercadopago
-from mercadopago.config import RequestOptions
 from typing import Dict, Optional, Any
 import logging
+import httpx
 from .base import PaymentAdapter
+from ...resilience import resilience_registry
 import os
 
 logger = logging.getLogger(__name__)
 
+MERCADOPAGO_API_URL = "https://api.mercadopago.com"
+
+# Pool de conexões por adaptador (keep-alive entre chamadas)
+DEFAULT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0)
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+# Timeouts por operação (segundos)
+CREATE_TIMEOUT = 15.0
+QUERY_TIMEOUT = 5.0
+
+class MercadoPagoUnavailableError(Exception):
+    """Resposta 5xx/429: conta como falha no circuit breaker e pode ser retentada"""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"Mercado Pago respondeu {response.status_code}")
+        self.response = response
+
+# Breaker, bulkhead e retry compartilhados por todas as instâncias do adaptador
+RESILIENCE_DEPENDENCY = "mercadopago"
+_PROVIDER_FAILURES = (httpx.TransportError, MercadoPagoUnavailableError)
+
+resilience_registry.configure(
+    RESILIENCE_DEPENDENCY,
+    circuit_breaker={"failure_threshold": 5, "reset_timeout": 30, "failure_exceptions": _PROVIDER_FAILURES},
+    bulkhead={"max_concurrent": DEFAULT_LIMITS.max_connections, "max_wait": 1.0},
+    retry={"max_attempts": 3, "delay": 0.2, "max_delay": 2.0, "deadline": 8.0, "exceptions": _PROVIDER_FAILURES}
+)
+
 class MercadoPagoAdapter(PaymentAdapter):
-    """💰 Adaptador para integração com Mercado Pago usando SDK Python oficial"""
+    """💰 Adaptador para integração com Mercado Pago via API REST (httpx assíncrono)
     
-    def __init__(self, config: Dict[str, Any]):
+    Usa um ``httpx.AsyncClient`` com pool e keep-alive, sem bloquear o event
+    loop. ``transport`` permite injetar um ``httpx.MockTransport`` em testes."""
+    
+    def __init__(self, config: Dict[str, Any], transport: Optional[httpx.AsyncBaseTransport] = None):
         """Inicializa o adaptador com as configurações do tenant."""
         super().__init__(config)  # Inicializa impressora
         
@@ -18,10 +49,62 @@ class MercadoPagoAdapter(PaymentAdapter):
         self.webhook_url = config.get("webhook_url")
         self.redirect_url_base = config.get("redirect_url_base")
         
-        # Inicializar SDK Python do Mercado Pago
-        self.sdk = mercadopago.SDK(self.access_token)
+        self.client = httpx.AsyncClient(
+            base_url=config.get("api_url", MERCADOPAGO_API_URL),
+            headers={
+                "Authorization": f"Bearer {self.access_token}",
+                "Content-Type": "application/json"
+            },
+            limits=DEFAULT_LIMITS,
+            timeout=DEFAULT_TIMEOUT,
+            transport=transport
+        )
         
-        logger.info(f"💰 MercadoPagoAdapter initialized with SDK Python")
+        logger.info(f"💰 MercadoPagoAdapter initialized")
+    
+    async def aclose(self) -> None:
+        """Fecha o pool de conexões"""
+        await self.client.aclose()
+    
+    async def __aenter__(self) -> "MercadoPagoAdapter":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        json: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = QUERY_TIMEOUT,
+        params: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Executa a chamada e devolve ``{"status", "response", "error"}`` (mesmo formato do SDK oficial).
+        
+        Passa pelo breaker/bulkhead do Mercado Pago; só operações idempotentes
+        (GET/PUT ou com ``X-Idempotency-Key``) são retentadas. Levanta
+        ``CircuitOpenError``/``BulkheadFullError`` quando a chamada é recusada."""
+        async def send() -> httpx.Response:
+            response = await self.client.request(method, path, json=json, headers=headers, timeout=timeout, params=params)
+            if response.status_code >= 500 or response.status_code == 429:
+                raise MercadoPagoUnavailableError(response)
+            return response
+        
+        idempotent = method in ("GET", "PUT") or bool(headers and "X-Idempotency-Key" in headers)
+        try:
+            response = await resilience_registry.call(RESILIENCE_DEPENDENCY, send, retry=idempotent)
+        except MercadoPagoUnavailableError as e:
+            response = e.response
+        
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"message": response.text}
+        
+        error = body.get("message") if isinstance(body, dict) and response.is_error else None
+        return {"status": response.status_code, "response": body, "error": error}
     
     async def create_payment_preference(self, amount: float, description: str, metadata: Dict) -> Dict:
         """Cria uma preferência de pagamento para o Checkout Pro usando a API de Preferências."""
@@ -83,9 +166,9 @@ class MercadoPagoAdapter(PaymentAdapter):
         }
         
         try:
-            # Usar API de Preferências do Mercado Pago via SDK Python
+            # Usar API de Preferências do Mercado Pago
             logger.info(f"🔍 Criando preferência com dados: {preference_data}")
-            result = self.sdk.preference().create(preference_data)
+            result = await self._request("POST", "/checkout/preferences", json=preference_data, timeout=CREATE_TIMEOUT)
             
             logger.info(f"🔍 Resultado da criação: {result}")
             
@@ -122,26 +205,61 @@ class MercadoPagoAdapter(PaymentAdapter):
         return await self.create_payment_preference(amount, description, metadata)
     
     async def check_status(self, transaction_id: str) -> str:
-        """Verifica o status de uma transação usando o ID de pagamento."""
+        """Verifica o status do pagamento de uma preferência.
+        
+        A preferência não tem status próprio: lê a ``external_reference`` dela
+        (o id da sessão) e busca o pagamento correspondente."""
         try:
-            result = self.sdk.preference().get(transaction_id)
+            result = await self._request("GET", f"/checkout/preferences/{transaction_id}")
             
             if result["status"] != 200:
-                logger.error(f"❌ Erro ao buscar pagamento: {result}")
-                raise Exception(f"Erro ao buscar pagamento: {result.get('error', 'Unknown error')}")
+                logger.error(f"❌ Erro ao buscar preferência: {result}")
+                raise Exception(f"Erro ao buscar preferência: {result.get('error', 'Unknown error')}")
             
-            payment = result["response"]
-            return payment["status"]
+            external_reference = result["response"].get("external_reference")
+            if not external_reference:
+                raise Exception(f"Preferência {transaction_id} sem external_reference")
+            return await self._search_payment_status(external_reference)
             
         except Exception as e:
             logger.error(f"❌ Erro ao verificar status do pagamento {transaction_id}: {e}")
             raise
     
+    async def check_session_status(self, transaction_id: str, payment_session_id: str) -> str:
+        """Busca o pagamento direto pela ``external_reference`` (id da sessão), sem ler a preferência."""
+        try:
+            return await self._search_payment_status(str(payment_session_id))
+        except Exception as e:
+            logger.error(f"❌ Erro ao verificar status do pagamento {transaction_id}: {e}")
+            raise
+    
+    async def _search_payment_status(self, external_reference: str) -> str:
+        """Status do pagamento de uma ``external_reference`` na API de pagamentos.
+        
+        Uma preferência pode ter várias tentativas (ex.: cartão recusado e
+        depois PIX aprovado): vale a aprovada, senão a mais recente. Sem
+        nenhuma tentativa ainda, devolve ``pending``."""
+        result = await self._request("GET", "/v1/payments/search", params={
+            "external_reference": external_reference,
+            "sort": "date_created",
+            "criteria": "desc"
+        })
+        
+        if result["status"] != 200:
+            logger.error(f"❌ Erro ao buscar pagamento: {result}")
+            raise Exception(f"Erro ao buscar pagamento: {result.get('error', 'Unknown error')}")
+        
+        payments = result["response"].get("results") or []
+        if not payments:
+            return "pending"
+        approved = next((payment for payment in payments if payment.get("status") == "approved"), None)
+        return (approved or payments[0])["status"]
+    
     async def cancel_payment(self, transaction_id: str) -> bool:
         """Cancela uma transação pendente."""
         try:
             cancel_data = {"status": "cancelled"}
-            result = self.sdk.preference().update(transaction_id, cancel_data)
+            result = await self._request("PUT", f"/checkout/preferences/{transaction_id}", json=cancel_data)
             
             if result["status"] != 200:
                 logger.error(f"❌ Erro ao cancelar pagamento: {result}")
@@ -155,9 +273,9 @@ class MercadoPagoAdapter(PaymentAdapter):
             return False
     
     async def _fetch_transaction_details(self, transaction_id: str) -> Dict[str, Any]:
-        """🔍 Busca detalhes completos da transação usando SDK Python"""
+        """🔍 Busca detalhes completos da transação"""
         try:
-            result = self.sdk.preference().get(transaction_id)
+            result = await self._request("GET", f"/checkout/preferences/{transaction_id}")
             
             if result["status"] != 200:
                 logger.error(f"❌ Erro ao buscar detalhes do pagamento: {result}")
@@ -182,7 +300,7 @@ class MercadoPagoAdapter(PaymentAdapter):
     async def get_payment_link(self, transaction_id: str) -> Optional[str]:
         """Obtém o link de pagamento para QR Code."""
         try:
-            result = self.sdk.preference().get(transaction_id)
+            result = await self._request("GET", f"/checkout/preferences/{transaction_id}")
             
             if result["status"] != 200:
                 logger.error(f"❌ Erro ao buscar pagamento: {result}")
@@ -200,9 +318,9 @@ class MercadoPagoAdapter(PaymentAdapter):
             logger.error(f"❌ Erro ao obter link de pagamento {transaction_id}: {e}")
             return None
     
-    def create_payment_with_card(self, amount: float, card_token: str, payment_method_id: str, 
-                                installments: int = 1, payer_email: str = None) -> Dict:
-        """Cria pagamento com cartão usando SDK Python."""
+    async def create_payment_with_card(self, amount: float, card_token: str, payment_method_id: str, 
+                                      installments: int = 1, payer_email: str = None) -> Dict:
+        """Cria pagamento com cartão (API de pagamentos)."""
         try:
             payment_data = {
                 "transaction_amount": amount,
@@ -215,13 +333,13 @@ class MercadoPagoAdapter(PaymentAdapter):
                 }
             }
             
-            # Configurar opções de request (opcional)
-            request_options = RequestOptions()
-            request_options.custom_headers = {
-                'x-idempotency-key': f'payment_{card_token}_{int(amount * 100)}'
-            }
-            
-            result = self.sdk.preference().create(payment_data, request_options)
+            # Chave de idempotência evita cobrança duplicada em retentativas
+            result = await self._request(
+                "POST", "/v1/payments",
+                json=payment_data,
+                headers={'X-Idempotency-Key': f'payment_{card_token}_{int(amount * 100)}'},
+                timeout=CREATE_TIMEOUT
+            )
             
             if result["status"] != 201:
                 logger.error(f"❌ Erro ao criar pagamento com cartão: {result}")
@@ -236,10 +354,10 @@ class MercadoPagoAdapter(PaymentAdapter):
             logger.error(f"❌ Erro ao criar pagamento com cartão: {e}")
             raise
     
-    def get_payment_methods(self) -> Dict:
+    async def get_payment_methods(self) -> Dict:
         """Obtém métodos de pagamento disponíveis."""
         try:
-            result = self.sdk.payment_methods().list()
+            result = await self._request("GET", "/v1/payment_methods")
             
             if result["status"] != 200:
                 logger.error(f"❌ Erro ao buscar métodos de pagamento: {result}")
@@ -1,4 +1,9 @@
-from typing import Dict, Type
+from typing import Dict, Tuple, Type
+import asyncio
+import hashlib
+import json
+import logging
+import threading
 from .adapters.base import PaymentAdapter
 from .adapters.sicredi import SicrediAdapter
 from .adapters.stone import StoneAdapter
@@ -6,9 +11,19 @@ from .adapters.pagseguro import PagSeguroAdapter
 from .adapters.mercadopago import MercadoPagoAdapter
 from .adapters.pagbank import PagBankAdapter
 
+logger = logging.getLogger(__name__)
+
+# Tempo para requisições em andamento terminarem antes de fechar um adaptador substituído
+RETIRED_ADAPTER_CLOSE_DELAY = 60.0
+
 class PaymentAdapterFactory:
-    """Factory para criar adaptadores de pagamento."""
-    
+    """Factory para criar adaptadores de pagamento.
+
+    ``get_adapter`` mantém uma instância por (tenant, provedor) e reaproveita o
+    pool HTTP entre requisições. A chave inclui um fingerprint da configuração:
+    se ``payment_config`` mudar (mesmo em outro worker), a próxima chamada
+    constrói um adaptador novo e o antigo é fechado após um intervalo."""
+
     _adapters: Dict[str, Type[PaymentAdapter]] = {
         "sicredi": SicrediAdapter,
         "stone": StoneAdapter,
@@ -16,17 +31,99 @@ class PaymentAdapterFactory:
         "mercadopago": MercadoPagoAdapter,
         "pagbank": PagBankAdapter
     }
-    
+
+    # (tenant_id, provedor) -> (fingerprint da config, adaptador)
+    _instances: Dict[Tuple[str, str], Tuple[str, PaymentAdapter]] = {}
+    _lock = threading.Lock()
+
     @classmethod
     def create_adapter(cls, adapter_name: str, config: Dict) -> PaymentAdapter:
         """Cria uma instância do adaptador especificado."""
         adapter_class = cls._adapters.get(adapter_name)
         if not adapter_class:
             raise ValueError(f"Adaptador não suportado: {adapter_name}")
-            
+
         return adapter_class(config)
-    
+
+    @staticmethod
+    def config_fingerprint(config: Dict) -> str:
+        """Hash estável da configuração (ordem das chaves não importa)"""
+        payload = json.dumps(config or {}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def get_adapter(cls, tenant_id, adapter_name: str, config: Dict) -> PaymentAdapter:
+        """Retorna o adaptador em cache do tenant, construindo-o na primeira chamada
+        ou quando a configuração mudou."""
+        key = (str(tenant_id), adapter_name)
+        fingerprint = cls.config_fingerprint(config)
+
+        cached = cls._instances.get(key)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        with cls._lock:
+            # Outra thread pode ter construído enquanto esperávamos o lock
+            cached = cls._instances.get(key)
+            if cached and cached[0] == fingerprint:
+                return cached[1]
+
+            adapter = cls.create_adapter(adapter_name, config)
+            cls._instances[key] = (fingerprint, adapter)
+
+        if cached:
+            logger.info(f"🔄 Configuração de {adapter_name} alterada para o tenant {tenant_id}, adaptador recriado")
+            cls._retire(cached[1])
+        return adapter
+
+    @classmethod
+    def invalidate_tenant(cls, tenant_id, adapter_name: str = None) -> int:
+        """Descarta os adaptadores em cache do tenant (ex.: após salvar ``payment_config``)"""
+        tenant_key = str(tenant_id)
+        with cls._lock:
+            keys = [
+                key for key in cls._instances
+                if key[0] == tenant_key and (adapter_name is None or key[1] == adapter_name)
+            ]
+            retired = [cls._instances.pop(key)[1] for key in keys]
+
+        for adapter in retired:
+            cls._retire(adapter)
+        return len(retired)
+
+    @classmethod
+    async def close_all(cls) -> None:
+        """Fecha todos os adaptadores em cache (shutdown da aplicação)"""
+        with cls._lock:
+            adapters = [adapter for _, adapter in cls._instances.values()]
+            cls._instances.clear()
+
+        for adapter in adapters:
+            aclose = cls._closer(adapter)
+            if aclose:
+                await aclose()
+
+    @staticmethod
+    def _closer(adapter: PaymentAdapter):
+        """``aclose`` do adaptador ou do seu ``httpx.AsyncClient``, se houver"""
+        aclose = getattr(adapter, "aclose", None)
+        if aclose is None and hasattr(adapter, "client"):
+            aclose = getattr(adapter.client, "aclose", None)
+        return aclose
+
+    @classmethod
+    def _retire(cls, adapter: PaymentAdapter) -> None:
+        """Agenda o fechamento do pool do adaptador substituído"""
+        aclose = cls._closer(adapter)
+        if aclose is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Fora do event loop: o GC libera o cliente
+        loop.call_later(RETIRED_ADAPTER_CLOSE_DELAY, lambda: loop.create_task(aclose()))
+
     @classmethod
     def register_adapter(cls, name: str, adapter_class: Type[PaymentAdapter]) -> None:
         """Registra um novo adaptador."""
-        cls._adapters[name] = adapter_class 
\ No newline at end of file
+        cls._adapters[name] = adapter_class
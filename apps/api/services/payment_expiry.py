@@ -0,0 +1,259 @@
+# ⏰ Expiração em lote de sessões de pagamento
+
+"""Varredura periódica das ``payment_sessions`` pendentes já vencidas.
+
+Cada lote é uma transação:
+
+1. ``UPDATE ... SET status = 'expired' ... RETURNING`` sobre até
+   ``batch_size`` sessões (``FOR UPDATE SKIP LOCKED``: workers concorrentes
+   nunca pegam a mesma sessão);
+2. tickets ``pending_payment`` ligados a sessões de gateway vencidas (e sem
+   outra sessão pendente válida) são cancelados e a reserva de estoque dos
+   extras deles é devolvida com um UPDATE agregado por extra
+   (``services.stock.release_ticket_extras``);
+3. sessões de reserva (``payment_method`` ``none``, criadas com o ticket
+   quando há extras) só devolvem o estoque: o ticket continua aguardando a
+   confirmação do operador (pagamento no balcão).
+
+``cancel_unpaid_tickets`` (passo 2) também é usado quando o webhook ou o
+poller recebem ``failed``/``cancelled``.
+
+Ao final da varredura cada tenant recebe um único evento
+``payment_sessions_expired`` com todas as sessões/tickets afetados.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services.catalog import catalog_cache
+from services.rollups import record_tickets_finished
+from services.stock import release_ticket_extras
+from services.websocket import websocket_manager
+
+logger = logging.getLogger(__name__)
+
+EXPIRED_CANCELLATION_REASON = "Pagamento expirado"
+
+# Sessão criada com o ticket só para segurar o estoque dos extras (sem gateway)
+RESERVATION_PAYMENT_METHOD = "none"
+
+# Status final da sessão -> motivo do cancelamento do ticket que ela reservava
+UNPAID_CANCELLATION_REASONS = {
+    "expired": EXPIRED_CANCELLATION_REASON,
+    "failed": "Pagamento recusado",
+    "cancelled": "Pagamento cancelado",
+}
+
+_EXPIRE_SQL = text("""
+    UPDATE payment_sessions
+       SET status = 'expired', updated_at = now()
+     WHERE id IN (
+           SELECT id
+             FROM payment_sessions
+            WHERE status = 'pending'
+              AND expires_at < now()
+            ORDER BY expires_at
+            LIMIT :batch_size
+              FOR UPDATE SKIP LOCKED
+     )
+ RETURNING id, tenant_id, ticket_id, payment_method
+""")
+
+_UNPAID_TICKETS_SQL = text("""
+    SELECT id
+      FROM tickets
+     WHERE id = ANY(CAST(:ticket_ids AS uuid[]))
+       AND status = 'pending_payment'
+""")
+
+_CANCEL_UNPAID_TICKETS_SQL = text("""
+    UPDATE tickets AS t
+       SET status = 'cancelled',
+           cancelled_at = now(),
+           updated_at = now(),
+           cancellation_reason = :reason
+     WHERE t.id = ANY(CAST(:ticket_ids AS uuid[]))
+       AND t.status = 'pending_payment'
+       AND NOT EXISTS (
+           SELECT 1
+             FROM payment_sessions AS ps
+            WHERE ps.ticket_id = t.id
+              AND ps.status = 'pending'
+              AND ps.expires_at > now()
+       )
+ RETURNING t.id
+""")
+
+
+def cancel_unpaid_tickets(db: Session, ticket_ids: List[Any], reason: str) -> List[str]:
+    """Cancela os tickets ``pending_payment`` sem outra sessão pendente válida e
+    devolve a reserva de estoque dos extras (só ``flush``; o chamador faz o commit
+    e invalida ``catalog_cache``). Retorna os ids cancelados."""
+    if not ticket_ids:
+        return []
+    db.flush()  # A sessão que acabou de sair de pending precisa estar no banco
+    cancelled = [
+        str(ticket_id) for ticket_id in db.execute(_CANCEL_UNPAID_TICKETS_SQL, {
+            "ticket_ids": [str(ticket_id) for ticket_id in ticket_ids],
+            "reason": reason
+        }).scalars()
+    ]
+    if cancelled:
+        release_ticket_extras(db, cancelled)
+        record_tickets_finished(db, cancelled)
+    return cancelled
+
+
+def release_expired_reservations(db: Session, ticket_ids: List[Any]) -> List[str]:
+    """Devolve o estoque dos tickets ainda ``pending_payment`` cuja sessão de
+    reserva venceu, sem cancelá-los (só ``flush``). Retorna os ids afetados."""
+    if not ticket_ids:
+        return []
+    unpaid = [
+        str(ticket_id) for ticket_id in db.execute(_UNPAID_TICKETS_SQL, {
+            "ticket_ids": [str(ticket_id) for ticket_id in ticket_ids]
+        }).scalars()
+    ]
+    release_ticket_extras(db, unpaid)
+    return unpaid
+
+
+def expire_payment_sessions_batch(db: Session, batch_size: int = 500) -> List[Dict[str, Any]]:
+    """Expira um lote de sessões vencidas (uma transação).
+
+    Retorna ``[{"id", "tenant_id", "ticket_id", "payment_method",
+    "ticket_cancelled", "stock_released"}]``."""
+    try:
+        rows = db.execute(_EXPIRE_SQL, {"batch_size": batch_size}).mappings().all()
+        expired = [dict(row) for row in rows]
+
+        reservations = [
+            row["ticket_id"] for row in expired
+            if row["ticket_id"] and row["payment_method"] == RESERVATION_PAYMENT_METHOD
+        ]
+        gateway = [
+            row["ticket_id"] for row in expired
+            if row["ticket_id"] and row["payment_method"] != RESERVATION_PAYMENT_METHOD
+        ]
+        released = set(release_expired_reservations(db, reservations))
+        cancelled = set(cancel_unpaid_tickets(db, gateway, EXPIRED_CANCELLATION_REASON))
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    for row in expired:
+        ticket_id = str(row["ticket_id"]) if row["ticket_id"] else None
+        row["ticket_cancelled"] = ticket_id in cancelled
+        row["stock_released"] = ticket_id in cancelled or ticket_id in released
+    return expired
+
+
+class PaymentExpirySweeper:
+    """⏰ Loop periódico de expiração de sessões de pagamento"""
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        interval: float = 30.0,
+        batch_size: int = 500
+    ):
+        self._session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def _new_session(self) -> Session:
+        if self._session_factory is None:
+            from database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._loop(), name="payment-expiry-sweeper")
+        logger.info(f"⏰ Payment expiry sweeper iniciado (intervalo {self.interval}s)")
+
+    async def stop(self) -> None:
+        if not self._running:
+            return
+        self._running = False
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self) -> None:
+        while self._running:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Payment expiry sweeper: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _expire_batch(self) -> List[Dict[str, Any]]:
+        db = self._new_session()
+        try:
+            return expire_payment_sessions_batch(db, self.batch_size)
+        finally:
+            db.close()
+
+    async def sweep(self) -> int:
+        """Expira todas as sessões vencidas em lotes. Retorna quantas foram expiradas."""
+        by_tenant: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: {"session_ids": [], "ticket_ids": []})
+        stock_released = set()
+        total = 0
+
+        while True:
+            expired = await asyncio.to_thread(self._expire_batch)
+            for row in expired:
+                tenant = by_tenant[str(row["tenant_id"])]
+                tenant["session_ids"].append(str(row["id"]))
+                if row["ticket_cancelled"]:
+                    tenant["ticket_ids"].append(str(row["ticket_id"]))
+                if row["stock_released"]:
+                    stock_released.add(str(row["tenant_id"]))
+            total += len(expired)
+            if len(expired) < self.batch_size:
+                break
+
+        for tenant_id, payload in by_tenant.items():
+            if tenant_id in stock_released:
+                catalog_cache.invalidate(tenant_id)  # Estoque de extras devolvido
+            try:
+                await websocket_manager.broadcast_to_tenant(tenant_id, {
+                    "type": "payment_sessions_expired",
+                    "data": {**payload, "count": len(payload["session_ids"])}
+                })
+            except Exception as e:
+                logger.error(f"❌ Erro ao notificar expiração de sessões do tenant {tenant_id}: {e}")
+
+        if total:
+            logger.info(f"⏰ {total} sessão(ões) de pagamento expirada(s) em {len(by_tenant)} tenant(s)")
+        return total
+
+
+def _build_sweeper() -> PaymentExpirySweeper:
+    from config.settings import settings
+    return PaymentExpirySweeper(
+        interval=settings.PAYMENT_EXPIRY_SWEEP_INTERVAL,
+        batch_size=settings.PAYMENT_EXPIRY_BATCH_SIZE
+    )
+
+
+# === Instância Global ===
+payment_expiry_sweeper = _build_sweeper()
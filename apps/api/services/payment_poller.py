@@ -0,0 +1,324 @@
+# 🔄 Consulta periódica em lote do status de sessões de pagamento pendentes
+
+"""Rede de segurança para webhooks perdidos ou atrasados.
+
+A cada ciclo o poller reivindica um lote de ``payment_sessions`` pendentes
+(com ``transaction_id`` e ainda não expiradas, as consultadas há mais tempo
+primeiro, carimbando ``last_polled_at``), agrupa por provedor e consulta o
+status de cada transação com concorrência limitada e respeitando um limite
+de requisições por segundo por provedor. Todas as mudanças do lote são
+gravadas com um único ``UPDATE ... FROM (VALUES ...)`` condicionado a
+``status = 'pending'`` (uma sessão já resolvida por webhook não é tocada);
+sessões pagas geram/confirmam o ticket na mesma transação e as recusadas ou
+canceladas cancelam o ticket ``pending_payment`` e devolvem a reserva de
+estoque (``cancel_unpaid_tickets``). Depois do commit
+o tenant recebe um ``payment_update`` por sessão alterada.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from constants import PaymentSessionStatus
+from models import OperationConfig, PaymentSession, Ticket
+from services.catalog import catalog_cache
+from services.metrics import record_payment_processed, record_ticket_created
+from services.payment_expiry import UNPAID_CANCELLATION_REASONS, cancel_unpaid_tickets
+from services.payment.factory import PaymentAdapterFactory
+from services.payment_status import confirm_paid_session, normalize_provider_status
+from services.websocket import websocket_manager
+
+logger = logging.getLogger(__name__)
+
+# payment_method da sessão -> chave em OperationConfig.payment_config.
+# Só o Mercado Pago grava transaction_id em sessões (tickets/create-payment);
+# terminais (Sicredi/Stone/PagSeguro) confirmam no próprio fluxo do terminal.
+PROVIDER_CONFIG_KEYS = {
+    "mercadopago": "mercado_pago",
+}
+
+# Reivindica o lote e carimba last_polled_at na mesma instrução: o próximo
+# ciclo começa pelas sessões consultadas há mais tempo (ou nunca), então
+# nenhuma pendente fica de fora quando há mais que batch_size; SKIP LOCKED
+# evita que workers concorrentes consultem a mesma sessão.
+_CLAIM_PENDING_SQL = text("""
+    UPDATE payment_sessions
+       SET last_polled_at = now()
+     WHERE id IN (
+           SELECT id
+             FROM payment_sessions
+            WHERE status = 'pending'
+              AND transaction_id IS NOT NULL
+              AND payment_method = ANY(:providers)
+              AND expires_at > now()
+              AND created_at < now() - make_interval(secs => :min_age_seconds)
+            ORDER BY last_polled_at NULLS FIRST, created_at
+            LIMIT :batch_size
+              FOR UPDATE SKIP LOCKED
+     )
+ RETURNING id, tenant_id, payment_method, transaction_id
+""")
+
+
+class _RateLimiter:
+    """Espaça as chamadas a um provedor em no máximo ``rate`` por segundo"""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self._interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class PaymentStatusPoller:
+    """🔄 Poller em lote de sessões de pagamento pendentes"""
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        interval: float = 15.0,
+        batch_size: int = 200,
+        concurrency: int = 8,
+        rate_limit: float = 5.0,
+        provider_rate_limits: Optional[Dict[str, float]] = None,
+        min_age_seconds: int = 20
+    ):
+        self._session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.provider_rate_limits = provider_rate_limits or {}
+        self.min_age_seconds = min_age_seconds
+
+        self._limiters: Dict[str, _RateLimiter] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def _new_session(self) -> Session:
+        if self._session_factory is None:
+            from database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def _limiter(self, provider: str) -> _RateLimiter:
+        if provider not in self._limiters:
+            self._limiters[provider] = _RateLimiter(self.provider_rate_limits.get(provider, self.rate_limit))
+        return self._limiters[provider]
+
+    def start(self) -> None:
+        """Inicia o loop de polling no event loop atual"""
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._loop(), name="payment-status-poller")
+        logger.info(f"🔄 Payment status poller iniciado (intervalo {self.interval}s)")
+
+    async def stop(self) -> None:
+        if not self._running:
+            return
+        self._running = False
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("🔄 Payment status poller parado")
+
+    async def _loop(self) -> None:
+        while self._running:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Payment status poller: {e}")
+            await asyncio.sleep(self.interval)
+
+    # --- Operações de banco (síncronas, executadas em threads) ---
+
+    def _load_pending(self) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """Reivindica um lote de sessões pendentes + payment_config mais recente de cada tenant"""
+        db = self._new_session()
+        try:
+            rows = db.execute(_CLAIM_PENDING_SQL, {
+                "providers": list(PROVIDER_CONFIG_KEYS),
+                "min_age_seconds": self.min_age_seconds,
+                "batch_size": self.batch_size
+            }).mappings().all()
+            sessions = [dict(row) for row in rows]
+
+            tenant_ids = {row["tenant_id"] for row in sessions}
+            configs = {}
+            if tenant_ids:
+                latest = db.query(OperationConfig.tenant_id, OperationConfig.payment_config).filter(
+                    OperationConfig.tenant_id.in_(tenant_ids)
+                ).order_by(
+                    OperationConfig.tenant_id, OperationConfig.created_at.desc()
+                ).distinct(OperationConfig.tenant_id).all()
+                configs = {str(tenant_id): config or {} for tenant_id, config in latest}
+            db.commit()
+            return sessions, configs
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _apply_changes(self, changes: List[Tuple[Any, str]]) -> List[Dict[str, Any]]:
+        """Grava todas as mudanças do lote em uma transação e devolve as sessões alteradas"""
+        values = ", ".join(f"(CAST(:id_{i} AS uuid), :status_{i})" for i in range(len(changes)))
+        params = {}
+        for i, (session_id, new_status) in enumerate(changes):
+            params[f"id_{i}"] = str(session_id)
+            params[f"status_{i}"] = new_status
+
+        db = self._new_session()
+        try:
+            updated = db.execute(text(f"""
+                UPDATE payment_sessions AS ps
+                   SET status = v.status,
+                       updated_at = now(),
+                       completed_at = CASE WHEN v.status = 'paid' THEN now() ELSE ps.completed_at END
+                  FROM (VALUES {values}) AS v(id, status)
+                 WHERE ps.id = v.id
+                   AND ps.status = 'pending'
+             RETURNING ps.id
+            """), params).scalars().all()
+
+            sessions = db.query(PaymentSession).filter(PaymentSession.id.in_(updated)).all() if updated else []
+
+            results = []
+            unpaid: Dict[str, List[Any]] = defaultdict(list)
+            for payment_session in sessions:
+                ticket, created = None, False
+                if payment_session.status == PaymentSessionStatus.PAID.value:
+                    ticket, created = confirm_paid_session(payment_session, db)
+                elif payment_session.ticket_id and payment_session.status in UNPAID_CANCELLATION_REASONS:
+                    unpaid[payment_session.status].append(payment_session.ticket_id)
+                results.append({"session": payment_session, "ticket": ticket, "created": created})
+
+            # Sessões recusadas/canceladas devolvem a reserva de estoque do ticket
+            released = set()
+            for session_status, ticket_ids in unpaid.items():
+                released.update(cancel_unpaid_tickets(db, ticket_ids, UNPAID_CANCELLATION_REASONS[session_status]))
+            for result in results:
+                result["released"] = str(result["session"].ticket_id) in released
+
+            db.commit()
+            # Carrega o que as notificações usam antes de desanexar os objetos da sessão
+            for result in results:
+                db.refresh(result["session"])
+                if result["ticket"] is not None:
+                    db.refresh(result["ticket"])
+                    for ticket_service in result["ticket"].services:
+                        ticket_service.service
+            db.expunge_all()
+            return results
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    # --- Ciclo ---
+
+    async def _check(self, semaphore: asyncio.Semaphore, adapter, provider: str, session: Dict[str, Any]):
+        async with semaphore:
+            await self._limiter(provider).wait()
+            try:
+                provider_status = await adapter.check_session_status(session["transaction_id"], session["id"])
+            except Exception as e:
+                logger.warning(f"⚠️ Poller: falha ao consultar {provider} {session['transaction_id']}: {e}")
+                return None
+        new_status = normalize_provider_status(provider_status)
+        return (session["id"], new_status) if new_status else None
+
+    async def poll_once(self) -> int:
+        """Executa um ciclo. Retorna quantas sessões mudaram de status."""
+        sessions, configs = await asyncio.to_thread(self._load_pending)
+        if not sessions:
+            return 0
+
+        by_provider: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for session in sessions:
+            by_provider[session["payment_method"]].append(session)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        checks = []
+        for provider, provider_sessions in by_provider.items():
+            for session in provider_sessions:
+                tenant_config = configs.get(str(session["tenant_id"]), {})
+                provider_config = tenant_config.get(PROVIDER_CONFIG_KEYS[provider])
+                if not provider_config:
+                    continue
+                try:
+                    adapter = PaymentAdapterFactory.get_adapter(session["tenant_id"], provider, provider_config)
+                except Exception as e:
+                    logger.warning(f"⚠️ Poller: adaptador {provider} indisponível para o tenant {session['tenant_id']}: {e}")
+                    continue
+                checks.append(self._check(semaphore, adapter, provider, session))
+
+        changes = [change for change in await asyncio.gather(*checks) if change]
+        if not changes:
+            return 0
+
+        results = await asyncio.to_thread(self._apply_changes, changes)
+        for tenant_id in {str(result["session"].tenant_id) for result in results if result["released"]}:
+            catalog_cache.invalidate(tenant_id)  # Estoque de extras devolvido
+        for result in results:
+            payment_session, ticket = result["session"], result["ticket"]
+            if payment_session.status in (PaymentSessionStatus.PAID.value, PaymentSessionStatus.FAILED.value):
+                record_payment_processed(payment_session)
+            if result["created"]:
+                record_ticket_created(ticket, [payment_session.service_id])
+            await self._notify(payment_session, ticket)
+
+        logger.info(f"🔄 Poller: {len(results)} sessão(ões) atualizada(s) de {len(sessions)} consultada(s)")
+        return len(results)
+
+    async def _notify(self, payment_session: PaymentSession, ticket: Optional[Ticket]) -> None:
+        tenant_id = str(payment_session.tenant_id)
+        try:
+            await websocket_manager.broadcast_to_tenant(tenant_id, {
+                "type": "payment_update",
+                "data": {
+                    "id": str(payment_session.id),
+                    "status": payment_session.status,
+                    "ticket_id": str(ticket.id) if ticket else None
+                }
+            })
+            if ticket:
+                await websocket_manager.broadcast_ticket_update(tenant_id, ticket)
+        except Exception as e:
+            logger.error(f"❌ Poller: erro ao notificar sessão {payment_session.id}: {e}")
+
+
+def _build_poller() -> PaymentStatusPoller:
+    from config.settings import settings
+    return PaymentStatusPoller(
+        interval=settings.PAYMENT_POLL_INTERVAL,
+        batch_size=settings.PAYMENT_POLL_BATCH_SIZE,
+        concurrency=settings.PAYMENT_POLL_CONCURRENCY,
+        rate_limit=settings.PAYMENT_POLL_RATE_LIMIT
+    )
+
+
+# === Instância Global ===
+payment_status_poller = _build_poller()
@@ -0,0 +1,119 @@
+"""Transições de status de ``PaymentSession`` compartilhadas por webhook e poller.
+
+As funções daqui só fazem ``flush``: o chamador mantém a sessão travada
+(``FOR UPDATE`` ou ``UPDATE ... WHERE status = 'pending'``) e faz um único
+commit, depois do qual envia métricas e notificações.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from constants import PaymentSessionStatus, TicketStatus
+from models import PaymentSession, Ticket, TicketService
+from services.customer_profiles import upsert_customer
+from services.ticket_numbers import next_ticket_number
+
+logger = logging.getLogger(__name__)
+
+# Status devolvidos pelos provedores -> status da sessão
+PROVIDER_STATUS_MAP = {
+    "approved": PaymentSessionStatus.PAID.value,
+    "authorized": PaymentSessionStatus.PAID.value,
+    "paid": PaymentSessionStatus.PAID.value,
+    "rejected": PaymentSessionStatus.FAILED.value,
+    "failed": PaymentSessionStatus.FAILED.value,
+    "cancelled": PaymentSessionStatus.CANCELLED.value,
+    "canceled": PaymentSessionStatus.CANCELLED.value,
+    "refunded": PaymentSessionStatus.CANCELLED.value,
+    "charged_back": PaymentSessionStatus.CANCELLED.value,
+    "expired": PaymentSessionStatus.EXPIRED.value,
+}
+
+
+def normalize_provider_status(provider_status: Optional[str]) -> Optional[str]:
+    """Converte o status do provedor; ``None`` quando ainda não é final (pending, in_process...)"""
+    if not provider_status:
+        return None
+    return PROVIDER_STATUS_MAP.get(str(provider_status).lower())
+
+
+def is_duplicate_delivery(payment_session: PaymentSession, new_status: str) -> bool:
+    """Reentrega sem efeito: o mesmo status de novo (``paid`` só depois de virar ticket).
+
+    Uma sessão ``paid`` sem ticket (falha parcial em uma entrega anterior)
+    não é duplicada quando o provedor reenvia ``paid``: ela precisa passar
+    por ``confirm_paid_session`` de novo. Mudanças reais depois do pagamento
+    (ex.: ``cancelled`` por estorno/chargeback) seguem para o handler."""
+    if payment_session.status != new_status:
+        return False
+    if new_status == PaymentSessionStatus.PAID.value:
+        return payment_session.ticket_id is not None
+    return True
+
+
+def create_ticket_from_payment_session(payment_session: PaymentSession, db: Session) -> Ticket:
+    """Cria ticket automaticamente após pagamento confirmado.
+
+    Apenas adiciona e faz flush na transação do chamador; também vincula a
+    sessão ao ticket."""
+
+    # Create ticket with IN_QUEUE status (pagamento já confirmado, ir direto para fila)
+    ticket = Ticket(
+        tenant_id=payment_session.tenant_id,
+        payment_session_id=payment_session.id,
+        ticket_number=next_ticket_number(db, payment_session.tenant_id),
+        status=TicketStatus.IN_QUEUE.value,  # Ir direto para fila
+        customer_name=payment_session.customer_name,
+        customer_cpf=payment_session.customer_cpf,
+        customer_cpf_hash=payment_session.customer_cpf_hash,
+        customer_id=upsert_customer(
+            db, payment_session.tenant_id, payment_session.customer_name,
+            phone=payment_session.customer_phone, cpf_hash=payment_session.customer_cpf_hash
+        ),
+        customer_phone=payment_session.customer_phone,
+        consent_version=payment_session.consent_version,
+        print_attempts=0,
+        queued_at=datetime.utcnow()  # Definir queued_at imediatamente
+    )
+
+    # TODO: Implementar suporte a múltiplos serviços na PaymentSession
+    # Por enquanto, usar apenas o service_id principal
+    ticket.services.append(TicketService(
+        service_id=payment_session.service_id,
+        price=payment_session.amount
+    ))
+
+    db.add(ticket)
+    db.flush()  # Para obter o ID do ticket
+    payment_session.ticket_id = ticket.id
+
+    return ticket
+
+
+def confirm_paid_session(payment_session: PaymentSession, db: Session) -> Tuple[Optional[Ticket], bool]:
+    """Aplica o pagamento confirmado de uma sessão travada.
+
+    Sessões do totem já nascem ligadas a um ticket ``pending_payment``: esse
+    ticket é confirmado e vai para a fila. Nas demais, um ticket novo é
+    criado. Retorna ``(ticket, criado_agora)``."""
+    if payment_session.ticket_id:
+        ticket = db.query(Ticket).filter(
+            Ticket.id == payment_session.ticket_id
+        ).with_for_update().first()
+
+        if ticket and ticket.status == TicketStatus.PENDING_PAYMENT.value:
+            now = datetime.now(timezone.utc)
+            ticket.payment_confirmed = True
+            ticket.status = TicketStatus.IN_QUEUE.value
+            ticket.queued_at = now
+            ticket.updated_at = now
+            db.flush()
+            logger.info(f"🎯 Ticket #{ticket.ticket_number} pagamento confirmado pela sessão {payment_session.id}")
+        return ticket, False
+
+    ticket = create_ticket_from_payment_session(payment_session, db)
+    logger.info(f"🎯 Ticket #{ticket.ticket_number} created from payment session {payment_session.id} and moved to queue")
+    return ticket, True
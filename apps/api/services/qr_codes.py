@@ -0,0 +1,128 @@
+# 🔳 Renderização de QR codes de pagamento
+
+"""Geração de QR codes fora do event loop, com cache por link de pagamento.
+
+Formatos disponíveis:
+
+- ``png``: data URI ``image/png`` em base64 (formato original);
+- ``svg``: markup SVG com um único ``<path>`` (linhas de módulos agrupadas);
+- ``matrix``: lista de linhas ``"0"``/``"1"`` sem a zona de silêncio, para o
+  totem desenhar localmente.
+
+O cálculo da matriz e o PNG são CPU-bound; ``QRCodeRenderer.render`` executa em um
+pool de threads dedicado e guarda o resultado por ``(link, formato)``, então
+as releituras da sessão pelo totem não renderizam de novo.
+"""
+
+import asyncio
+import base64
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union
+
+import qrcode
+
+from services.cache import TTLCache
+
+QR_FORMATS = ("png", "svg", "matrix")
+
+# Zona de silêncio e tamanho do módulo (PNG/SVG)
+QR_BORDER = 4
+QR_BOX_SIZE = 10
+
+QRCodeResult = Union[str, List[str]]
+
+
+def _qr(payment_link: str, border: int) -> qrcode.QRCode:
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=QR_BOX_SIZE,
+        border=border,
+    )
+    qr.add_data(payment_link)
+    qr.make(fit=True)
+    return qr
+
+
+def qr_matrix(payment_link: str) -> List[str]:
+    """Matriz de módulos (``"1"`` = escuro), sem zona de silêncio"""
+    return [
+        "".join("1" if cell else "0" for cell in row)
+        for row in _qr(payment_link, border=0).get_matrix()
+    ]
+
+
+def qr_svg(payment_link: str) -> str:
+    """SVG compacto: cada sequência de módulos escuros vira um retângulo no path"""
+    matrix = qr_matrix(payment_link)
+    size = len(matrix) + 2 * QR_BORDER
+    parts = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x] == "1":
+                start = x
+                while x < len(row) and row[x] == "1":
+                    x += 1
+                parts.append(f"M{start + QR_BORDER} {y + QR_BORDER}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'width="{size * QR_BOX_SIZE}" height="{size * QR_BOX_SIZE}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(parts)}"/></svg>'
+    )
+
+
+def qr_png(payment_link: str) -> str:
+    """PNG em data URI base64"""
+    img = _qr(payment_link, border=QR_BORDER).make_image(fill_color="black", back_color="white")
+
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    img_str = base64.b64encode(buffered.getvalue()).decode()
+
+    return f"data:image/png;base64,{img_str}"
+
+
+_RENDERERS = {
+    "png": qr_png,
+    "svg": qr_svg,
+    "matrix": qr_matrix,
+}
+
+
+class QRCodeRenderer:
+    """🔳 Renderizador com pool de threads próprio e cache LRU por link"""
+
+    def __init__(self, max_workers: int = 2, cache_size: int = 512, cache_ttl: float = 1800.0):
+        self.max_workers = max_workers
+        self._cache = TTLCache(ttl_seconds=cache_ttl, max_entries=cache_size)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="qr-render")
+        return self._executor
+
+    def render_sync(self, payment_link: str, fmt: str = "png") -> QRCodeResult:
+        """Renderiza no thread atual (com cache)"""
+        if fmt not in _RENDERERS:
+            raise ValueError(f"Formato de QR code não suportado: {fmt}")
+        return self._cache.get_or_set((payment_link, fmt), lambda: _RENDERERS[fmt](payment_link))
+
+    async def render(self, payment_link: str, fmt: str = "png") -> QRCodeResult:
+        """Renderiza no pool de threads; acertos de cache não saem do event loop"""
+        cached = self._cache.get((payment_link, fmt))
+        if cached is not None:
+            return cached
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), self.render_sync, payment_link, fmt)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
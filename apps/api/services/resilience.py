@@ -1,81 +1,264 @@
-from typing import Any, Callable, Optional
+"""Circuit breaker, bulkhead e retry para chamadas a dependências externas.
+
+``resilience_registry`` guarda uma instância de cada padrão por dependência
+(ex.: ``"mercadopago"``) ou por dependência + tenant, então adaptadores
+recriados e requisições concorrentes compartilham o mesmo estado. Com
+``RESILIENCE_STATE_BACKEND=redis`` a abertura de um breaker é publicada no
+Redis e os outros workers passam a rejeitar chamadas sem precisar descobrir a
+falha sozinhos. Estado dos breakers, rejeições e retentativas são exportados
+no Prometheus.
+"""
+
+from typing import Any, Callable, Dict, Optional, Tuple
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
+import os
+import random
+import threading
+import time
 from functools import wraps
 from opentelemetry import trace
+from prometheus_client import Counter, Gauge
 
 logger = logging.getLogger(__name__)
 tracer = trace.get_tracer(__name__)
 
+# Métricas Prometheus
+CIRCUIT_STATE_VALUES = {"closed": 0, "half-open": 1, "open": 2}
+
+CIRCUIT_BREAKER_STATE = Gauge(
+    'totem_circuit_breaker_state',
+    'Circuit breaker state (0=closed, 1=half-open, 2=open)',
+    ['name'],
+    multiprocess_mode='livemax'  # Aberto em qualquer worker vivo = aberto
+)
+
+CIRCUIT_BREAKER_FAILURES = Counter(
+    'totem_circuit_breaker_failures_total',
+    'Calls counted as failures by a circuit breaker',
+    ['name']
+)
+
+RESILIENCE_REJECTIONS = Counter(
+    'totem_resilience_rejections_total',
+    'Calls rejected without reaching the dependency',
+    ['name', 'reason']  # reason: circuit_open | bulkhead_full
+)
+
+RETRY_ATTEMPTS = Counter(
+    'totem_retry_attempts_total',
+    'Retry outcomes per dependency',
+    ['name', 'outcome']  # outcome: retried | exhausted | deadline
+)
+
+BULKHEAD_IN_FLIGHT = Gauge(
+    'totem_bulkhead_in_flight',
+    'Concurrent calls currently admitted by a bulkhead',
+    ['name'],
+    multiprocess_mode='livesum'
+)
+
+class ResilienceRejectedError(Exception):
+    """Chamada recusada localmente (não chegou à dependência); não deve ser retentada"""
+
+class CircuitOpenError(ResilienceRejectedError):
+    pass
+
+class BulkheadFullError(ResilienceRejectedError):
+    pass
+
+class RedisCircuitStateBackend:
+    """Estado compartilhado entre workers: ``<prefix><name>`` guarda até quando o breaker fica aberto"""
+
+    def __init__(self, client, prefix: str = "circuit:open:"):
+        self._client = client
+        self._prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisCircuitStateBackend":
+        import redis.asyncio as redis  # Dependência opcional
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    async def get_open_until(self, name: str) -> Optional[float]:
+        value = await self._client.get(f"{self._prefix}{name}")
+        return float(value) if value else None
+
+    async def mark_open(self, name: str, open_until: float) -> None:
+        ttl = max(1, int(open_until - time.time()) + 1)
+        await self._client.set(f"{self._prefix}{name}", repr(open_until), ex=ttl)
+
+    async def mark_closed(self, name: str) -> None:
+        await self._client.delete(f"{self._prefix}{name}")
+
 class CircuitBreaker:
+    """Circuit breaker thread-safe com estado opcionalmente compartilhado.
+
+    No estado ``half-open`` só ``half_open_max_calls`` chamadas de teste passam
+    por vez (uma sonda presa por mais de ``half_open_timeout`` libera outra).
+    Falhas são consecutivas: um sucesso zera o contador."""
+
     def __init__(
         self,
         name: str,
         failure_threshold: int = 5,
         reset_timeout: int = 60,
-        half_open_timeout: int = 30
+        half_open_timeout: int = 30,
+        half_open_max_calls: int = 1,
+        failure_exceptions: Tuple[type, ...] = (Exception,),
+        shared_backend: Optional[RedisCircuitStateBackend] = None,
+        sync_interval: float = 1.0
     ):
         self.name = name
         self.failure_threshold = failure_threshold
         self.reset_timeout = reset_timeout
         self.half_open_timeout = half_open_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.failure_exceptions = failure_exceptions
+        self.shared_backend = shared_backend
+        self.sync_interval = sync_interval
         self.failures = 0
         self.last_failure_time: Optional[datetime] = None
         self.state = "closed"  # closed, open, half-open
         self.last_success_time: Optional[datetime] = None
         self.total_requests = 0
         self.failed_requests = 0
+        self.rejected_requests = 0
+
+        self._lock = threading.Lock()
+        self._open_until = 0.0
+        self._probes = 0
+        self._probe_started_at = 0.0
+        self._next_sync_at = 0.0
+        CIRCUIT_BREAKER_STATE.labels(name=name).set(0)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        CIRCUIT_BREAKER_STATE.labels(name=self.name).set(CIRCUIT_STATE_VALUES[state])
+
+    async def _sync_shared(self, now: float) -> None:
+        """Adota a abertura publicada por outro worker (no máximo uma leitura por ``sync_interval``)"""
+        if self.shared_backend is None or self.state != "closed" or now < self._next_sync_at:
+            return
+        self._next_sync_at = now + self.sync_interval
+        try:
+            open_until = await self.shared_backend.get_open_until(self.name)
+        except Exception as e:
+            logger.warning(f"Circuit breaker '{self.name}': shared state unavailable ({e})")
+            return
+        if open_until and open_until > now:
+            with self._lock:
+                if self.state == "closed":
+                    self._open_until = open_until
+                    self._set_state("open")
+                    logger.warning(f"Circuit breaker '{self.name}' opened by another worker")
+
+    async def _publish(self, open_until: Optional[float]) -> None:
+        if self.shared_backend is None:
+            return
+        try:
+            if open_until:
+                await self.shared_backend.mark_open(self.name, open_until)
+            else:
+                await self.shared_backend.mark_closed(self.name)
+        except Exception as e:
+            logger.warning(f"Circuit breaker '{self.name}': could not publish state ({e})")
+
+    def _admit(self, now: float) -> bool:
+        """Decide se a chamada passa; retorna True se ela é uma sonda do half-open"""
+        with self._lock:
+            self.total_requests += 1
+            if self.state == "open":
+                if now < self._open_until:
+                    self._reject()
+                self._set_state("half-open")
+                self._probes = 0
+                logger.info(f"Circuit breaker '{self.name}' is now half-open after {self.reset_timeout}s timeout")
+
+            if self.state == "half-open":
+                if self._probes >= self.half_open_max_calls and now - self._probe_started_at < self.half_open_timeout:
+                    self._reject()
+                self._probes += 1
+                self._probe_started_at = now
+                return True
+            return False
+
+    def _reject(self) -> None:
+        self.rejected_requests += 1
+        RESILIENCE_REJECTIONS.labels(name=self.name, reason="circuit_open").inc()
+        logger.warning(f"Circuit breaker '{self.name}' is {self.state}, request rejected")
+        raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+
+    def _on_success(self, probe: bool) -> bool:
+        with self._lock:
+            self.last_success_time = datetime.utcnow()
+            self.failures = 0
+            if probe and self.state == "half-open":
+                self._probes = 0
+                self._set_state("closed")
+                logger.info(f"Circuit breaker '{self.name}' is now closed after successful half-open test")
+                return True
+            return False
+
+    def _on_failure(self, error: Exception, probe: bool) -> Optional[float]:
+        with self._lock:
+            self.failures += 1
+            self.failed_requests += 1
+            self.last_failure_time = datetime.utcnow()
+            CIRCUIT_BREAKER_FAILURES.labels(name=self.name).inc()
+
+            if (probe and self.state == "half-open") or \
+               (self.state == "closed" and self.failures >= self.failure_threshold):
+                self._open_until = time.time() + self.reset_timeout
+                self._probes = 0
+                self._set_state("open")
+                logger.error(
+                    f"Circuit breaker '{self.name}' is now open after {self.failures} failures. "
+                    f"Last error: {str(error)}"
+                )
+                return self._open_until
+            return None
+
+    def _release_probe(self) -> None:
+        with self._lock:
+            if self.state == "half-open" and self._probes:
+                self._probes -= 1
 
     async def execute(self, func: Callable, *args, **kwargs) -> Any:
         """Executa a função com o padrão Circuit Breaker"""
-        self.total_requests += 1
-        
+        now = time.time()
+        await self._sync_shared(now)
+
         with tracer.start_as_current_span(f"circuit_breaker.{self.name}") as span:
             span.set_attribute("circuit_breaker.state", self.state)
             span.set_attribute("circuit_breaker.failures", self.failures)
-            
-            if self.state == "open":
-                if self.last_failure_time and \
-                   datetime.utcnow() - self.last_failure_time > timedelta(seconds=self.reset_timeout):
-                    self.state = "half-open"
-                    logger.info(f"Circuit breaker '{self.name}' is now half-open after {self.reset_timeout}s timeout")
-                    span.set_attribute("circuit_breaker.state", "half-open")
-                else:
-                    logger.warning(f"Circuit breaker '{self.name}' is open, request rejected")
-                    span.set_attribute("circuit_breaker.rejected", True)
-                    raise Exception(f"Circuit breaker '{self.name}' is open")
+
+            try:
+                probe = self._admit(now)
+            except CircuitOpenError:
+                span.set_attribute("circuit_breaker.rejected", True)
+                raise
 
             try:
                 result = await func(*args, **kwargs)
-                
-                if self.state == "half-open":
-                    self.state = "closed"
-                    self.failures = 0
-                    logger.info(f"Circuit breaker '{self.name}' is now closed after successful half-open test")
-                    span.set_attribute("circuit_breaker.state", "closed")
-                
-                self.last_success_time = datetime.utcnow()
-                span.set_attribute("circuit_breaker.success", True)
-                return result
-
-            except Exception as e:
-                self.failures += 1
-                self.failed_requests += 1
-                self.last_failure_time = datetime.utcnow()
-                
+            except self.failure_exceptions as e:
                 span.set_attribute("circuit_breaker.error", str(e))
                 span.set_attribute("circuit_breaker.error_type", type(e).__name__)
-                
-                if self.failures >= self.failure_threshold:
-                    self.state = "open"
-                    logger.error(
-                        f"Circuit breaker '{self.name}' is now open after {self.failures} failures. "
-                        f"Last error: {str(e)}"
-                    )
+                open_until = self._on_failure(e, probe)
+                if open_until:
                     span.set_attribute("circuit_breaker.state", "open")
-                
-                raise e
+                    await self._publish(open_until)
+                raise
+            except BaseException:
+                if probe:
+                    self._release_probe()
+                raise
+
+            if self._on_success(probe):
+                span.set_attribute("circuit_breaker.state", "closed")
+                await self._publish(None)
+            span.set_attribute("circuit_breaker.success", True)
+            return result
 
     def get_metrics(self) -> dict:
         """Retorna métricas do circuit breaker"""
@@ -85,64 +268,147 @@ class CircuitBreaker:
             "failures": self.failures,
             "total_requests": self.total_requests,
             "failed_requests": self.failed_requests,
+            "rejected_requests": self.rejected_requests,
             "failure_rate": self.failed_requests / self.total_requests if self.total_requests > 0 else 0,
             "last_failure_time": self.last_failure_time.isoformat() if self.last_failure_time else None,
             "last_success_time": self.last_success_time.isoformat() if self.last_success_time else None
         }
 
+class Bulkhead:
+    """Limita as chamadas simultâneas a uma dependência.
+
+    Com ``max_wait=0`` o excesso é recusado na hora; caso contrário espera
+    até ``max_wait`` segundos por uma vaga."""
+
+    def __init__(self, name: str, max_concurrent: int = 10, max_wait: float = 0.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.rejected_requests = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def _reject(self) -> None:
+        self.rejected_requests += 1
+        RESILIENCE_REJECTIONS.labels(name=self.name, reason="bulkhead_full").inc()
+        logger.warning(f"Bulkhead '{self.name}' is full ({self.max_concurrent} concurrent calls), request rejected")
+        raise BulkheadFullError(f"Bulkhead '{self.name}' is full")
+
+    async def execute(self, func: Callable, *args, **kwargs) -> Any:
+        """Executa a função ocupando uma vaga do bulkhead"""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()  # Vaga livre: não suspende
+        elif self.max_wait <= 0:
+            self._reject()
+        else:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self._reject()
+
+        self.in_flight += 1
+        BULKHEAD_IN_FLIGHT.labels(name=self.name).inc()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+            BULKHEAD_IN_FLIGHT.labels(name=self.name).dec()
+            self._semaphore.release()
+
+    def get_metrics(self) -> dict:
+        """Retorna métricas do bulkhead"""
+        return {
+            "name": self.name,
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "rejected_requests": self.rejected_requests
+        }
+
 class Retry:
+    """Retentativas com backoff exponencial e jitter.
+
+    ``jitter`` usa "full jitter" (espera aleatória entre 0 e o backoff) para
+    que workers não retentem em sincronia. ``deadline`` é o orçamento total em
+    segundos: uma retentativa cuja espera estouraria o prazo não é feita.
+    Rejeições locais (breaker aberto, bulkhead cheio) nunca são retentadas."""
+
     def __init__(
         self,
         name: str,
         max_attempts: int = 3,
         delay: float = 1.0,
         backoff: float = 2.0,
-        exceptions: tuple = (Exception,)
+        exceptions: tuple = (Exception,),
+        max_delay: float = 30.0,
+        jitter: bool = True,
+        deadline: Optional[float] = None
     ):
         self.name = name
         self.max_attempts = max_attempts
         self.delay = delay
         self.backoff = backoff
         self.exceptions = exceptions
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
         self.total_retries = 0
         self.failed_retries = 0
 
+    def _wait_time(self, attempt: int) -> float:
+        wait_time = min(self.max_delay, self.delay * (self.backoff ** attempt))
+        return random.uniform(0, wait_time) if self.jitter else wait_time
+
     async def execute(self, func: Callable, *args, **kwargs) -> Any:
         """Executa a função com o padrão Retry"""
         last_exception = None
-        
+        started_at = time.monotonic()
+
         with tracer.start_as_current_span(f"retry.{self.name}") as span:
             span.set_attribute("retry.max_attempts", self.max_attempts)
-            
+
             for attempt in range(self.max_attempts):
                 try:
                     result = await func(*args, **kwargs)
                     span.set_attribute("retry.attempt", attempt + 1)
                     span.set_attribute("retry.success", True)
                     return result
+                except ResilienceRejectedError:
+                    raise
                 except self.exceptions as e:
                     last_exception = e
-                    self.total_retries += 1
-                    
+
                     span.set_attribute("retry.attempt", attempt + 1)
                     span.set_attribute("retry.error", str(e))
                     span.set_attribute("retry.error_type", type(e).__name__)
-                    
+
                     if attempt == self.max_attempts - 1:
                         self.failed_retries += 1
+                        RETRY_ATTEMPTS.labels(name=self.name, outcome="exhausted").inc()
                         logger.error(
                             f"Retry '{self.name}' failed after {self.max_attempts} attempts. "
                             f"Last error: {str(e)}"
                         )
                         break
-                    
-                    wait_time = self.delay * (self.backoff ** attempt)
+
+                    wait_time = self._wait_time(attempt)
+                    if self.deadline is not None and time.monotonic() - started_at + wait_time > self.deadline:
+                        self.failed_retries += 1
+                        RETRY_ATTEMPTS.labels(name=self.name, outcome="deadline").inc()
+                        span.set_attribute("retry.deadline_exceeded", True)
+                        logger.error(
+                            f"Retry '{self.name}' gave up after {attempt + 1} attempts: "
+                            f"deadline of {self.deadline:.1f}s exceeded. Last error: {str(e)}"
+                        )
+                        break
+
+                    self.total_retries += 1
+                    RETRY_ATTEMPTS.labels(name=self.name, outcome="retried").inc()
                     logger.warning(
                         f"Retry '{self.name}' attempt {attempt + 1} failed, "
                         f"retrying in {wait_time:.2f} seconds. Error: {str(e)}"
                     )
                     await asyncio.sleep(wait_time)
-            
+
             raise last_exception
 
     def get_metrics(self) -> dict:
@@ -154,9 +420,109 @@ class Retry:
             "success_rate": (self.total_retries - self.failed_retries) / self.total_retries if self.total_retries > 0 else 0
         }
 
+class ResilienceRegistry:
+    """Instâncias compartilhadas de breaker/bulkhead/retry por dependência.
+
+    A chave é ``dependency`` ou ``dependency:tenant_id``. ``configure`` define
+    os parâmetros de uma dependência antes do primeiro uso."""
+
+    def __init__(self, shared_backend: Optional[RedisCircuitStateBackend] = None):
+        self.shared_backend = shared_backend
+        self._options: Dict[str, Dict[str, dict]] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._bulkheads: Dict[str, Bulkhead] = {}
+        self._retries: Dict[str, Retry] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(dependency: str, tenant_id: Any = None) -> str:
+        return f"{dependency}:{tenant_id}" if tenant_id else dependency
+
+    def configure(
+        self,
+        dependency: str,
+        circuit_breaker: Optional[dict] = None,
+        bulkhead: Optional[dict] = None,
+        retry: Optional[dict] = None
+    ) -> None:
+        """Parâmetros (kwargs de cada classe) usados ao criar as instâncias da dependência"""
+        with self._lock:
+            self._options[dependency] = {
+                "circuit_breaker": circuit_breaker or {},
+                "bulkhead": bulkhead or {},
+                "retry": retry or {}
+            }
+
+    def _get(self, store: dict, factory: Callable, kind: str, dependency: str, tenant_id: Any) -> Any:
+        name = self.key(dependency, tenant_id)
+        instance = store.get(name)
+        if instance is None:
+            with self._lock:
+                instance = store.get(name)
+                if instance is None:
+                    options = self._options.get(dependency, {}).get(kind, {})
+                    instance = store[name] = factory(name, **options)
+        return instance
+
+    def circuit_breaker(self, dependency: str, tenant_id: Any = None) -> CircuitBreaker:
+        return self._get(
+            self._breakers,
+            lambda name, **options: CircuitBreaker(name, shared_backend=self.shared_backend, **options),
+            "circuit_breaker", dependency, tenant_id
+        )
+
+    def bulkhead(self, dependency: str, tenant_id: Any = None) -> Bulkhead:
+        return self._get(self._bulkheads, Bulkhead, "bulkhead", dependency, tenant_id)
+
+    def retry(self, dependency: str, tenant_id: Any = None) -> Retry:
+        return self._get(self._retries, Retry, "retry", dependency, tenant_id)
+
+    async def call(
+        self,
+        dependency: str,
+        func: Callable,
+        *args,
+        tenant_id: Any = None,
+        retry: bool = True,
+        **kwargs
+    ) -> Any:
+        """Executa ``func`` atrás do bulkhead e do breaker da dependência (e do retry, se ``retry``)"""
+        breaker = self.circuit_breaker(dependency, tenant_id)
+        bulkhead = self.bulkhead(dependency, tenant_id)
+
+        async def guarded():
+            return await bulkhead.execute(breaker.execute, func, *args, **kwargs)
+
+        if retry:
+            return await self.retry(dependency, tenant_id).execute(guarded)
+        return await guarded()
+
+    def get_metrics(self) -> dict:
+        """Métricas de todas as instâncias criadas"""
+        return {
+            "circuit_breakers": [breaker.get_metrics() for breaker in list(self._breakers.values())],
+            "bulkheads": [bulkhead.get_metrics() for bulkhead in list(self._bulkheads.values())],
+            "retries": [retry.get_metrics() for retry in list(self._retries.values())]
+        }
+
+def build_resilience_registry() -> ResilienceRegistry:
+    """Cria o registro conforme ``RESILIENCE_STATE_BACKEND`` (memory | redis)"""
+
+    backend_name = os.getenv("RESILIENCE_STATE_BACKEND", "memory").lower()
+
+    backend = None
+    try:
+        if backend_name == "redis":
+            backend = RedisCircuitStateBackend.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    except Exception as e:
+        logger.error(f"❌ Could not initialize resilience state backend '{backend_name}': {e}")
+
+    return ResilienceRegistry(shared_backend=backend)
+
 def with_resilience(
     circuit_breaker: Optional[CircuitBreaker] = None,
-    retry: Optional[Retry] = None
+    retry: Optional[Retry] = None,
+    bulkhead: Optional[Bulkhead] = None
 ):
     """Decorator para adicionar resiliência a uma função"""
     def decorator(func: Callable):
@@ -164,17 +530,16 @@ def with_resilience(
         async def wrapper(*args, **kwargs):
             with tracer.start_as_current_span(f"resilience.{func.__name__}") as span:
                 try:
-                    if circuit_breaker and retry:
-                        result = await retry.execute(
-                            lambda: circuit_breaker.execute(func, *args, **kwargs)
-                        )
-                    elif circuit_breaker:
-                        result = await circuit_breaker.execute(func, *args, **kwargs)
-                    elif retry:
-                        result = await retry.execute(func, *args, **kwargs)
+                    call = lambda: func(*args, **kwargs)
+                    if circuit_breaker:
+                        call = lambda call=call: circuit_breaker.execute(call)
+                    if bulkhead:
+                        call = lambda call=call: bulkhead.execute(call)
+                    if retry:
+                        result = await retry.execute(call)
                     else:
-                        result = await func(*args, **kwargs)
-                    
+                        result = await call()
+
                     span.set_attribute("resilience.success", True)
                     return result
                 except Exception as e:
@@ -184,10 +549,9 @@ def with_resilience(
         return wrapper
     return decorator
 
+# === Instância Global ===
+resilience_registry = build_resilience_registry()
+
 # Exemplo de uso:
-# @with_resilience(
-#     circuit_breaker=CircuitBreaker("payment_api", failure_threshold=5),
-#     retry=Retry("payment_api", max_attempts=3)
-# )
-# async def process_payment():
-#     pass 
\ No newline at end of file
+# resilience_registry.configure("payment_api", circuit_breaker={"failure_threshold": 5}, bulkhead={"max_concurrent": 20})
+# await resilience_registry.call("payment_api", client.get, "/status", tenant_id=tenant_id)
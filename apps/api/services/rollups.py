@@ -0,0 +1,260 @@
+"""Agregados horários de tickets (``ticket_hourly_rollups``).
+
+Cada linha guarda, por tenant, serviço e hora de finalização, contagens de
+tickets concluídos/cancelados, receita e somas de tempo de espera e de
+atendimento. Um ticket com vários serviços entra em uma linha por serviço;
+por isso as colunas ``ticket_*`` (contagens e tempos por ticket) só são
+somadas na linha do primeiro serviço do ticket, e os totais do tenant (sem
+filtro de serviço) vêm delas. As linhas são atualizadas incrementalmente na mesma transação
+em que o ticket é concluído ou cancelado, e podem ser recalculadas a partir
+da tabela ``tickets`` com o comando de backfill:
+
+    python -m services.rollups backfill --days 90 [--tenant <uuid>]
+
+Dashboards e métricas leem dezenas de linhas daqui em vez do histórico
+inteiro de tickets.
+"""
+
+import argparse
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, aliased
+
+from models import Ticket, TicketHourlyRollup, TicketService
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_STATUSES = ("completed", "cancelled")
+
+_SUM_COLUMNS = (
+    "completed_count",
+    "cancelled_count",
+    "revenue",
+    "wait_seconds_sum",
+    "wait_count",
+    "service_seconds_sum",
+    "service_count",
+    "ticket_completed_count",
+    "ticket_cancelled_count",
+    "ticket_wait_seconds_sum",
+    "ticket_wait_count",
+    "ticket_service_seconds_sum",
+    "ticket_service_count",
+)
+
+
+def _finished_at():
+    return func.coalesce(Ticket.completed_at, Ticket.cancelled_at)
+
+
+def _rollup_select(*conditions):
+    """SELECT agregado de tickets finalizados no formato da tabela de rollup"""
+    completed = Ticket.status == "completed"
+    cancelled = Ticket.status == "cancelled"
+    bucket = func.date_trunc("hour", _finished_at())
+    wait_seconds = func.extract(
+        "epoch", Ticket.called_at - func.coalesce(Ticket.queued_at, Ticket.created_at)
+    )
+    service_seconds = func.extract("epoch", Ticket.completed_at - Ticket.started_at)
+    # Linha do primeiro serviço do ticket (menor id): a única que soma as colunas ticket_*
+    first_service = aliased(TicketService)
+    is_first = TicketService.id == select(first_service.id).where(
+        first_service.ticket_id == Ticket.id
+    ).order_by(first_service.id).limit(1).scalar_subquery()
+    first_completed = and_(completed, is_first)
+
+    return select(
+        Ticket.tenant_id,
+        TicketService.service_id,
+        bucket.label("bucket"),
+        func.count().filter(completed),
+        func.count().filter(cancelled),
+        func.coalesce(func.sum(TicketService.price).filter(completed), 0),
+        func.coalesce(func.sum(wait_seconds).filter(completed), 0),
+        func.count(wait_seconds).filter(completed),
+        func.coalesce(func.sum(service_seconds).filter(completed), 0),
+        func.count(service_seconds).filter(completed),
+        func.count().filter(first_completed),
+        func.count().filter(and_(cancelled, is_first)),
+        func.coalesce(func.sum(wait_seconds).filter(first_completed), 0),
+        func.count(wait_seconds).filter(first_completed),
+        func.coalesce(func.sum(service_seconds).filter(first_completed), 0),
+        func.count(service_seconds).filter(first_completed),
+    ).join(
+        TicketService, TicketService.ticket_id == Ticket.id
+    ).where(
+        Ticket.status.in_(ROLLUP_STATUSES),
+        _finished_at().isnot(None),
+        *conditions
+    ).group_by(Ticket.tenant_id, TicketService.service_id, bucket)
+
+
+def _insert_from(select_stmt):
+    return insert(TicketHourlyRollup).from_select(
+        ["tenant_id", "service_id", "bucket", *_SUM_COLUMNS], select_stmt
+    )
+
+
+def record_ticket_finished(db: Session, ticket: Ticket) -> None:
+    """Soma um ticket concluído/cancelado aos rollups da sua hora.
+
+    Deve ser chamada antes do commit que finaliza o ticket, para que rollup e
+    ticket sejam gravados na mesma transação. Estados finais não têm
+    transições de saída, então cada ticket é somado uma única vez."""
+    if ticket.status not in ROLLUP_STATUSES:
+        return
+
+    record_tickets_finished(db, [ticket.id])
+
+
+def record_tickets_finished(db: Session, ticket_ids) -> None:
+    """Versão em lote de ``record_ticket_finished`` (um único INSERT ... SELECT).
+
+    Os tickets já devem estar em estado final na transação atual."""
+    if not ticket_ids:
+        return
+
+    db.flush()  # Garante que o novo status/timestamps estão visíveis para o SELECT
+    stmt = _insert_from(_rollup_select(Ticket.id.in_(ticket_ids)))
+    table = TicketHourlyRollup.__table__
+    db.execute(stmt.on_conflict_do_update(
+        constraint="uq_ticket_hourly_rollups_tenant_service_bucket",
+        set_={
+            **{column: table.c[column] + stmt.excluded[column] for column in _SUM_COLUMNS},
+            "updated_at": func.now(),
+        }
+    ))
+
+
+def backfill_rollups(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    tenant_id: Optional[str] = None
+) -> int:
+    """Recalcula os rollups da janela [start, end) a partir da tabela tickets.
+
+    Idempotente: as linhas da janela são apagadas e reconstruídas em uma
+    transação. Retorna o número de linhas gravadas."""
+    rollup_window = [TicketHourlyRollup.bucket >= start, TicketHourlyRollup.bucket < end]
+    ticket_window = [_finished_at() >= start, _finished_at() < end]
+    if tenant_id:
+        rollup_window.append(TicketHourlyRollup.tenant_id == tenant_id)
+        ticket_window.append(Ticket.tenant_id == tenant_id)
+
+    try:
+        db.execute(delete(TicketHourlyRollup).where(*rollup_window))
+        stmt = _insert_from(_rollup_select(*ticket_window))
+        result = db.execute(stmt.on_conflict_do_update(
+            constraint="uq_ticket_hourly_rollups_tenant_service_bucket",
+            set_={
+                **{column: stmt.excluded[column] for column in _SUM_COLUMNS},
+                "updated_at": func.now(),
+            }
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"Rollups recalculados: {result.rowcount} linha(s) entre {start} e {end}")
+    return result.rowcount
+
+
+def _summary_columns(service_id: Optional[str]):
+    """Somas da janela; sem filtro de serviço, contagens e tempos contam cada ticket uma vez"""
+    rollup = TicketHourlyRollup
+    prefix = "" if service_id else "ticket_"
+    columns = ("completed_count", "cancelled_count", "wait_seconds_sum", "wait_count",
+               "service_seconds_sum", "service_count")
+    completed, cancelled, wait_sum, wait_count, service_sum, service_count = (
+        getattr(rollup, prefix + column) for column in columns
+    )
+    return (
+        func.coalesce(func.sum(completed), 0).label("completed"),
+        func.coalesce(func.sum(cancelled), 0).label("cancelled"),
+        func.coalesce(func.sum(rollup.revenue), 0).label("revenue"),
+        func.coalesce(func.sum(wait_sum), 0).label("wait_seconds_sum"),
+        func.coalesce(func.sum(wait_count), 0).label("wait_count"),
+        func.coalesce(func.sum(service_sum), 0).label("service_seconds_sum"),
+        func.coalesce(func.sum(service_count), 0).label("service_count"),
+    )
+
+
+def _summary_from_row(row) -> Dict[str, Any]:
+    return {
+        "completed": row.completed,
+        "cancelled": row.cancelled,
+        "revenue": float(row.revenue),
+        "avg_wait_seconds": row.wait_seconds_sum / row.wait_count if row.wait_count else None,
+        "avg_service_seconds": row.service_seconds_sum / row.service_count if row.service_count else None,
+    }
+
+
+def _window(tenant_id: str, start: datetime, end: datetime, service_id: Optional[str]):
+    conditions = [
+        TicketHourlyRollup.tenant_id == tenant_id,
+        TicketHourlyRollup.bucket >= start,
+        TicketHourlyRollup.bucket < end,
+    ]
+    if service_id:
+        conditions.append(TicketHourlyRollup.service_id == service_id)
+    return and_(*conditions)
+
+
+def get_rollup_summary(
+    db: Session,
+    tenant_id: str,
+    start: datetime,
+    end: datetime,
+    service_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Totais da janela: concluídos, cancelados, receita e médias em segundos"""
+    row = db.query(*_summary_columns(service_id)).filter(
+        _window(tenant_id, start, end, service_id)
+    ).one()
+    return _summary_from_row(row)
+
+
+def get_daily_rollups(
+    db: Session,
+    tenant_id: str,
+    start: datetime,
+    end: datetime,
+    service_id: Optional[str] = None
+) -> Dict[str, Dict[str, Any]]:
+    """Totais por dia (YYYY-MM-DD) da janela"""
+    day = func.date_trunc("day", TicketHourlyRollup.bucket).label("day")
+    rows = db.query(day, *_summary_columns(service_id)).filter(
+        _window(tenant_id, start, end, service_id)
+    ).group_by(day).order_by(day).all()
+    return {row.day.strftime("%Y-%m-%d"): _summary_from_row(row) for row in rows}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Manutenção dos rollups horários de tickets")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill = subparsers.add_parser("backfill", help="Recalcula rollups a partir da tabela tickets")
+    backfill.add_argument("--days", type=int, default=30, help="Dias para trás a recalcular (padrão: 30)")
+    backfill.add_argument("--tenant", default=None, help="Restringe a um tenant")
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal
+
+    end = datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    start = end - timedelta(days=args.days)
+    db = SessionLocal()
+    try:
+        rows = backfill_rollups(db, start, end, tenant_id=args.tenant)
+        print(f"✅ {rows} linha(s) de rollup recalculadas")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
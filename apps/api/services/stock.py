@@ -0,0 +1,170 @@
+# 📦 Estoque de extras
+
+"""Reserva e devolução atômicas do estoque de extras.
+
+A venda reserva o estoque na mesma transação que cria o ticket, com um único
+``UPDATE ... SET stock = stock - n WHERE stock >= n RETURNING`` para todos os
+extras do pedido (``extras`` e ``operation_config_extras``). Sob concorrência
+o Postgres reavalia ``stock >= n`` depois de esperar o lock da linha, então
+dois totens nunca vendem a mesma última unidade; as linhas são travadas em
+ordem de id para evitar deadlock entre pedidos com os mesmos extras.
+
+Se algum extra não tem estoque suficiente (ou não é do tenant),
+``reserve_extras`` levanta ``InsufficientStockError`` e o chamador faz
+rollback, desfazendo também as baixas parciais.
+
+A reserva fica registrada nos ``ticket_extras`` do ticket
+``pending_payment`` e pertence a uma sessão de pagamento pendente
+(``payment_sessions.ticket_id``): a sessão de reserva (``payment_method``
+``none``) criada com o ticket quando algum extra foi reservado e, depois, a
+sessão criada em ``create-payment``. Quando a sessão de reserva vence, o
+estoque volta e o ticket continua aguardando o operador; quando a sessão do
+gateway vence, é recusada ou cancelada,
+``services.payment_expiry.cancel_unpaid_tickets`` cancela o ticket e devolve
+o estoque. ``release_ticket_extras`` marca ``ticket_extras.released_at``,
+então cada linha volta ao estoque uma vez só; ``reserve_released_extras``
+refaz a reserva quando o operador confirma um ticket cuja reserva venceu.
+
+SQL direto não dispara os eventos do ORM: após o commit o chamador invalida
+``catalog_cache`` do tenant.
+"""
+
+import logging
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_RESERVE_SQL = text("""
+    WITH requested AS (
+        SELECT extra_id, SUM(quantity) AS quantity
+          FROM unnest(CAST(:extra_ids AS uuid[]), CAST(:quantities AS integer[])) AS r(extra_id, quantity)
+         GROUP BY extra_id
+    ),
+    locked AS (
+        SELECT e.id
+          FROM extras AS e
+          JOIN requested ON requested.extra_id = e.id
+         WHERE e.tenant_id = :tenant_id
+         ORDER BY e.id
+           FOR UPDATE OF e
+    ),
+    reserved AS (
+        UPDATE extras AS e
+           SET stock = e.stock - requested.quantity, updated_at = now()
+          FROM requested
+          JOIN locked ON locked.id = requested.extra_id
+         WHERE e.id = requested.extra_id
+           AND e.stock >= requested.quantity
+     RETURNING e.id, e.stock, requested.quantity
+    ),
+    reserved_config AS (
+        UPDATE operation_config_extras AS oce
+           SET stock = GREATEST(oce.stock - reserved.quantity, 0)
+          FROM reserved
+         WHERE oce.extra_id = reserved.id
+    )
+    SELECT id, stock FROM reserved
+""")
+
+# Marca as linhas devolvidas (released_at) e devolve só as ainda não devolvidas:
+# a devolução é idempotente mesmo quando expiração e cancelamento se sobrepõem
+_RELEASE_EXTRAS_SQL = text("""
+    WITH released_rows AS (
+        UPDATE ticket_extras
+           SET released_at = now()
+         WHERE ticket_id = ANY(CAST(:ticket_ids AS uuid[]))
+           AND released_at IS NULL
+     RETURNING extra_id, quantity
+    ),
+    released AS (
+        SELECT extra_id, SUM(quantity) AS quantity
+          FROM released_rows
+         GROUP BY extra_id
+    ),
+    released_config AS (
+        UPDATE operation_config_extras AS oce
+           SET stock = oce.stock + released.quantity
+          FROM released
+         WHERE oce.extra_id = released.extra_id
+    )
+    UPDATE extras AS e
+       SET stock = COALESCE(e.stock, 0) + released.quantity, updated_at = now()
+      FROM released
+     WHERE e.id = released.extra_id
+""")
+
+_RELEASED_ITEMS_SQL = text("""
+    SELECT extra_id, quantity
+      FROM ticket_extras
+     WHERE ticket_id = :ticket_id
+       AND released_at IS NOT NULL
+""")
+
+_CLEAR_RELEASED_SQL = text("""
+    UPDATE ticket_extras SET released_at = NULL WHERE ticket_id = :ticket_id
+""")
+
+
+class InsufficientStockError(Exception):
+    """Um ou mais extras sem estoque para a quantidade pedida"""
+
+    def __init__(self, extra_ids: List[str]):
+        self.extra_ids = extra_ids
+        super().__init__(f"Estoque insuficiente para os extras: {', '.join(extra_ids)}")
+
+
+def aggregate_quantities(items: Iterable[Tuple[Any, int]]) -> Dict[str, int]:
+    """Soma as quantidades por extra (o mesmo extra pode vir repetido no pedido)"""
+    totals: Dict[str, int] = {}
+    for extra_id, quantity in items:
+        if quantity is None or quantity <= 0:
+            raise ValueError(f"Quantidade inválida para o extra {extra_id}: {quantity}")
+        totals[str(extra_id)] = totals.get(str(extra_id), 0) + int(quantity)
+    return totals
+
+
+def reserve_extras(db: Session, tenant_id, items: Iterable[Tuple[Any, int]]) -> Dict[str, int]:
+    """Baixa o estoque de todos os extras pedidos em um único statement.
+
+    ``items`` são pares ``(extra_id, quantidade)``. Retorna o estoque restante
+    por extra; levanta ``InsufficientStockError`` se algum não pôde ser
+    reservado (o chamador deve fazer rollback)."""
+    totals = aggregate_quantities(items)
+    if not totals:
+        return {}
+
+    rows = db.execute(_RESERVE_SQL, {
+        "tenant_id": str(tenant_id),
+        "extra_ids": list(totals),
+        "quantities": list(totals.values()),
+    }).all()
+    remaining = {str(extra_id): stock for extra_id, stock in rows}
+
+    missing = [extra_id for extra_id in totals if extra_id not in remaining]
+    if missing:
+        logger.warning(f"⚠️ Estoque insuficiente no tenant {tenant_id} para os extras {missing}")
+        raise InsufficientStockError(missing)
+    return remaining
+
+
+def release_ticket_extras(db: Session, ticket_ids: List[Any]) -> None:
+    """Devolve ao estoque os extras dos tickets (agregado por extra; cada linha uma vez só)"""
+    if not ticket_ids:
+        return
+    db.execute(_RELEASE_EXTRAS_SQL, {"ticket_ids": [str(ticket_id) for ticket_id in ticket_ids]})
+
+
+def reserve_released_extras(db: Session, tenant_id, ticket_id) -> bool:
+    """Reserva de novo os extras do ticket cuja reserva já foi devolvida.
+
+    Levanta ``InsufficientStockError`` se não há mais estoque (o chamador faz
+    rollback). Retorna se algo foi reservado."""
+    items = db.execute(_RELEASED_ITEMS_SQL, {"ticket_id": str(ticket_id)}).all()
+    if not items:
+        return False
+    reserve_extras(db, tenant_id, items)
+    db.execute(_CLEAR_RELEASED_SQL, {"ticket_id": str(ticket_id)})
+    return True
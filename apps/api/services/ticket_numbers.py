@@ -0,0 +1,24 @@
+"""Numeração sequencial de tickets por tenant.
+
+``MAX(ticket_number) + 1`` sozinho deixa duas transações concorrentes
+gerarem o mesmo número. ``next_ticket_number`` serializa a geração por
+tenant com um advisory lock de transação (liberado no commit/rollback) e
+o MAX é resolvido pelo índice ``(tenant_id, ticket_number)``.
+"""
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from models import Ticket
+
+
+def next_ticket_number(db: Session, tenant_id) -> int:
+    """Reserva o próximo número de ticket do tenant até o fim da transação atual"""
+    db.execute(
+        text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+        {"key": f"ticket_number:{tenant_id}"}
+    )
+    last_number = db.query(func.max(Ticket.ticket_number)).filter(
+        Ticket.tenant_id == tenant_id
+    ).scalar()
+    return (last_number or 0) + 1
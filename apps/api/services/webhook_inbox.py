@@ -0,0 +1,263 @@
+# 📥 Caixa de entrada durável de webhooks
+
+"""Webhooks validados são gravados em ``webhook_inbox`` e confirmados ao
+provedor imediatamente; um pool limitado de workers consome a tabela.
+
+Cada worker reivindica uma linha com ``FOR UPDATE SKIP LOCKED`` (vários
+workers/processos nunca pegam a mesma linha), executa o handler e marca a
+linha como ``done``. Falhas são reagendadas com backoff exponencial até
+``max_attempts``; depois disso a linha fica ``failed`` para inspeção.
+
+Enquanto está em ``processing``, ``next_attempt_at`` funciona como lease:
+se o processo morrer no meio, a linha volta a ser elegível quando o lease
+expira. A reivindicação só pega linhas com ``attempts < max_attempts``; um
+lease expirado que já consumiu a última tentativa vira ``failed``.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import WebhookInbox
+
+logger = logging.getLogger(__name__)
+
+# Handler recebe a linha reivindicada e deve levantar exceção para provocar retry
+WebhookHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_CLAIM_SQL = text("""
+    UPDATE webhook_inbox
+       SET status = 'processing',
+           attempts = attempts + 1,
+           next_attempt_at = now() + make_interval(secs => :lease_seconds)
+     WHERE id = (
+           SELECT id
+             FROM webhook_inbox
+            WHERE status IN ('pending', 'processing')
+              AND next_attempt_at <= now()
+              AND attempts < :max_attempts
+            ORDER BY next_attempt_at
+            LIMIT 1
+              FOR UPDATE SKIP LOCKED
+     )
+ RETURNING id, provider, transaction_id, event_type, event_timestamp, payload, attempts
+""")
+
+# Processo morreu durante a última tentativa: não há mais retry
+_EXPIRE_EXHAUSTED_SQL = text("""
+    UPDATE webhook_inbox
+       SET status = 'failed',
+           last_error = 'Lease expirado na última tentativa (processamento interrompido)'
+     WHERE id IN (
+           SELECT id
+             FROM webhook_inbox
+            WHERE status = 'processing'
+              AND next_attempt_at <= now()
+              AND attempts >= :max_attempts
+              FOR UPDATE SKIP LOCKED
+     )
+ RETURNING id
+""")
+
+_DONE_SQL = text("""
+    UPDATE webhook_inbox
+       SET status = 'done', processed_at = now(), last_error = NULL
+     WHERE id = :id
+""")
+
+_RETRY_SQL = text("""
+    UPDATE webhook_inbox
+       SET status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'pending' END,
+           next_attempt_at = now() + make_interval(secs => :delay_seconds),
+           last_error = :error
+     WHERE id = :id
+ RETURNING status
+""")
+
+
+def enqueue_webhook(
+    db: Session,
+    provider: str,
+    payload: Dict[str, Any],
+    transaction_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    event_timestamp: Optional[datetime] = None
+) -> WebhookInbox:
+    """Grava o webhook validado (um INSERT + commit) e acorda os workers locais"""
+    entry = WebhookInbox(
+        provider=provider,
+        transaction_id=transaction_id,
+        event_type=event_type,
+        event_timestamp=event_timestamp,
+        payload=payload,
+        status="pending"
+    )
+    db.add(entry)
+    db.commit()
+
+    webhook_inbox_worker.notify()
+    return entry
+
+
+class WebhookInboxWorker:
+    """🧵 Pool de workers que consome a ``webhook_inbox``"""
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        concurrency: int = 4,
+        max_attempts: int = 5,
+        poll_interval: float = 2.0,
+        lease_seconds: int = 120,
+        base_retry_delay: float = 5.0,
+        max_retry_delay: float = 600.0
+    ):
+        self._session_factory = session_factory
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.base_retry_delay = base_retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self._handler: Optional[WebhookHandler] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def _new_session(self) -> Session:
+        if self._session_factory is None:
+            from database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def start(self, handler: WebhookHandler) -> None:
+        """Inicia ``concurrency`` workers no event loop atual"""
+        if self._running:
+            return
+
+        self._handler = handler
+        self._wakeup = asyncio.Event()
+        self._running = True
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(i), name=f"webhook-inbox-{i}")
+            for i in range(self.concurrency)
+        ]
+        logger.info(f"📥 Webhook inbox iniciado com {self.concurrency} worker(s)")
+
+    async def stop(self) -> None:
+        """Para os workers; linhas em andamento voltam a ficar elegíveis pelo lease"""
+        if not self._running:
+            return
+
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("📥 Webhook inbox parado")
+
+    def notify(self) -> None:
+        """Acorda os workers ociosos (novo webhook gravado neste processo)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _retry_delay(self, attempts: int) -> float:
+        return min(self.base_retry_delay * (2 ** (attempts - 1)), self.max_retry_delay)
+
+    # --- Operações de banco (síncronas, executadas em threads) ---
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        db = self._new_session()
+        try:
+            exhausted = db.execute(_EXPIRE_EXHAUSTED_SQL, {"max_attempts": self.max_attempts}).scalars().all()
+            for entry_id in exhausted:
+                logger.error(f"❌ Webhook inbox {entry_id}: lease expirado sem tentativas restantes, marcado como failed")
+            row = db.execute(_CLAIM_SQL, {
+                "lease_seconds": self.lease_seconds,
+                "max_attempts": self.max_attempts
+            }).mappings().first()
+            db.commit()
+            return dict(row) if row else None
+        finally:
+            db.close()
+
+    def _mark_done(self, entry_id) -> None:
+        db = self._new_session()
+        try:
+            db.execute(_DONE_SQL, {"id": entry_id})
+            db.commit()
+        finally:
+            db.close()
+
+    def _mark_failed_attempt(self, entry: Dict[str, Any], error: str) -> str:
+        db = self._new_session()
+        try:
+            status = db.execute(_RETRY_SQL, {
+                "id": entry["id"],
+                "max_attempts": self.max_attempts,
+                "delay_seconds": self._retry_delay(entry["attempts"]),
+                "error": error[:2000]
+            }).scalar()
+            db.commit()
+            return status
+        finally:
+            db.close()
+
+    # --- Loop dos workers ---
+
+    async def process_next(self) -> bool:
+        """Reivindica e processa uma linha. Retorna False se a fila estava vazia."""
+        entry = await asyncio.to_thread(self._claim)
+        if entry is None:
+            return False
+
+        try:
+            await self._handler(entry)
+        except Exception as e:
+            status = await asyncio.to_thread(self._mark_failed_attempt, entry, str(e))
+            logger.error(
+                f"❌ Webhook {entry['provider']} {entry['transaction_id']} falhou "
+                f"(tentativa {entry['attempts']}/{self.max_attempts}, status={status}): {e}"
+            )
+        else:
+            await asyncio.to_thread(self._mark_done, entry["id"])
+        return True
+
+    async def _worker_loop(self, index: int) -> None:
+        while self._running:
+            try:
+                if await self.process_next():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Webhook inbox worker {index}: {e}")
+
+            # Fila vazia (ou erro de banco): espera notificação local ou o próximo poll
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+def _build_worker() -> WebhookInboxWorker:
+    from config.settings import settings
+    return WebhookInboxWorker(
+        concurrency=settings.WEBHOOK_INBOX_WORKERS,
+        max_attempts=settings.WEBHOOK_INBOX_MAX_ATTEMPTS,
+        poll_interval=settings.WEBHOOK_INBOX_POLL_INTERVAL
+    )
+
+
+# === Instância Global ===
+webhook_inbox_worker = _build_worker()
@@ -1,10 +1,15 @@
 # 🔐 Serviço Completo de Validação de Webhooks
 
+import codecs
 import hmac
 import hashlib
+import ipaddress
 import json
+import os
 import time
 import logging
+import threading
+from collections import OrderedDict
 from typing import Dict, Any, Optional, List, Tuple, Union
 from datetime import datetime, timedelta
 from dataclasses import dataclass, field
@@ -74,119 +79,427 @@ class WebhookValidationResult:
     # Erros
     errors: List[str] = field(default_factory=list)
     warnings: List[str] = field(default_factory=list)
+    
+    # Corpo já parseado (reaproveitado pelo handler)
+    payload_data: Optional[Dict[str, Any]] = None
+    
+    # ID registrado na proteção contra replay (liberado se o webhook não for persistido)
+    replay_id: Optional[str] = None
+
+class RedisReplayBackend:
+    """Backend compartilhado via Redis (``SET key 1 NX EX ttl``)"""
+    
+    def __init__(self, client, prefix: str = "webhook:replay:"):
+        self._client = client
+        self._prefix = prefix
+    
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisReplayBackend":
+        import redis  # Dependência opcional
+        return cls(redis.Redis.from_url(url), **kwargs)
+    
+    def check_and_set(self, webhook_id: str, ttl_seconds: int) -> bool:
+        """Retorna True se o ID era inédito (e foi registrado)"""
+        return bool(self._client.set(f"{self._prefix}{webhook_id}", 1, nx=True, ex=ttl_seconds))
+    
+    def forget(self, webhook_id: str) -> None:
+        """Remove o registro do ID"""
+        self._client.delete(f"{self._prefix}{webhook_id}")
+
+class PostgresReplayBackend:
+    """Backend compartilhado via tabela ``webhook_replay_ids`` (chave primária = ID)"""
+    
+    # Linha expirada pode ser reaproveitada; linha válida faz o INSERT não retornar nada
+    _CHECK_AND_SET_SQL = """
+        INSERT INTO webhook_replay_ids (webhook_id, expires_at)
+        VALUES (:webhook_id, now() + make_interval(secs => :ttl_seconds))
+        ON CONFLICT (webhook_id) DO UPDATE
+            SET expires_at = EXCLUDED.expires_at
+            WHERE webhook_replay_ids.expires_at < now()
+        RETURNING webhook_id
+    """
+    _PURGE_SQL = "DELETE FROM webhook_replay_ids WHERE expires_at < now()"
+    _FORGET_SQL = "DELETE FROM webhook_replay_ids WHERE webhook_id = :webhook_id"
+    
+    def __init__(self, session_factory=None, purge_every: int = 1000):
+        self._session_factory = session_factory
+        self._purge_every = purge_every
+        self._inserts = 0
+    
+    def _new_session(self):
+        if self._session_factory is None:
+            from database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+    
+    def check_and_set(self, webhook_id: str, ttl_seconds: int) -> bool:
+        from sqlalchemy import text
+        
+        db = self._new_session()
+        try:
+            inserted = db.execute(
+                text(self._CHECK_AND_SET_SQL),
+                {"webhook_id": webhook_id, "ttl_seconds": ttl_seconds}
+            ).first() is not None
+            
+            # Limpeza amortizada das linhas expiradas
+            self._inserts += 1
+            if self._inserts % self._purge_every == 0:
+                db.execute(text(self._PURGE_SQL))
+            
+            db.commit()
+            return inserted
+        finally:
+            db.close()
+    
+    def forget(self, webhook_id: str) -> None:
+        """Remove o registro do ID"""
+        from sqlalchemy import text
+        
+        db = self._new_session()
+        try:
+            db.execute(text(self._FORGET_SQL), {"webhook_id": webhook_id})
+            db.commit()
+        finally:
+            db.close()
 
 class WebhookReplayProtection:
-    """🛡️ Proteção contra replay attacks"""
+    """🛡️ Proteção contra replay attacks
     
-    def __init__(self, max_age: int = 300):
+    Cache local com expiração O(1) amortizada: como o TTL é fixo, a ordem de
+    inserção é a ordem de expiração, e só as entradas vencidas do início do
+    ``OrderedDict`` são removidas. ``max_entries`` limita a memória (descarta
+    as mais antigas). Um ``backend`` opcional (Redis/Postgres) estende a
+    proteção entre workers e reinícios."""
+    
+    def __init__(self, max_age: int = 300, max_entries: int = 100_000, backend=None):
         self.max_age = max_age
-        self._processed_webhooks: Dict[str, datetime] = {}
+        self.max_entries = max_entries
+        self.backend = backend
+        self._processed_webhooks: "OrderedDict[str, float]" = OrderedDict()  # webhook_id -> expira em (monotonic)
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._processed_webhooks)
     
-    def is_replay(self, webhook_id: str, timestamp: datetime) -> bool:
-        """Verifica se é um replay attack"""
+    def is_replay(self, webhook_id: str) -> bool:
+        """Verifica se é um replay attack (e registra o ID se for inédito).
         
-        # Limpa webhooks antigos
-        self._cleanup_old_webhooks()
+        Verificação e registro locais acontecem sob o mesmo lock: duas entregas
+        simultâneas do mesmo ID nunca passam ambas. Se o backend compartilhado
+        falhar, o registro local é desfeito e o erro sobe (o webhook é recusado
+        e o provedor reenvia depois)."""
         
-        # Verifica se já foi processado
-        if webhook_id in self._processed_webhooks:
-            logger.warning(f"🚨 Replay attack detected: {webhook_id}")
-            return True
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            
+            # Verifica se já foi processado (ou está sendo) por este processo
+            if webhook_id in self._processed_webhooks:
+                logger.warning(f"🚨 Replay attack detected: {webhook_id}")
+                return True
+            self._remember(webhook_id, now)
+        
+        # Verifica no backend compartilhado (outros workers / antes do restart)
+        if self.backend is not None:
+            try:
+                seen_elsewhere = not self.backend.check_and_set(webhook_id, self.max_age)
+            except Exception as e:
+                logger.error(f"❌ Replay backend error for {webhook_id}: {e}")
+                with self._lock:
+                    self._processed_webhooks.pop(webhook_id, None)
+                raise
+            if seen_elsewhere:
+                logger.warning(f"🚨 Replay attack detected (shared store): {webhook_id}")
+                return True
         
-        # Registra webhook
-        self._processed_webhooks[webhook_id] = timestamp
         return False
     
-    def _cleanup_old_webhooks(self):
-        """Remove webhooks antigos do cache"""
-        cutoff = datetime.now() - timedelta(seconds=self.max_age)
-        
-        old_webhooks = [
-            webhook_id for webhook_id, timestamp in self._processed_webhooks.items()
-            if timestamp < cutoff
-        ]
-        
-        for webhook_id in old_webhooks:
-            del self._processed_webhooks[webhook_id]
+    def forget(self, webhook_id: str) -> None:
+        """Desfaz o registro de um ID aceito cujo webhook não chegou a ser persistido.
+        
+        Sem isso, a reentrega do provedor seria recusada como replay. Falha no
+        backend só é logada: o pior caso é o comportamento anterior."""
+        with self._lock:
+            self._processed_webhooks.pop(webhook_id, None)
+        
+        if self.backend is not None:
+            try:
+                self.backend.forget(webhook_id)
+            except Exception as e:
+                logger.error(f"❌ Replay backend error forgetting {webhook_id}: {e}")
+    
+    def _remember(self, webhook_id: str, now: float):
+        """Registra o ID (chamar com ``self._lock`` adquirido)"""
+        self._processed_webhooks[webhook_id] = now + self.max_age
+        self._processed_webhooks.move_to_end(webhook_id)
+        while len(self._processed_webhooks) > self.max_entries:
+            self._processed_webhooks.popitem(last=False)
+    
+    def _evict_expired(self, now: float):
+        """Remove apenas as entradas vencidas do início (mais antigas)"""
+        entries = self._processed_webhooks
+        while entries:
+            if next(iter(entries.values())) > now:
+                break
+            entries.popitem(last=False)
 
-class WebhookValidator:
-    """🔐 Validador completo de webhooks"""
+def build_replay_protection() -> WebhookReplayProtection:
+    """Cria a proteção conforme ``WEBHOOK_REPLAY_BACKEND`` (memory | redis | postgres)"""
     
-    def __init__(self):
-        self._configs: Dict[WebhookProvider, WebhookValidationConfig] = {}
-        self._replay_protection = WebhookReplayProtection()
-        logger.info("🔐 WebhookValidator initialized")
+    backend_name = os.getenv("WEBHOOK_REPLAY_BACKEND", "memory").lower()
+    max_age = int(os.getenv("WEBHOOK_REPLAY_MAX_AGE", "300"))
+    max_entries = int(os.getenv("WEBHOOK_REPLAY_MAX_ENTRIES", "100000"))
     
-    def register_provider(self, config: WebhookValidationConfig):
-        """Registra configuração de um provedor"""
-        self._configs[config.provider] = config
-        logger.info(f"🔐 Provider registered: {config.provider.value}")
+    backend = None
+    try:
+        if backend_name == "redis":
+            backend = RedisReplayBackend.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        elif backend_name == "postgres":
+            backend = PostgresReplayBackend()
+    except Exception as e:
+        logger.error(f"❌ Could not initialize replay backend '{backend_name}': {e}")
     
-    def validate_webhook(
+    return WebhookReplayProtection(max_age=max_age, max_entries=max_entries, backend=backend)
+
+def _parse_timestamp(timestamp_str: str) -> datetime:
+    """Parse timestamp em diferentes formatos"""
+    
+    # Unix timestamp
+    if timestamp_str.isdigit():
+        return datetime.fromtimestamp(int(timestamp_str))
+    
+    # ISO format
+    try:
+        return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+    except:
+        pass
+    
+    # RFC 2822
+    try:
+        from email.utils import parsedate_to_datetime
+        return parsedate_to_datetime(timestamp_str)
+    except:
+        pass
+    
+    raise ValueError(f"Unsupported timestamp format: {timestamp_str}")
+
+def _compile_allowlist(allowed_ips: List[str]) -> Dict[int, Tuple[Tuple[int, frozenset], ...]]:
+    """Agrupa as redes permitidas por versão de IP e máscara: ``{versão: ((máscara, {redes}), ...)}``.
+    
+    A consulta aplica cada máscara distinta ao endereço e procura a rede num
+    ``frozenset``: o custo depende de quantos tamanhos de prefixo existem
+    (no máximo 33/129), não de quantas redes estão na lista."""
+    grouped: Dict[int, Dict[int, set]] = {}
+    for ip in allowed_ips:
+        network = ipaddress.ip_network(ip, strict=False)
+        grouped.setdefault(network.version, {}).setdefault(int(network.netmask), set()).add(int(network.network_address))
+    return {
+        version: tuple((mask, frozenset(networks)) for mask, networks in sorted(by_mask.items(), reverse=True))
+        for version, by_mask in grouped.items()
+    }
+
+def _extract_metadata(payload_data: Dict[str, Any], result: WebhookValidationResult):
+    """Extrai metadados do payload"""
+    
+    # ID da transação (varia por provedor)
+    for field_name in ("id", "transaction_id", "payment_id", "order_id"):
+        if field_name in payload_data:
+            result.transaction_id = str(payload_data[field_name])
+            break
+    
+    # Tipo de evento
+    for field_name in ("type", "event", "event_type", "action"):
+        if field_name in payload_data:
+            result.event_type = str(payload_data[field_name])
+            break
+
+def _generate_webhook_id(result: WebhookValidationResult) -> str:
+    """Gera ID único para o webhook (transaction_id + timestamp + event_type)"""
+    components = [
+        result.transaction_id or "unknown",
+        str(result.timestamp or datetime.now()),
+        result.event_type or "unknown"
+    ]
+    return hashlib.sha256("|".join(components).encode()).hexdigest()[:16]
+
+# === Validações específicas por provedor ===
+
+def _validate_sicredi(payload_data: Dict[str, Any], result: WebhookValidationResult):
+    """Validações específicas do Sicredi"""
+    
+    # Verifica campos obrigatórios
+    for field_name in ("id", "status", "amount"):
+        if field_name not in payload_data:
+            result.warnings.append(f"Sicredi: Missing field {field_name}")
+    
+    # Valida status
+    status = payload_data.get("status")
+    if status and status not in ("approved", "pending", "failed", "cancelled"):
+        result.warnings.append(f"Sicredi: Invalid status {status}")
+
+def _validate_stone(payload_data: Dict[str, Any], result: WebhookValidationResult):
+    """Validações específicas do Stone"""
+    
+    # Verifica estrutura do Stone
+    if "transaction" in payload_data and not isinstance(payload_data["transaction"], dict):
+        result.warnings.append("Stone: Invalid transaction structure")
+    
+    # Valida eventos do Stone
+    event_type = result.event_type
+    if event_type and event_type not in ("transaction.approved", "transaction.failed", "transaction.cancelled"):
+        result.warnings.append(f"Stone: Unknown event type {event_type}")
+
+def _validate_pagseguro(payload_data: Dict[str, Any], result: WebhookValidationResult):
+    """Validações específicas do PagSeguro"""
+    
+    # Verifica notificationCode
+    if "notificationCode" not in payload_data:
+        result.warnings.append("PagSeguro: Missing notificationCode")
+    
+    # Verifica notificationType
+    notification_type = payload_data.get("notificationType")
+    if notification_type and notification_type not in ("transaction", "preApproval"):
+        result.warnings.append(f"PagSeguro: Invalid notification type {notification_type}")
+
+def _validate_mercadopago(payload_data: Dict[str, Any], result: WebhookValidationResult):
+    """Validações específicas do MercadoPago"""
+    
+    # Verifica action
+    action = payload_data.get("action")
+    if action and action not in ("payment.created", "payment.updated"):
+        result.warnings.append(f"MercadoPago: Unknown action {action}")
+    
+    # Verifica data_id
+    if "data" in payload_data and "id" not in payload_data["data"]:
+        result.warnings.append("MercadoPago: Missing data.id")
+
+def _validate_pagbank(payload_data: Dict[str, Any], result: WebhookValidationResult):
+    """Validações específicas do PagBank"""
+    
+    if "charges" in payload_data and not isinstance(payload_data["charges"], list):
+        result.warnings.append("PagBank: Invalid charges structure")
+
+_PROVIDER_CHECKS = {
+    WebhookProvider.SICREDI: _validate_sicredi,
+    WebhookProvider.STONE: _validate_stone,
+    WebhookProvider.PAGSEGURO: _validate_pagseguro,
+    WebhookProvider.MERCADOPAGO: _validate_mercadopago,
+    WebhookProvider.PAGBANK: _validate_pagbank,
+}
+
+_HMAC_DIGESTS = {
+    SignatureAlgorithm.HMAC_SHA256: hashlib.sha256,
+    SignatureAlgorithm.HMAC_SHA1: hashlib.sha1,
+}
+
+class CompiledWebhookValidator:
+    """⚙️ Pipeline de validação pré-compilado para um provedor
+    
+    Tudo que depende só da configuração é resolvido uma vez, no registro:
+    redes de IP já parseadas e indexadas por prefixo, nomes de header normalizados, objeto HMAC já
+    chaveado (cada requisição só faz ``copy()``) e a validação específica do
+    provedor. A assinatura é verificada sobre os bytes recebidos e o corpo é
+    parseado uma única vez, depois da assinatura; o dict resultante fica em
+    ``result.payload_data`` para o handler."""
+    
+    def __init__(self, config: WebhookValidationConfig, replay_protection: WebhookReplayProtection):
+        self.config = config
+        self._replay_protection = replay_protection
+        
+        self._allowlist = _compile_allowlist(config.allowed_ips)
+        self._signature_header = config.signature_header.lower()
+        self._timestamp_header = config.timestamp_header.lower() if config.timestamp_header else None
+        self._signature_prefix = config.signature_prefix or ""
+        self._utf8 = codecs.lookup(config.encoding).name == "utf-8"
+        
+        digest = _HMAC_DIGESTS.get(config.algorithm)
+        self._hmac = hmac.new(config.secret_key.encode('utf-8'), digestmod=digest) if digest else None
+        self._provider_check = _PROVIDER_CHECKS.get(config.provider)
+    
+    def validate(
         self,
-        provider: WebhookProvider,
         payload: Union[str, bytes, Dict[str, Any]],
         headers: Dict[str, str],
         client_ip: Optional[str] = None
     ) -> WebhookValidationResult:
-        """🔍 Valida webhook completo"""
+        """🔍 Executa o pipeline: IP → timestamp → assinatura → parse → replay → provedor"""
         
-        result = WebhookValidationResult(
-            is_valid=False,
-            provider=provider
-        )
+        config = self.config
+        result = WebhookValidationResult(is_valid=False, provider=config.provider)
         
         try:
-            # Verifica se provedor está configurado
-            if provider not in self._configs:
-                result.errors.append(f"Provider {provider.value} not configured")
-                return result
-            
-            config = self._configs[provider]
+            # Headers HTTP não diferenciam maiúsculas (Starlette já entrega em minúsculas)
+            headers = {name.lower(): value for name, value in headers.items()}
             
             # 1. Validação de IP
-            if not self._validate_ip(client_ip, config, result):
+            if not self._validate_ip(client_ip, result):
                 return result
             
-            # 2. Extração de dados do payload
-            payload_data, payload_str = self._normalize_payload(payload, config)
-            
-            # 3. Extração de metadados
-            self._extract_metadata(payload_data, result)
-            
-            # 4. Validação de timestamp
-            if not self._validate_timestamp(headers, config, result):
+            # 2. Validação de timestamp
+            if not self._validate_timestamp(headers, result):
                 return result
             
-            # 5. Validação de assinatura
-            if not self._validate_signature(payload_str, headers, config, result):
+            # 3. Validação de assinatura (sobre os bytes, antes de qualquer parse)
+            payload_bytes, payload_data = self._to_bytes(payload)
+            if not self._validate_signature(payload_bytes, headers, result):
                 return result
             
-            # 6. Proteção contra replay
-            if not self._validate_replay(payload_data, result, config):
-                return result
+            # 4. Parse único do corpo + metadados
+            if payload_data is None and not payload_bytes:
+                payload_data = {}
+            elif payload_data is None:
+                try:
+                    payload_data = json.loads(payload_bytes)
+                except json.JSONDecodeError:
+                    payload_data = {"raw": payload_bytes.decode('utf-8')}
+            result.payload_data = payload_data
+            _extract_metadata(payload_data, result)
+            
+            # 5. Proteção contra replay
+            if not config.allow_replay:
+                webhook_id = _generate_webhook_id(result)
+                if self._replay_protection.is_replay(webhook_id):
+                    result.errors.append("Replay attack detected")
+                    result.replay_check_passed = False
+                    return result
+                result.replay_check_passed = True
+                result.replay_id = webhook_id
             
-            # 7. Validações específicas do provedor
-            self._provider_specific_validation(payload_data, config, result)
+            # 6. Validações específicas do provedor
+            if self._provider_check:
+                self._provider_check(payload_data, result)
             
             result.is_valid = True
-            logger.info(f"✅ Webhook validated successfully: {provider.value}")
+            logger.info(f"✅ Webhook validated successfully: {config.provider.value}")
             
         except Exception as e:
             logger.error(f"❌ Webhook validation error: {e}")
             result.errors.append(f"Validation error: {str(e)}")
+            if result.replay_id:
+                # Recusado depois de registrar o ID: a reentrega não pode virar replay
+                self._replay_protection.forget(result.replay_id)
+                result.replay_id = None
         
         return result
     
-    def _validate_ip(
-        self,
-        client_ip: Optional[str],
-        config: WebhookValidationConfig,
-        result: WebhookValidationResult
-    ) -> bool:
-        """Valida IP do cliente"""
+    def _to_bytes(self, payload: Union[str, bytes, Dict[str, Any]]) -> Tuple[bytes, Optional[Dict[str, Any]]]:
+        """Bytes assinados (UTF-8) e, se o payload já veio como dict, o próprio dict"""
+        
+        if isinstance(payload, bytes):
+            if self._utf8:
+                return payload, None
+            return payload.decode(self.config.encoding).encode('utf-8'), None
+        
+        if isinstance(payload, dict):
+            return json.dumps(payload, separators=(',', ':'), sort_keys=True).encode('utf-8'), payload
+        
+        return str(payload).encode('utf-8'), None
+    
+    def _validate_ip(self, client_ip: Optional[str], result: WebhookValidationResult) -> bool:
+        """Valida IP do cliente contra as redes pré-parseadas (busca por prefixo)"""
         
-        if not config.allowed_ips:
+        if not self._allowlist:
             return True  # Sem restrição de IP
         
         if not client_ip:
@@ -194,93 +507,47 @@ class WebhookValidator:
             result.ip_valid = False
             return False
         
-        # Remove porta se presente
-        ip_clean = client_ip.split(':')[0]
-        
-        if ip_clean not in config.allowed_ips:
-            result.errors.append(f"IP not allowed: {ip_clean}")
+        # Aceita IPv6 puro ou IPv4 com porta
+        try:
+            address = ipaddress.ip_address(client_ip)
+        except ValueError:
+            try:
+                address = ipaddress.ip_address(client_ip.rsplit(':', 1)[0])
+            except ValueError:
+                address = None
+        
+        if address is None or not self._ip_allowed(address):
+            result.errors.append(f"IP not allowed: {client_ip}")
             result.ip_valid = False
-            logger.warning(f"🚨 Unauthorized IP: {ip_clean}")
+            logger.warning(f"🚨 Unauthorized IP: {client_ip}")
             return False
         
         result.ip_valid = True
         return True
     
-    def _normalize_payload(
-        self,
-        payload: Union[str, bytes, Dict[str, Any]],
-        config: WebhookValidationConfig
-    ) -> Tuple[Dict[str, Any], str]:
-        """Normaliza payload para validação"""
-        
-        # Converte para string se necessário
-        if isinstance(payload, bytes):
-            payload_str = payload.decode(config.encoding)
-        elif isinstance(payload, dict):
-            payload_str = json.dumps(payload, separators=(',', ':'), sort_keys=True)
-        else:
-            payload_str = str(payload)
-        
-        # Parse para dict se for JSON
-        try:
-            if isinstance(payload, (str, bytes)):
-                payload_data = json.loads(payload_str)
-            else:
-                payload_data = payload
-        except json.JSONDecodeError:
-            payload_data = {"raw": payload_str}
-        
-        return payload_data, payload_str
+    def _ip_allowed(self, address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> bool:
+        value = int(address)
+        return any(value & mask in networks for mask, networks in self._allowlist.get(address.version, ()))
     
-    def _extract_metadata(
-        self,
-        payload_data: Dict[str, Any],
-        result: WebhookValidationResult
-    ):
-        """Extrai metadados do payload"""
-        
-        # ID da transação (varia por provedor)
-        transaction_fields = ["id", "transaction_id", "payment_id", "order_id"]
-        for field in transaction_fields:
-            if field in payload_data:
-                result.transaction_id = str(payload_data[field])
-                break
-        
-        # Tipo de evento
-        event_fields = ["type", "event", "event_type", "action"]
-        for field in event_fields:
-            if field in payload_data:
-                result.event_type = str(payload_data[field])
-                break
-    
-    def _validate_timestamp(
-        self,
-        headers: Dict[str, str],
-        config: WebhookValidationConfig,
-        result: WebhookValidationResult
-    ) -> bool:
+    def _validate_timestamp(self, headers: Dict[str, str], result: WebhookValidationResult) -> bool:
         """Valida timestamp do webhook"""
         
+        config = self.config
         if not config.require_timestamp:
             return True
         
-        timestamp_header = config.timestamp_header
-        if not timestamp_header or timestamp_header not in headers:
-            if config.require_timestamp:
-                result.errors.append("Timestamp header missing")
-                result.timestamp_valid = False
-                return False
-            return True
+        timestamp_str = headers.get(self._timestamp_header) if self._timestamp_header else None
+        if timestamp_str is None:
+            result.errors.append("Timestamp header missing")
+            result.timestamp_valid = False
+            return False
         
         try:
-            timestamp_str = headers[timestamp_header]
-            
-            # Tenta diferentes formatos de timestamp
-            timestamp = self._parse_timestamp(timestamp_str)
+            timestamp = _parse_timestamp(timestamp_str)
             result.timestamp = timestamp
             
             # Verifica se não é muito antigo ou futuro
-            now = datetime.now()
+            now = datetime.now(timestamp.tzinfo) if timestamp.tzinfo else datetime.now()
             diff = abs((now - timestamp).total_seconds())
             
             if diff > config.max_timestamp_diff:
@@ -296,218 +563,84 @@ class WebhookValidator:
             result.timestamp_valid = False
             return False
     
-    def _parse_timestamp(self, timestamp_str: str) -> datetime:
-        """Parse timestamp em diferentes formatos"""
-        
-        # Unix timestamp
-        if timestamp_str.isdigit():
-            return datetime.fromtimestamp(int(timestamp_str))
-        
-        # ISO format
-        try:
-            return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-        except:
-            pass
-        
-        # RFC 2822
-        try:
-            from email.utils import parsedate_to_datetime
-            return parsedate_to_datetime(timestamp_str)
-        except:
-            pass
-        
-        raise ValueError(f"Unsupported timestamp format: {timestamp_str}")
-    
     def _validate_signature(
         self,
-        payload_str: str,
+        payload_bytes: bytes,
         headers: Dict[str, str],
-        config: WebhookValidationConfig,
         result: WebhookValidationResult
     ) -> bool:
         """Valida assinatura do webhook"""
         
-        signature_header = config.signature_header
-        if signature_header not in headers:
-            result.errors.append(f"Signature header missing: {signature_header}")
+        received_signature = headers.get(self._signature_header)
+        if received_signature is None:
+            result.errors.append(f"Signature header missing: {self.config.signature_header}")
             result.signature_valid = False
             return False
         
-        received_signature = headers[signature_header]
-        
         # Remove prefixo se configurado
-        if config.signature_prefix:
-            if not received_signature.startswith(config.signature_prefix):
-                result.errors.append(f"Invalid signature prefix")
+        if self._signature_prefix:
+            if not received_signature.startswith(self._signature_prefix):
+                result.errors.append("Invalid signature prefix")
                 result.signature_valid = False
                 return False
-            received_signature = received_signature[len(config.signature_prefix):]
+            received_signature = received_signature[len(self._signature_prefix):]
+        
+        if self._hmac is None:
+            raise ValueError(f"Unsupported algorithm: {self.config.algorithm}")
         
-        # Calcula assinatura esperada
-        expected_signature = self._calculate_signature(payload_str, config, headers)
+        # Calcula assinatura esperada a partir do HMAC já chaveado
+        mac = self._hmac.copy()
+        mac.update(payload_bytes)
         
-        # Compara assinaturas
-        if not hmac.compare_digest(received_signature, expected_signature):
+        if not hmac.compare_digest(received_signature, mac.hexdigest()):
             result.errors.append("Signature mismatch")
             result.signature_valid = False
-            logger.warning(f"🚨 Signature mismatch for {config.provider.value}")
+            logger.warning(f"🚨 Signature mismatch for {self.config.provider.value}")
             return False
         
         result.signature_valid = True
         return True
+
+class WebhookValidator:
+    """🔐 Validador completo de webhooks
     
-    def _calculate_signature(
-        self,
-        payload_str: str,
-        config: WebhookValidationConfig,
-        headers: Dict[str, str]
-    ) -> str:
-        """Calcula assinatura baseada no algoritmo configurado"""
-        
-        if config.algorithm == SignatureAlgorithm.HMAC_SHA256:
-            return self._hmac_signature(payload_str, config.secret_key, hashlib.sha256)
-        
-        elif config.algorithm == SignatureAlgorithm.HMAC_SHA1:
-            return self._hmac_signature(payload_str, config.secret_key, hashlib.sha1)
-        
-        else:
-            raise ValueError(f"Unsupported algorithm: {config.algorithm}")
-    
-    def _hmac_signature(self, payload: str, secret: str, hash_func) -> str:
-        """Calcula assinatura HMAC"""
-        signature = hmac.new(
-            secret.encode('utf-8'),
-            payload.encode('utf-8'),
-            hash_func
-        ).hexdigest()
-        return signature
-    
-    def _validate_replay(
-        self,
-        payload_data: Dict[str, Any],
-        result: WebhookValidationResult,
-        config: WebhookValidationConfig
-    ) -> bool:
-        """Valida proteção contra replay"""
-        
-        if config.allow_replay:
-            return True
-        
-        # Gera ID único do webhook
-        webhook_id = self._generate_webhook_id(payload_data, result)
-        
-        if self._replay_protection.is_replay(webhook_id, result.timestamp or datetime.now()):
-            result.errors.append("Replay attack detected")
-            result.replay_check_passed = False
-            return False
-        
-        result.replay_check_passed = True
-        return True
+    Mantém um ``CompiledWebhookValidator`` por provedor, recompilado sempre
+    que a configuração do provedor é registrada novamente."""
     
-    def _generate_webhook_id(
+    def __init__(self, replay_protection: Optional[WebhookReplayProtection] = None):
+        self._configs: Dict[WebhookProvider, WebhookValidationConfig] = {}
+        self._compiled: Dict[WebhookProvider, CompiledWebhookValidator] = {}
+        self._replay_protection = replay_protection or WebhookReplayProtection()
+        logger.info("🔐 WebhookValidator initialized")
+    
+    def register_provider(self, config: WebhookValidationConfig):
+        """Registra (ou substitui) a configuração de um provedor e compila o pipeline"""
+        self._compiled[config.provider] = CompiledWebhookValidator(config, self._replay_protection)
+        self._configs[config.provider] = config
+        logger.info(f"🔐 Provider registered: {config.provider.value}")
+    
+    def validate_webhook(
         self,
-        payload_data: Dict[str, Any],
-        result: WebhookValidationResult
-    ) -> str:
-        """Gera ID único para o webhook"""
+        provider: WebhookProvider,
+        payload: Union[str, bytes, Dict[str, Any]],
+        headers: Dict[str, str],
+        client_ip: Optional[str] = None
+    ) -> WebhookValidationResult:
+        """🔍 Valida webhook completo"""
         
-        # Usa transaction_id + timestamp + event_type
-        components = [
-            result.transaction_id or "unknown",
-            str(result.timestamp or datetime.now()),
-            result.event_type or "unknown"
-        ]
+        compiled = self._compiled.get(provider)
+        if compiled is None:
+            result = WebhookValidationResult(is_valid=False, provider=provider)
+            result.errors.append(f"Provider {provider.value} not configured")
+            return result
         
-        webhook_id = "|".join(components)
-        return hashlib.sha256(webhook_id.encode()).hexdigest()[:16]
+        return compiled.validate(payload, headers, client_ip)
     
-    def _provider_specific_validation(
-        self,
-        payload_data: Dict[str, Any],
-        config: WebhookValidationConfig,
-        result: WebhookValidationResult
-    ):
-        """Validações específicas por provedor"""
-        
-        if config.provider == WebhookProvider.SICREDI:
-            self._validate_sicredi(payload_data, result)
-        
-        elif config.provider == WebhookProvider.STONE:
-            self._validate_stone(payload_data, result)
-        
-        elif config.provider == WebhookProvider.PAGSEGURO:
-            self._validate_pagseguro(payload_data, result)
-        
-        elif config.provider == WebhookProvider.MERCADOPAGO:
-            self._validate_mercadopago(payload_data, result)
-        
-        elif config.provider == WebhookProvider.PAGBANK:
-            self._validate_pagbank(payload_data, result)
-    
-    def _validate_sicredi(self, payload_data: Dict[str, Any], result: WebhookValidationResult):
-        """Validações específicas do Sicredi"""
-        
-        # Verifica campos obrigatórios
-        required_fields = ["id", "status", "amount"]
-        for field in required_fields:
-            if field not in payload_data:
-                result.warnings.append(f"Sicredi: Missing field {field}")
-        
-        # Valida status
-        valid_statuses = ["approved", "pending", "failed", "cancelled"]
-        status = payload_data.get("status")
-        if status and status not in valid_statuses:
-            result.warnings.append(f"Sicredi: Invalid status {status}")
-    
-    def _validate_stone(self, payload_data: Dict[str, Any], result: WebhookValidationResult):
-        """Validações específicas do Stone"""
-        
-        # Verifica estrutura do Stone
-        if "transaction" in payload_data:
-            transaction = payload_data["transaction"]
-            if not isinstance(transaction, dict):
-                result.warnings.append("Stone: Invalid transaction structure")
-        
-        # Valida eventos do Stone
-        valid_events = ["transaction.approved", "transaction.failed", "transaction.cancelled"]
-        event_type = result.event_type
-        if event_type and event_type not in valid_events:
-            result.warnings.append(f"Stone: Unknown event type {event_type}")
-    
-    def _validate_pagseguro(self, payload_data: Dict[str, Any], result: WebhookValidationResult):
-        """Validações específicas do PagSeguro"""
-        
-        # Verifica notificationCode
-        if "notificationCode" not in payload_data:
-            result.warnings.append("PagSeguro: Missing notificationCode")
-        
-        # Verifica notificationType
-        valid_types = ["transaction", "preApproval"]
-        notification_type = payload_data.get("notificationType")
-        if notification_type and notification_type not in valid_types:
-            result.warnings.append(f"PagSeguro: Invalid notification type {notification_type}")
-    
-    def _validate_mercadopago(self, payload_data: Dict[str, Any], result: WebhookValidationResult):
-        """Validações específicas do MercadoPago"""
-        
-        # Verifica action
-        valid_actions = ["payment.created", "payment.updated"]
-        action = payload_data.get("action")
-        if action and action not in valid_actions:
-            result.warnings.append(f"MercadoPago: Unknown action {action}")
-        
-        # Verifica data_id
-        if "data" in payload_data and "id" not in payload_data["data"]:
-            result.warnings.append("MercadoPago: Missing data.id")
-    
-    def _validate_pagbank(self, payload_data: Dict[str, Any], result: WebhookValidationResult):
-        """Validações específicas do PagBank"""
-        
-        # Validações específicas do PagBank
-        if "charges" in payload_data:
-            charges = payload_data["charges"]
-            if not isinstance(charges, list):
-                result.warnings.append("PagBank: Invalid charges structure")
+    def release_replay(self, result: WebhookValidationResult) -> None:
+        """Libera o ID de replay de um webhook validado que não foi persistido"""
+        if result.replay_id:
+            self._replay_protection.forget(result.replay_id)
+            result.replay_id = None
 
 # === Configurações Pré-definidas por Provedor ===
 
@@ -579,4 +712,4 @@ def get_pagbank_config(secret_key: str) -> WebhookValidationConfig:
     )
 
 # === Instância Global ===
-webhook_validator = WebhookValidator()
\ No newline at end of file
+webhook_validator = WebhookValidator(replay_protection=build_replay_protection())
\ No newline at end of file
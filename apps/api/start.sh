@@ -2,5 +2,7 @@
 (
   cd /app/api
   alembic upgrade head
+  # Limpa o diretório multiprocess do Prometheus antes de subir os workers
+  python -m config.prometheus
 )
 exec uvicorn api.main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
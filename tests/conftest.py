@@ -0,0 +1,117 @@
+# 🧪 Fixtures compartilhadas
+
+"""Fixtures dos testes que precisam de um Postgres real.
+
+Esses testes rodam só com ``TEST_DATABASE_URL`` definida (o schema ``public``
+desse banco é recriado a cada execução) e importam os módulos da API pelo
+caminho de produção (``models``, ``services...``), como os routers fazem::
+
+    TEST_DATABASE_URL=postgresql://... PYTHONPATH=apps/api python -m pytest tests
+
+Sem a variável os módulos de teste com banco são pulados.
+"""
+
+import importlib
+import importlib.abc
+import importlib.util
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "apps", "api")
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+
+class _ApiAliasFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """``apps.api.x`` vira o mesmo módulo que ``x`` (o nome usado pelos routers).
+
+    Sem isso um mesmo arquivo é carregado duas vezes quando testes antigos
+    (``from apps.api.services...``) e testes com banco rodam juntos, e as
+    métricas Prometheus são registradas em dobro."""
+
+    PREFIX = "apps.api."
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname.startswith(self.PREFIX):
+            return importlib.util.spec_from_loader(fullname, self)
+        return None
+
+    def create_module(self, spec):
+        return importlib.import_module(spec.name[len(self.PREFIX):])
+
+    def exec_module(self, module):
+        pass
+
+
+if TEST_DATABASE_URL:
+    # database.py lê DATABASE_URL no import
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+    if API_DIR not in sys.path:
+        sys.path.insert(0, API_DIR)
+    sys.meta_path.insert(0, _ApiAliasFinder())
+
+
+def requires_database() -> None:
+    """Pula o módulo de teste quando não há Postgres de teste configurado"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL não definida (testes com Postgres)", allow_module_level=True)
+
+
+@pytest.fixture(scope="session")
+def pg_engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL não definida (testes com Postgres)")
+    from sqlalchemy import text
+
+    import models  # noqa: F401 (registra as tabelas)
+    from database import Base, engine
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE; CREATE SCHEMA public"))
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(pg_engine):
+    """``SessionLocal`` com todas as tabelas vazias"""
+    from sqlalchemy import text
+
+    from database import Base, SessionLocal
+
+    tables = ", ".join(f'"{table.name}"' for table in Base.metadata.tables.values())
+    with pg_engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+    return SessionLocal
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+def create_tenant(db, cnpj: str = "12345678000199") -> SimpleNamespace:
+    """Tenant com um operador e dois serviços ativos (já commitados)"""
+    from models import Operator, Service, Tenant
+
+    tenant = Tenant(name="Tenant Teste", cnpj=cnpj)
+    db.add(tenant)
+    db.flush()
+    operator = Operator(tenant_id=tenant.id, name="Operador", email=f"op{cnpj}@example.com", password_hash="x")
+    services = [
+        Service(tenant_id=tenant.id, name="Crioterapia", price=50, duration_minutes=10, equipment_count=1),
+        Service(tenant_id=tenant.id, name="Bota de compressão", price=30, duration_minutes=10, equipment_count=1),
+    ]
+    db.add(operator)
+    db.add_all(services)
+    db.commit()
+    return SimpleNamespace(tenant=tenant, operator=operator, services=services)
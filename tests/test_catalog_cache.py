@@ -0,0 +1,110 @@
+# 🧪 Testes do cache do catálogo público do totem
+
+import pytest
+
+from apps.api.services.catalog import CatalogCache, catalog_cache, etag_matches, make_etag
+
+
+class TestCatalogCache:
+    """Testes do cache serializado + ETag de /services/public"""
+
+    def test_get_or_build_serializes_once(self):
+        cache = CatalogCache()
+        calls = []
+
+        def build():
+            calls.append(1)
+            return b'{"services":[]}'
+
+        first = cache.get_or_build("tenant", build)
+        second = cache.get_or_build("tenant", build)
+
+        assert first is second
+        assert first.etag == make_etag(b'{"services":[]}')
+        assert len(calls) == 1
+
+    def test_invalidate_drops_every_variant_of_the_tenant(self):
+        cache = CatalogCache()
+        cache.get_or_build("t1", lambda: b"a")
+        cache.get_or_build("t1", lambda: b"b", kind="bootstrap")
+        cache.get_or_build("t2", lambda: b"c")
+
+        cache.invalidate("t1")
+
+        assert cache.get("t1") is None
+        assert cache.get("t1", "bootstrap") is None
+        assert cache.get("t2").body == b"c"
+
+    def test_etag_depends_only_on_content(self):
+        assert make_etag(b"x") == make_etag(b"x")
+        assert make_etag(b"x") != make_etag(b"y")
+
+
+def test_etag_matches_if_none_match_forms():
+    etag = make_etag(b"x")
+
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"outro", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"outro"', etag)
+    assert not etag_matches(None, etag)
+
+
+# --- Invalidação pelos eventos da sessão (só com Postgres) ---
+
+@pytest.fixture
+def cached_tenant(db):
+    """Tenant commitado com o catálogo em cache"""
+    from conftest import create_tenant
+    from apps.api.services.catalog import register_catalog_invalidation
+
+    register_catalog_invalidation()
+    tenant = create_tenant(db)
+    catalog_cache.clear()
+    catalog_cache.get_or_build(tenant.tenant.id, lambda: b"catalogo")
+    yield tenant
+    catalog_cache.clear()
+
+
+def _is_cached(tenant):
+    return catalog_cache.get(tenant.tenant.id) is not None
+
+
+def test_committed_write_invalidates_catalog(db, cached_tenant):
+    cached_tenant.services[0].price = 60
+    db.flush()
+    assert _is_cached(cached_tenant)  # Só depois do commit
+
+    db.commit()
+    assert not _is_cached(cached_tenant)
+
+
+def test_rolled_back_write_keeps_catalog(db, cached_tenant):
+    cached_tenant.services[0].price = 60
+    db.flush()
+    db.rollback()
+    db.commit()  # Nada pendente: o commit seguinte não invalida
+
+    assert _is_cached(cached_tenant)
+
+
+def test_savepoint_rollback_keeps_outer_write_pending(db, cached_tenant):
+    cached_tenant.services[0].price = 60
+    db.flush()
+    with db.begin_nested() as savepoint:
+        cached_tenant.services[1].price = 70
+        db.flush()
+        savepoint.rollback()
+    assert _is_cached(cached_tenant)
+
+    db.commit()
+    assert not _is_cached(cached_tenant)
+
+
+def test_outer_rollback_after_savepoint_commit_keeps_catalog(db, cached_tenant):
+    with db.begin_nested():
+        cached_tenant.services[0].price = 60
+    db.rollback()
+    db.commit()
+
+    assert _is_cached(cached_tenant)
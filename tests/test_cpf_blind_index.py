@@ -0,0 +1,24 @@
+# 🧪 Testes do blind index de CPF
+
+from apps.api.security import cpf_blind_index, encrypt_data
+
+class TestCpfBlindIndex:
+    """O HMAC precisa ser determinístico e independente da formatação"""
+
+    def test_same_cpf_same_index_regardless_of_format(self):
+        assert cpf_blind_index("434.217.318-29") == cpf_blind_index("43421731829")
+        assert len(cpf_blind_index("43421731829")) == 64
+
+    def test_index_does_not_reveal_cpf_and_differs_between_cpfs(self):
+        index = cpf_blind_index("43421731829")
+        assert "43421731829" not in index
+        assert index != cpf_blind_index("52998224725")
+
+    def test_fernet_is_randomized_but_index_is_not(self):
+        assert encrypt_data("43421731829") != encrypt_data("43421731829")
+        assert cpf_blind_index("43421731829") == cpf_blind_index("43421731829")
+
+    def test_invalid_values_have_no_index(self):
+        assert cpf_blind_index(None) is None
+        assert cpf_blind_index("") is None
+        assert cpf_blind_index("123") is None
@@ -0,0 +1,159 @@
+# 🧪 Cadastro deduplicado de clientes e histórico de visitas (Postgres)
+
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event
+
+from conftest import create_tenant, requires_database
+
+requires_database()
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import get_db
+from models import CustomerProfile, Ticket
+from routers import customers
+from security import cpf_blind_index
+from services.customer_profiles import customer_key, upsert_customer, upsert_customers
+from services.offline import OfflineQueue
+
+CPF = "12345678909"
+OTHER_CPF = "98765432100"
+
+
+@pytest.fixture
+def client(session_factory):
+    app = FastAPI()
+    app.include_router(customers.router, prefix="/customers")
+
+    def _get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = _get_db
+    return TestClient(app)
+
+
+def test_upsert_customer_creates_then_updates_same_row(db):
+    tenant = create_tenant(db)
+
+    first = upsert_customer(db, tenant.tenant.id, "Maria", cpf=CPF, phone="11999990000")
+    second = upsert_customer(db, tenant.tenant.id, "Maria Silva", cpf="123.456.789-09")
+    db.commit()
+
+    assert first == second
+    customer = db.get(CustomerProfile, first)
+    assert (customer.name, customer.phone) == ("Maria Silva", "11999990000")  # Telefone ausente não apaga
+    assert customer.cpf_hash == cpf_blind_index(CPF)
+    assert upsert_customer(db, tenant.tenant.id, "Sem CPF") is None
+    assert upsert_customer(db, tenant.tenant.id, None, cpf=CPF) is None
+
+
+def test_same_cpf_in_other_tenant_is_another_customer(db):
+    tenant = create_tenant(db)
+    other = create_tenant(db, cnpj="98765432000111")
+
+    assert upsert_customer(db, tenant.tenant.id, "Maria", cpf=CPF) != upsert_customer(db, other.tenant.id, "Maria", cpf=CPF)
+
+
+def test_upsert_customers_runs_one_statement_for_distinct_pairs(db, pg_engine):
+    tenant = create_tenant(db)
+    existing = upsert_customer(db, tenant.tenant.id, "Maria", cpf=CPF, phone="11999990000")
+    cpf_hash, other_hash = cpf_blind_index(CPF), cpf_blind_index(OTHER_CPF)
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(pg_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        ids = upsert_customers(db, [
+            {"tenant_id": str(tenant.tenant.id).upper(), "cpf_hash": cpf_hash, "name": "Maria S.", "phone": None},
+            {"tenant_id": tenant.tenant.id, "cpf_hash": other_hash, "name": "João", "phone": "11888880000"},
+            {"tenant_id": tenant.tenant.id, "cpf_hash": cpf_hash, "name": "Maria Silva", "phone": None},
+            {"tenant_id": tenant.tenant.id, "cpf_hash": None, "name": "Sem CPF", "phone": None},
+        ])
+    finally:
+        event.remove(pg_engine, "before_cursor_execute", before_cursor_execute)
+    db.commit()
+
+    assert len(statements) == 1
+    assert ids[customer_key(tenant.tenant.id, cpf_hash)] == existing
+    assert db.query(CustomerProfile).count() == 2
+    customer = db.get(CustomerProfile, existing)
+    assert (customer.name, customer.phone) == ("Maria Silva", "11999990000")
+
+
+@pytest.mark.asyncio
+async def test_offline_sync_links_batch_to_deduplicated_customers(db, session_factory, tmp_path):
+    tenant = create_tenant(db)
+    queue = OfflineQueue(journal_path=str(tmp_path / "journal.db"), session_factory=session_factory)
+    for number, cpf in enumerate([CPF, OTHER_CPF, CPF], start=1):
+        await queue.add_ticket({
+            "tenant_id": str(tenant.tenant.id),
+            "ticket_number": number,
+            "status": "in_queue",
+            "customer_name": f"Cliente {cpf[:3]}",
+            "customer_cpf": cpf,
+            "consent_version": "1",
+        })
+
+    assert await queue.sync() == 3
+
+    db.expire_all()
+    tickets = db.query(Ticket).order_by(Ticket.ticket_number).all()
+    assert db.query(CustomerProfile).count() == 2
+    assert tickets[0].customer_id == tickets[2].customer_id != tickets[1].customer_id
+    assert None not in [ticket.customer_id for ticket in tickets]
+
+
+def test_visits_keyset_pagination(client, db):
+    tenant = create_tenant(db)
+    customer_id = upsert_customer(db, tenant.tenant.id, "Maria", cpf=CPF)
+    other_id = upsert_customer(db, tenant.tenant.id, "João", cpf=OTHER_CPF)
+    base = datetime.now(timezone.utc) - timedelta(days=1)
+    same_time = base + timedelta(hours=2)
+    created = [base, base + timedelta(hours=1), same_time, same_time, base + timedelta(hours=3)]
+    for number, created_at in enumerate(created, start=1):
+        db.add(Ticket(
+            id=uuid.uuid4(), tenant_id=tenant.tenant.id, ticket_number=number, status="completed",
+            customer_name="Maria", consent_version="1", customer_id=customer_id, created_at=created_at,
+        ))
+    db.add(Ticket(
+        tenant_id=tenant.tenant.id, ticket_number=99, status="completed",
+        customer_name="João", consent_version="1", customer_id=other_id, created_at=base,
+    ))
+    db.commit()
+    params = {"tenant_id": str(tenant.tenant.id), "cpf": CPF, "limit": 2}
+
+    pages = []
+    after = None
+    while True:
+        response = client.get("/customers/visits", params={**params, **({"after": after} if after else {})})
+        assert response.status_code == 200
+        page = response.json()
+        if not page:
+            break
+        pages.append(page)
+        after = page[-1]["id"]
+
+    visits = [visit for page in pages for visit in page]
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert len({visit["id"] for visit in visits}) == 5  # Empate em created_at não repete nem pula
+    assert sorted(visit["ticket_number"] for visit in visits) == [1, 2, 3, 4, 5]
+    assert [visit["ticket_number"] for visit in visits][0] == 5
+    assert visits[-1]["ticket_number"] == 1
+
+
+def test_visits_rejects_invalid_cpf(client, db):
+    tenant = create_tenant(db)
+
+    response = client.get("/customers/visits", params={"tenant_id": str(tenant.tenant.id), "cpf": "111"})
+
+    assert response.status_code == 400
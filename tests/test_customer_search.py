@@ -0,0 +1,29 @@
+import pytest
+
+from apps.api.services.customer_search import (
+    decode_cursor,
+    encode_cursor,
+    escape_like,
+    normalize_search_text,
+)
+
+
+def test_normalize_search_text_folds_accents_case_and_spaces():
+    assert normalize_search_text("  José   DA Conceição ") == "jose da conceicao"
+    assert normalize_search_text("Zé Ninguém") == "ze ninguem"
+    assert normalize_search_text("   ") is None
+    assert normalize_search_text(None) is None
+
+
+def test_escape_like_escapes_wildcards():
+    assert escape_like("100%_a\\b") == "100\\%\\_a\\\\b"
+
+
+def test_cursor_roundtrip():
+    cursor = encode_cursor(1, 0.4285714, "maria jose")
+    assert decode_cursor(cursor) == (1, 0.428571, "maria jose")
+
+
+def test_invalid_cursor_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_cursor("nao-e-um-cursor")
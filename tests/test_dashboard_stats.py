@@ -0,0 +1,58 @@
+# 🧪 Resumo do dashboard de tickets (Postgres)
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import create_tenant, requires_database
+
+requires_database()
+
+from models import Ticket
+from routers.tickets import _build_dashboard_stats
+
+
+def _ticket(db, tenant, number, status, created_at):
+    db.add(Ticket(
+        tenant_id=tenant.tenant.id,
+        ticket_number=number,
+        status=status,
+        customer_name=f"Cliente {number}",
+        consent_version="1",
+        created_at=created_at,
+    ))
+
+
+@pytest.fixture
+def tenant(db):
+    tenant = create_tenant(db)
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    tenant.today = today
+    _ticket(db, tenant, 1, "in_queue", today - timedelta(days=2))   # Ainda na fila, criado antes da janela
+    _ticket(db, tenant, 2, "called", today - timedelta(hours=12))
+    _ticket(db, tenant, 3, "completed", today - timedelta(hours=12))
+    _ticket(db, tenant, 4, "in_queue", today + timedelta(minutes=1))
+    _ticket(db, tenant, 5, "expired", today + timedelta(minutes=2))
+    db.commit()
+    return tenant
+
+
+def test_active_summary_matches_active_queue(db, tenant):
+    yesterday = tenant.today - timedelta(days=1)
+
+    stats = _build_dashboard_stats(db, tenant.tenant.id, yesterday, tenant.today)
+
+    assert stats["summary"]["total_tickets"] == 2
+    assert stats["summary"]["active_tickets"] == len(stats["active_queue"]) == 3
+    assert [t["ticket_number"] for t in stats["active_queue"]] == [1, 2, 4]
+
+
+def test_today_tickets_is_today_for_any_window(db, tenant):
+    yesterday = tenant.today - timedelta(days=1)
+
+    past = _build_dashboard_stats(db, tenant.tenant.id, yesterday, tenant.today)
+    today = _build_dashboard_stats(db, tenant.tenant.id, tenant.today, tenant.today + timedelta(days=1))
+
+    assert past["summary"]["today_tickets"] == today["summary"]["today_tickets"] == 2
+    assert today["summary"]["total_tickets"] == 2
+    assert today["summary"]["problem_tickets"] == 1
@@ -0,0 +1,128 @@
+# 🧪 Testes do adaptador Mercado Pago (transporte httpx mockado, sem rede)
+
+import json
+
+import httpx
+import pytest
+
+from apps.api.services.payment.adapters.mercadopago import MercadoPagoAdapter
+
+CONFIG = {
+    "access_token": "TEST-TOKEN",
+    "redirect_url_base": "http://localhost:5173",
+    "printer": {"enabled": False}
+}
+
+
+def make_adapter(handler):
+    return MercadoPagoAdapter(CONFIG, transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_create_payment_preference_posts_to_preferences_api():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(201, json={
+            "id": "pref_123",
+            "init_point": "https://mp/checkout/pref_123",
+            "point_of_interaction": {"transaction_data": {"qr_code": "000201PIX"}}
+        })
+
+    async with make_adapter(handler) as adapter:
+        result = await adapter.create_payment_preference(
+            amount=50.0,
+            description="Crioterapia",
+            metadata={"payment_session_id": "session-1", "customer_name": "Maria Silva"}
+        )
+
+    assert result == {
+        "qr_code": "000201PIX",
+        "preference_id": "pref_123",
+        "init_point": "https://mp/checkout/pref_123"
+    }
+    request = requests[0]
+    assert request.method == "POST"
+    assert request.url.path == "/checkout/preferences"
+    assert request.headers["Authorization"] == "Bearer TEST-TOKEN"
+    body = json.loads(request.content)
+    assert body["external_reference"] == "session-1"
+    assert body["payer"]["surname"] == "Silva"
+
+
+def payments_handler(requests, results_by_reference):
+    """Preferência ``pref_123`` (referência ``session-1``) e busca de pagamentos por referência"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.path == "/checkout/preferences/pref_123":
+            return httpx.Response(200, json={"id": "pref_123", "external_reference": "session-1"})
+        if request.url.path == "/v1/payments/search":
+            results = results_by_reference.get(request.url.params["external_reference"], [])
+            return httpx.Response(200, json={"paging": {"total": len(results)}, "results": results})
+        return httpx.Response(404, json={"message": "not found"})
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_check_status_searches_payments_by_external_reference():
+    requests = []
+    handler = payments_handler(requests, {"session-1": [{"id": 2, "status": "approved"}]})
+
+    async with make_adapter(handler) as adapter:
+        assert await adapter.check_status("pref_123") == "approved"
+        assert await adapter.get_payment_link("missing") is None
+        with pytest.raises(Exception, match="not found"):
+            await adapter.check_status("missing")
+
+    search = requests[1]
+    assert (search.method, search.url.path) == ("GET", "/v1/payments/search")
+    assert search.url.params["external_reference"] == "session-1"
+    assert search.url.params["sort"] == "date_created"
+
+
+@pytest.mark.asyncio
+async def test_check_session_status_skips_preference_lookup():
+    requests = []
+    handler = payments_handler(requests, {
+        "session-1": [{"id": 3, "status": "rejected"}, {"id": 2, "status": "approved"}],
+        "session-2": [{"id": 5, "status": "in_process"}, {"id": 4, "status": "rejected"}],
+    })
+
+    async with make_adapter(handler) as adapter:
+        assert await adapter.check_session_status("pref_123", "session-1") == "approved"
+        assert await adapter.check_session_status("pref_456", "session-2") == "in_process"  # A mais recente
+        assert await adapter.check_session_status("pref_789", "session-3") == "pending"  # Ainda sem pagamento
+
+    assert {request.url.path for request in requests} == {"/v1/payments/search"}
+
+
+@pytest.mark.asyncio
+async def test_card_payment_sends_idempotency_key():
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["path"] = request.url.path
+        seen["key"] = request.headers.get("X-Idempotency-Key")
+        return httpx.Response(201, json={"id": 987, "status": "approved"})
+
+    async with make_adapter(handler) as adapter:
+        payment = await adapter.create_payment_with_card(10.0, "tok_1", "visa")
+
+    assert payment["id"] == 987
+    assert seen == {"path": "/v1/payments", "key": "payment_tok_1_1000"}
+
+
+@pytest.mark.asyncio
+async def test_server_errors_are_retried_for_idempotent_calls():
+    responses = [
+        httpx.Response(503, json={"message": "unavailable"}),
+        httpx.Response(200, json={"results": [{"id": 1, "status": "approved"}]})
+    ]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return responses.pop(0)
+
+    async with make_adapter(handler) as adapter:
+        assert await adapter.check_session_status("pref_123", "session-1") == "approved"
+    assert responses == []
@@ -0,0 +1,46 @@
+# 🧪 Testes do journal local da fila offline
+
+from apps.api.services.offline_journal import OfflineJournal
+
+class TestOfflineJournal:
+    """Testes de persistência, ordem e falhas do journal SQLite"""
+
+    def test_entries_survive_reopen_in_order(self, tmp_path):
+        path = str(tmp_path / "offline" / "journal.db")
+        journal = OfflineJournal(path)
+        for number in range(3):
+            journal.append("ticket", {"ticket_number": number})
+        journal.append("payment", {"transaction_id": "tx-1"})
+        journal.close()
+
+        reopened = OfflineJournal(path)
+        batch = reopened.pending("ticket")
+        assert [payload["ticket_number"] for _, payload in batch] == [0, 1, 2]
+        assert reopened.counts() == {
+            "ticket": {"pending": 3, "failed": 0},
+            "payment": {"pending": 1, "failed": 0}
+        }
+        assert reopened._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_ack_and_batches(self, tmp_path):
+        journal = OfflineJournal(str(tmp_path / "journal.db"))
+        seqs = [journal.append("ticket", {"ticket_number": number}) for number in range(5)]
+
+        first = journal.pending("ticket", limit=2)
+        assert [seq for seq, _ in first] == seqs[:2]
+        second = journal.pending("ticket", limit=2, after_seq=first[-1][0])
+        assert [seq for seq, _ in second] == seqs[2:4]
+
+        journal.ack(seqs[:4])
+        assert [seq for seq, _ in journal.pending("ticket")] == seqs[4:]
+
+    def test_entries_stop_being_delivered_after_max_attempts(self, tmp_path):
+        journal = OfflineJournal(str(tmp_path / "journal.db"), max_attempts=2)
+        seq = journal.append("ticket", {"ticket_number": 1})
+
+        journal.mark_failed(seq, "violates foreign key")
+        assert journal.pending("ticket")
+        journal.mark_failed(seq, "violates foreign key")
+
+        assert journal.pending("ticket") == []
+        assert journal.counts() == {"ticket": {"pending": 0, "failed": 1}}
@@ -0,0 +1,195 @@
+# 🧪 Gravação incremental da configuração de operação (Postgres)
+
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from conftest import create_tenant, requires_database
+
+requires_database()
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import get_db
+from models import (
+    Equipment,
+    EquipmentStatus,
+    EquipmentType,
+    Extra,
+    OperationConfig,
+    OperationConfigEquipment,
+    OperationConfigExtra,
+    OperationConfigService,
+    Service,
+)
+from routers import operation
+from routers.operation import OperationConfigIn
+from services.operation_config import apply_operation_config
+
+
+@pytest.fixture
+def client(session_factory):
+    app = FastAPI()
+    app.include_router(operation.router, prefix="/operation")
+
+    def _get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = _get_db
+    return TestClient(app)
+
+
+def _setup(db, cnpj="12345678000199"):
+    """Tenant com dois serviços, um equipamento e um extra"""
+    tenant = create_tenant(db, cnpj=cnpj)
+    tenant.equipment = Equipment(
+        tenant_id=tenant.tenant.id, type=EquipmentType.totem, identifier=f"totem-{cnpj}", status=EquipmentStatus.offline
+    )
+    tenant.extra = Extra(tenant_id=tenant.tenant.id, name="Toalha", price=5, stock=0, is_active=False)
+    db.add_all([tenant.equipment, tenant.extra])
+    db.commit()
+    return tenant
+
+
+def _payload(tenant, services=None, extras=None, payment_modes=("mercadopago",)):
+    if services is None:
+        services = [
+            {"service_id": str(service.id), "active": True, "duration": 10, "price": 50.0, "equipment_count": 1}
+            for service in tenant.services
+        ]
+    if extras is None:
+        extras = [{"extra_id": str(tenant.extra.id), "active": True, "stock": 7, "price": 5.0}]
+    return {
+        "tenant_id": str(tenant.tenant.id),
+        "operator_id": str(tenant.operator.id),
+        "services": services,
+        "equipments": [{"equipment_id": str(tenant.equipment.id), "active": True, "quantity": 1}],
+        "extras": extras,
+        "payment_modes": list(payment_modes),
+    }
+
+
+def _apply(db, payload):
+    diff = apply_operation_config(db, OperationConfigIn(**payload))
+    db.commit()
+    db.expire_all()
+    return diff
+
+
+@contextmanager
+def _captured_writes(engine):
+    """Tabelas alvo de cada INSERT/UPDATE/DELETE executado no bloco"""
+    writes = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        match = re.match(r"\s*(INSERT INTO|UPDATE|DELETE FROM)\s+(\w+)", statement, re.IGNORECASE)
+        if match:
+            writes.append(match.group(2))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield writes
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_resaving_same_config_writes_only_status_row(client, db, pg_engine):
+    tenant = _setup(db)
+    payload = _payload(tenant)
+
+    assert client.post("/operation/config", json=payload).status_code == 200
+    with _captured_writes(pg_engine) as writes:
+        assert client.post("/operation/config", json=payload).status_code == 200
+
+    assert writes == ["operation_status"]
+
+
+def test_first_save_creates_children_and_activates_catalog(db):
+    tenant = _setup(db)
+
+    diff = _apply(db, _payload(tenant))
+
+    assert diff.created is True
+    assert diff.upserted == {"operation_config_services": 2, "operation_config_equipments": 1, "operation_config_extras": 1}
+    extra = db.get(Extra, tenant.extra.id)
+    assert (extra.is_active, extra.stock) == (True, 7)
+    assert db.get(Equipment, tenant.equipment.id).status == EquipmentStatus.online
+    assert _apply(db, _payload(tenant)).changed is False
+
+
+def test_adds_changes_and_removes_child_rows(db):
+    tenant = _setup(db)
+    first, second = tenant.services
+    _apply(db, _payload(tenant, extras=[]))
+
+    payload = _payload(tenant, services=[
+        {"service_id": str(first.id), "active": True, "duration": 15, "price": 60.0, "equipment_count": 1},
+    ])
+    diff = _apply(db, payload)
+
+    assert diff.created is False
+    assert diff.upserted["operation_config_services"] == 1  # Só o serviço alterado
+    assert diff.deleted["operation_config_services"] == 1
+    assert diff.upserted["operation_config_extras"] == 1  # Extra novo
+    assert diff.upserted["operation_config_equipments"] == 0
+
+    rows = db.query(OperationConfigService).all()
+    assert [(row.service_id, row.duration, float(row.price)) for row in rows] == [(first.id, 15, 60.0)]
+    assert db.query(OperationConfigExtra).count() == 1
+    assert db.get(Service, first.id).is_active is True
+    assert db.get(Service, second.id).is_active is False
+    assert diff.updated["services"] == 1
+
+    # Extra removido da configuração: sai da tabela filha e é desativado no catálogo
+    diff = _apply(db, _payload(tenant, services=payload["services"], extras=[]))
+    assert diff.deleted["operation_config_extras"] == 1
+    assert db.query(OperationConfigExtra).count() == 0
+    assert db.get(Extra, tenant.extra.id).is_active is False
+
+
+def test_stale_duplicate_configs_are_removed(db):
+    tenant = _setup(db)
+    stale = OperationConfig(tenant_id=tenant.tenant.id, operator_id=tenant.operator.id, payment_modes=[])
+    db.add(stale)
+    db.flush()
+    db.add(OperationConfigService(
+        operation_config_id=stale.id, service_id=tenant.services[0].id,
+        active=True, duration=10, price=50, equipment_count=1
+    ))
+    db.commit()
+    _apply(db, _payload(tenant))  # Usa a configuração existente (a mais recente)
+    db.add(OperationConfig(tenant_id=tenant.tenant.id, operator_id=tenant.operator.id, payment_modes=[]))
+    db.commit()
+
+    _apply(db, _payload(tenant))
+
+    configs = db.query(OperationConfig).all()
+    assert len(configs) == 1
+    assert configs[0].id != stale.id
+    assert db.query(OperationConfigService).filter(
+        OperationConfigService.operation_config_id != configs[0].id
+    ).count() == 0
+
+
+def test_toggles_stay_inside_tenant(db):
+    tenant = _setup(db)
+    other = _setup(db, cnpj="98765432000111")
+    _apply(db, _payload(other))
+
+    _apply(db, _payload(tenant, services=[], extras=[]))
+
+    assert all(db.get(Service, service.id).is_active for service in other.services)
+    extra = db.get(Extra, other.extra.id)
+    assert (extra.is_active, extra.stock) == (True, 7)
+    assert db.get(Equipment, other.equipment.id).status == EquipmentStatus.online
+    assert db.query(OperationConfigService).join(OperationConfig).filter(
+        OperationConfig.tenant_id == other.tenant.id
+    ).count() == 2
+    assert not any(db.get(Service, service.id).is_active for service in tenant.services)
@@ -0,0 +1,152 @@
+# 🧪 Testes do cache de autenticação de operadores
+
+import time
+import uuid
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from apps.api.services.operator_auth import OperatorAuthCache, OperatorPrincipal
+
+
+def _operator(**overrides):
+    data = dict(id=uuid.uuid4(), tenant_id=uuid.uuid4(), name="Op", email="op@x", is_active=True)
+    data.update(overrides)
+    return SimpleNamespace(**data)
+
+
+class TestOperatorAuthCache:
+    """Testes do cache token -> OperatorPrincipal usado por get_current_operator"""
+
+    def test_principal_copies_operator_fields(self):
+        operator = _operator()
+        principal = OperatorPrincipal.from_operator(operator)
+
+        assert principal.id == operator.id
+        assert principal.tenant_id == operator.tenant_id
+        assert principal.name == "Op"
+
+    def test_get_is_scoped_by_operator_and_token(self):
+        cache = OperatorAuthCache()
+        principal = OperatorPrincipal.from_operator(_operator())
+        cache.set("token-a", principal)
+
+        assert cache.get(principal.id, "token-a") == principal
+        assert cache.get(principal.id, "token-b") is None
+        assert cache.get(uuid.uuid4(), "token-a") is None
+
+    def test_invalidate_drops_every_token_of_the_operator(self):
+        cache = OperatorAuthCache()
+        first = OperatorPrincipal.from_operator(_operator())
+        other = OperatorPrincipal.from_operator(_operator())
+        cache.set("a1", first)
+        cache.set("a2", first)
+        cache.set("b1", other)
+
+        cache.invalidate(first.id)
+
+        assert cache.get(first.id, "a1") is None
+        assert cache.get(first.id, "a2") is None
+        assert cache.get(other.id, "b1") == other
+
+    def test_entry_never_outlives_token_expiry(self):
+        cache = OperatorAuthCache(ttl_seconds=60)
+        principal = OperatorPrincipal.from_operator(_operator())
+
+        cache.set("expired", principal, expires_at=time.time() - 1)
+        cache.set("short", principal, expires_at=time.time() + 0.05)
+
+        assert cache.get(principal.id, "expired") is None
+        assert cache.get(principal.id, "short") == principal
+        time.sleep(0.06)
+        assert cache.get(principal.id, "short") is None
+
+    def test_bounded_size(self):
+        cache = OperatorAuthCache(max_entries=3)
+        principal = OperatorPrincipal.from_operator(_operator())
+        for i in range(10):
+            cache.set(f"token-{i}", principal)
+
+        assert len(cache) == 3
+
+
+@contextmanager
+def _counted_queries(engine):
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _login(db):
+    """Operador commitado + token assinado como no /auth/token (só com Postgres)"""
+    from conftest import create_tenant
+    from apps.api import auth
+    from apps.api.security import create_access_token
+
+    auth.operator_auth_cache.clear()
+    operator = create_tenant(db).operator
+    return auth, operator, create_access_token({"sub": str(operator.id)})
+
+
+@pytest.mark.asyncio
+async def test_benchmark_get_current_operator(db, pg_engine):
+    """Custo por requisição autenticada de ``auth.get_current_operator``: cache vs. ida ao banco"""
+    auth, operator, token = _login(db)
+    requests = 200
+    results = {}
+
+    for use_cache in (False, True):
+        with _counted_queries(pg_engine) as queries:
+            start = time.perf_counter()
+            for _ in range(requests):
+                if not use_cache:
+                    auth.operator_auth_cache.clear()
+                principal = await auth.get_current_operator(token=token, db=db)
+            results[use_cache] = ((time.perf_counter() - start) / requests, len(queries))
+        assert principal.id == operator.id
+
+    print(
+        f"\n🔐 get_current_operator: sem cache {results[False][0] * 1e6:.0f} µs/req, "
+        f"com cache {results[True][0] * 1e6:.0f} µs/req"
+    )
+    assert results[False][1] == requests
+    assert results[True][1] == 0  # O token já ficou em cache na última volta sem cache
+    assert results[True][0] < results[False][0] / 2
+
+
+@pytest.mark.asyncio
+async def test_operator_update_and_delete_drop_cached_tokens(db, pg_engine):
+    auth, operator, token = _login(db)
+    await auth.get_current_operator(token=token, db=db)
+    assert auth.operator_auth_cache.get(operator.id, token) is not None
+
+    operator.is_active = False
+    db.commit()
+    assert auth.operator_auth_cache.get(operator.id, token) is None
+    with pytest.raises(HTTPException) as exc:
+        await auth.get_current_operator(token=token, db=db)
+    assert exc.value.status_code == 403
+
+    operator.is_active = True
+    db.commit()
+    await auth.get_current_operator(token=token, db=db)
+    with _counted_queries(pg_engine) as queries:
+        await auth.get_current_operator(token=token, db=db)
+    assert queries == []
+
+    db.delete(operator)
+    db.commit()
+    assert auth.operator_auth_cache.get(operator.id, token) is None
+    with pytest.raises(HTTPException) as exc:
+        await auth.get_current_operator(token=token, db=db)
+    assert exc.value.status_code == 401
@@ -0,0 +1,91 @@
+# 🧪 Testes do hash de senhas fora do event loop
+
+import asyncio
+import time
+
+import pytest
+from passlib.context import CryptContext
+
+from apps.api.services.password_hasher import PasswordHasher, PasswordHasherBusyError
+
+
+def _context(rounds):
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify():
+    hasher = PasswordHasher(_context(4))
+    hashed = await hasher.hash("segredo")
+
+    assert await hasher.verify("segredo", hashed) == (True, None)
+    assert await hasher.verify("errada", hashed) == (False, None)
+    assert await hasher.verify("segredo", None) == (False, None)
+    assert await hasher.verify("segredo", "nao-e-bcrypt") == (False, None)
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_verify_returns_new_hash_when_cost_changes():
+    old_hash = _context(4).hash("segredo")
+    hasher = PasswordHasher(_context(5))
+
+    valid, new_hash = await hasher.verify("segredo", old_hash)
+
+    assert valid
+    assert new_hash.startswith("$2b$05$")
+    assert await hasher.verify("segredo", new_hash) == (True, None)
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_busy_when_concurrency_limit_is_saturated():
+    hasher = PasswordHasher(_context(12), max_workers=1, max_concurrent=1, acquire_timeout=0.01)
+    hashed = _context(4).hash("segredo")
+
+    first = asyncio.create_task(hasher.hash("lento"))
+    await asyncio.sleep(0)
+    with pytest.raises(PasswordHasherBusyError):
+        await hasher.verify("segredo", hashed)
+
+    await first
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_login_load_keeps_event_loop_responsive():
+    """Carga: 20 logins simultâneos (troca de turno) sem travar o event loop"""
+    rounds = 8
+    hasher = PasswordHasher(_context(rounds), max_workers=2, max_concurrent=32)
+    hashed = _context(rounds).hash("segredo")
+    logins = 20
+
+    max_lag = 0.0
+    stop = asyncio.Event()
+
+    async def ticker():
+        nonlocal max_lag
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            max_lag = max(max_lag, time.perf_counter() - start - 0.005)
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(hasher.verify("segredo", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker_task
+    hasher.shutdown()
+
+    single = time.perf_counter()
+    _context(rounds).verify("segredo", hashed)
+    single = time.perf_counter() - single
+
+    print(
+        f"\n🔑 {logins} logins (bcrypt {rounds} rounds): {logins / elapsed:.0f} logins/s, "
+        f"{single * 1000:.1f} ms/verify, maior atraso do loop {max_lag * 1000:.1f} ms"
+    )
+    assert all(valid for valid, _ in results)
+    # Com o bcrypt no loop o atraso seria de ~logins * single
+    assert max_lag < (logins * single) / 2
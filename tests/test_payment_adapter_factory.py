@@ -0,0 +1,73 @@
+# 🧪 Testes do cache de adaptadores da PaymentAdapterFactory
+
+import threading
+
+from apps.api.services.payment.adapters.base import PaymentAdapter
+from apps.api.services.payment.factory import PaymentAdapterFactory
+
+
+class CountingAdapter(PaymentAdapter):
+    created = 0
+
+    def __init__(self, config):
+        type(self).created += 1
+        self.config = config
+        self.printer_id = None
+
+    async def create_payment(self, amount, description, metadata):
+        return {}
+
+    async def check_status(self, transaction_id):
+        return "pending"
+
+    async def cancel_payment(self, transaction_id):
+        return True
+
+    async def get_payment_link(self, transaction_id):
+        return None
+
+    async def _fetch_transaction_details(self, transaction_id):
+        return {}
+
+
+def setup_function():
+    PaymentAdapterFactory.register_adapter("counting", CountingAdapter)
+    PaymentAdapterFactory._instances.clear()
+    CountingAdapter.created = 0
+
+
+def test_reuses_adapter_per_tenant_and_config():
+    first = PaymentAdapterFactory.get_adapter("t1", "counting", {"token": "a", "x": 1})
+    again = PaymentAdapterFactory.get_adapter("t1", "counting", {"x": 1, "token": "a"})
+    other_tenant = PaymentAdapterFactory.get_adapter("t2", "counting", {"token": "a", "x": 1})
+
+    assert first is again
+    assert other_tenant is not first
+    assert CountingAdapter.created == 2
+
+
+def test_config_change_and_invalidation_rebuild_adapter():
+    first = PaymentAdapterFactory.get_adapter("t1", "counting", {"token": "a"})
+    changed = PaymentAdapterFactory.get_adapter("t1", "counting", {"token": "b"})
+    assert changed is not first
+
+    assert PaymentAdapterFactory.invalidate_tenant("t1") == 1
+    rebuilt = PaymentAdapterFactory.get_adapter("t1", "counting", {"token": "b"})
+    assert rebuilt is not changed
+    assert CountingAdapter.created == 3
+
+
+def test_concurrent_first_use_builds_once():
+    results = []
+
+    def worker():
+        results.append(PaymentAdapterFactory.get_adapter("t1", "counting", {"token": "a"}))
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert CountingAdapter.created == 1
+    assert all(adapter is results[0] for adapter in results)
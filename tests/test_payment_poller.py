@@ -0,0 +1,94 @@
+# 🧪 Testes do poller de sessões de pagamento pendentes (Postgres)
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import create_tenant, requires_database
+
+requires_database()
+
+from models import OperationConfig, PaymentSession, Ticket
+from services.payment.factory import PaymentAdapterFactory
+from services.payment_poller import PaymentStatusPoller
+
+
+def _pending(db, tenant, transaction_id, **overrides):
+    data = dict(
+        tenant_id=tenant.tenant.id,
+        service_id=tenant.services[0].id,
+        customer_name="Cliente Teste",
+        consent_version="1",
+        payment_method="mercadopago",
+        amount=50,
+        status="pending",
+        transaction_id=transaction_id,
+        created_at=datetime.now(timezone.utc) - timedelta(minutes=5),
+        expires_at=datetime.now(timezone.utc) + timedelta(minutes=25),
+    )
+    data.update(overrides)
+    payment_session = PaymentSession(**data)
+    db.add(payment_session)
+    db.commit()
+    return payment_session
+
+
+def _claimed(poller):
+    sessions, _ = poller._load_pending()
+    return {row["transaction_id"] for row in sessions}
+
+
+def test_batches_rotate_through_all_pending_sessions(db, session_factory):
+    tenant = create_tenant(db)
+    for i in range(3):
+        _pending(db, tenant, f"tx-{i}")
+    poller = PaymentStatusPoller(session_factory=session_factory, batch_size=2, min_age_seconds=0)
+
+    first = _claimed(poller)
+    second = _claimed(poller)
+
+    assert len(first) == 2
+    assert first | second == {"tx-0", "tx-1", "tx-2"}
+    assert (first ^ {"tx-0", "tx-1", "tx-2"}) <= second  # A que ficou de fora vem no ciclo seguinte
+    assert db.query(PaymentSession).filter(PaymentSession.last_polled_at.is_(None)).count() == 0
+
+
+def test_only_pollable_sessions_are_claimed(db, session_factory):
+    tenant = create_tenant(db)
+    _pending(db, tenant, "tx-ok")
+    _pending(db, tenant, None)
+    _pending(db, tenant, "tx-terminal", payment_method="credit")
+    _pending(db, tenant, "tx-expired", expires_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+    _pending(db, tenant, "tx-paid", status="paid")
+    poller = PaymentStatusPoller(session_factory=session_factory, batch_size=10, min_age_seconds=0)
+
+    assert _claimed(poller) == {"tx-ok"}
+
+
+@pytest.mark.asyncio
+async def test_poll_once_applies_provider_status(db, session_factory, monkeypatch):
+    tenant = create_tenant(db)
+    db.add(OperationConfig(
+        tenant_id=tenant.tenant.id,
+        operator_id=tenant.operator.id,
+        payment_config={"mercado_pago": {"access_token": "x"}}
+    ))
+    paid = _pending(db, tenant, "tx-paid")
+    rejected = _pending(db, tenant, "tx-rejected")
+    waiting = _pending(db, tenant, "tx-waiting")
+
+    class _Adapter:
+        async def check_session_status(self, transaction_id, payment_session_id):
+            assert payment_session_id in {paid.id, rejected.id, waiting.id}
+            return {"tx-paid": "approved", "tx-rejected": "rejected"}.get(transaction_id, "in_process")
+
+    monkeypatch.setattr(PaymentAdapterFactory, "get_adapter", classmethod(lambda cls, *args: _Adapter()))
+    poller = PaymentStatusPoller(session_factory=session_factory, batch_size=10, min_age_seconds=0, rate_limit=0)
+
+    assert await poller.poll_once() == 2
+
+    db.expire_all()
+    assert db.get(PaymentSession, paid.id).status == "paid"
+    assert db.query(Ticket).filter(Ticket.payment_session_id == paid.id).one().status == "in_queue"
+    assert db.get(PaymentSession, rejected.id).status == "failed"
+    assert db.get(PaymentSession, waiting.id).status == "pending"
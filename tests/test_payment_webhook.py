@@ -0,0 +1,113 @@
+# 🧪 Testes do webhook de pagamento (Postgres)
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import create_tenant, requires_database
+
+requires_database()
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import get_db
+from models import PaymentSession, Ticket
+from routers import payment_sessions
+from services.payment_status import is_duplicate_delivery
+
+
+@pytest.fixture
+def client(session_factory):
+    app = FastAPI()
+    app.include_router(payment_sessions.router, prefix="/payment-sessions")
+
+    def _get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = _get_db
+    return TestClient(app)
+
+
+def _session(db, tenant, **overrides):
+    data = dict(
+        tenant_id=tenant.tenant.id,
+        service_id=tenant.services[0].id,
+        customer_name="Cliente Teste",
+        consent_version="1",
+        payment_method="mercadopago",
+        amount=50,
+        status="pending",
+        transaction_id="tx-1",
+        expires_at=datetime.now(timezone.utc) + timedelta(minutes=30),
+    )
+    data.update(overrides)
+    payment_session = PaymentSession(**data)
+    db.add(payment_session)
+    db.commit()
+    return payment_session
+
+
+@pytest.mark.parametrize("current, ticket_id, new, duplicate", [
+    ("pending", None, "pending", True),
+    ("failed", None, "failed", True),
+    ("pending", None, "paid", False),
+    ("paid", "t1", "paid", True),
+    ("paid", "t1", "failed", False),
+    ("paid", "t1", "cancelled", False),
+    ("paid", None, "paid", False),
+    ("paid", None, "failed", False),
+])
+def test_is_duplicate_delivery(current, ticket_id, new, duplicate):
+    payment_session = SimpleNamespace(status=current, ticket_id=ticket_id)
+    assert is_duplicate_delivery(payment_session, new) is duplicate
+
+
+def test_paid_redelivery_creates_ticket_after_partial_success(db, client):
+    """Sessão ficou ``paid`` sem ticket (falha parcial): a reentrega gera o ticket"""
+    tenant = create_tenant(db)
+    payment_session = _session(db, tenant, status="paid", completed_at=datetime.now(timezone.utc))
+
+    response = client.post("/payment-sessions/webhook", json={"transaction_id": "tx-1", "status": "paid"})
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+    db.refresh(payment_session)
+    ticket = db.query(Ticket).filter(Ticket.id == payment_session.ticket_id).one()
+    assert ticket.status == "in_queue"
+
+    again = client.post("/payment-sessions/webhook", json={"transaction_id": "tx-1", "status": "paid"})
+    assert again.json()["status"] == "already_processed"
+    assert db.query(Ticket).count() == 1
+
+
+def test_same_status_redelivery_is_ignored(db, client):
+    tenant = create_tenant(db)
+    _session(db, tenant, status="failed")
+
+    response = client.post("/payment-sessions/webhook", json={"transaction_id": "tx-1", "status": "failed"})
+
+    assert response.json()["status"] == "already_processed"
+
+
+def test_cancellation_after_payment_is_applied(db, client):
+    """Estorno/chargeback depois do pagamento não é tratado como reentrega"""
+    tenant = create_tenant(db)
+    payment_session = _session(db, tenant, status="pending")
+    paid = client.post("/payment-sessions/webhook", json={"transaction_id": "tx-1", "status": "paid"})
+    assert paid.json()["status"] == "success"
+
+    response = client.post("/payment-sessions/webhook", json={"transaction_id": "tx-1", "status": "cancelled"})
+
+    assert response.json()["status"] == "success"
+    db.refresh(payment_session)
+    assert payment_session.status == "cancelled"
+    assert payment_session.ticket_id is not None
+
+    again = client.post("/payment-sessions/webhook", json={"transaction_id": "tx-1", "status": "cancelled"})
+    assert again.json()["status"] == "already_processed"
@@ -0,0 +1,54 @@
+# 🧪 Testes da renderização de QR codes de pagamento
+
+import asyncio
+import base64
+
+import pytest
+
+from apps.api.services.qr_codes import QRCodeRenderer, qr_matrix, qr_svg
+
+LINK = "https://www.mercadopago.com.br/checkout/v1/redirect?pref_id=123456789-abcdef"
+
+class TestQRCodes:
+    """Testes dos formatos e do cache do renderizador"""
+
+    def test_matrix_is_square_without_quiet_zone(self):
+        matrix = qr_matrix(LINK)
+
+        assert len(matrix) == len(matrix[0])
+        assert set("".join(matrix)) == {"0", "1"}
+        # Padrão localizador no canto superior esquerdo (sem borda)
+        assert matrix[0].startswith("1111111")
+
+    def test_png_and_svg_formats(self):
+        renderer = QRCodeRenderer()
+        png = renderer.render_sync(LINK, "png")
+        svg = renderer.render_sync(LINK, "svg")
+
+        assert png.startswith("data:image/png;base64,")
+        assert base64.b64decode(png.split(",", 1)[1]).startswith(b"\x89PNG")
+        assert svg.startswith("<svg") and svg == qr_svg(LINK)
+
+    def test_render_runs_in_pool_and_caches_by_link(self):
+        renderer = QRCodeRenderer(max_workers=1)
+        calls = []
+        original = renderer.render_sync
+        renderer.render_sync = lambda link, fmt: calls.append(fmt) or original(link, fmt)
+
+        async def scenario():
+            first = await renderer.render(LINK, "matrix")
+            second = await renderer.render(LINK, "matrix")
+            return first, second
+
+        try:
+            first, second = asyncio.run(scenario())
+        finally:
+            renderer.shutdown()
+
+        assert first is second
+        assert calls == ["matrix"]
+
+    def test_unknown_format_is_rejected(self):
+        renderer = QRCodeRenderer()
+        with pytest.raises(ValueError):
+            renderer.render_sync(LINK, "jpeg")
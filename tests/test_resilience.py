@@ -0,0 +1,142 @@
+# 🧪 Testes do registro de resiliência (circuit breaker, bulkhead e retry)
+
+import asyncio
+import time
+
+import pytest
+
+from apps.api.services.resilience import (
+    Bulkhead,
+    BulkheadFullError,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilienceRegistry,
+    Retry,
+)
+
+
+class InMemoryStateBackend:
+    """Mesma interface do RedisCircuitStateBackend, em memória"""
+
+    def __init__(self):
+        self.open_until = {}
+
+    async def get_open_until(self, name):
+        return self.open_until.get(name)
+
+    async def mark_open(self, name, open_until):
+        self.open_until[name] = open_until
+
+    async def mark_closed(self, name):
+        self.open_until.pop(name, None)
+
+
+async def failing():
+    raise ConnectionError("provider down")
+
+
+async def ok():
+    return "ok"
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_then_allows_single_half_open_probe():
+    breaker = CircuitBreaker("test_breaker_probe", failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await breaker.execute(failing)
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        await breaker.execute(ok)
+
+    breaker._open_until = time.time() - 1  # reset_timeout expirado
+    release = asyncio.Event()
+
+    async def slow_probe():
+        await release.wait()
+        return "ok"
+
+    probe = asyncio.create_task(breaker.execute(slow_probe))
+    await asyncio.sleep(0)
+    with pytest.raises(CircuitOpenError):
+        await breaker.execute(ok)  # Só uma sonda por vez no half-open
+
+    release.set()
+    assert await probe == "ok"
+    assert breaker.state == "closed"
+    assert breaker.get_metrics()["rejected_requests"] == 2
+
+
+@pytest.mark.asyncio
+async def test_breaker_state_is_shared_between_workers():
+    backend = InMemoryStateBackend()
+    worker_a = CircuitBreaker("test_breaker_shared", failure_threshold=1, shared_backend=backend, sync_interval=0)
+    worker_b = CircuitBreaker("test_breaker_shared", failure_threshold=1, shared_backend=backend, sync_interval=0)
+
+    with pytest.raises(ConnectionError):
+        await worker_a.execute(failing)
+
+    with pytest.raises(CircuitOpenError):
+        await worker_b.execute(ok)
+    assert worker_b.state == "open"
+
+
+@pytest.mark.asyncio
+async def test_bulkhead_rejects_calls_over_the_limit():
+    bulkhead = Bulkhead("test_bulkhead", max_concurrent=1)
+    release = asyncio.Event()
+
+    async def busy():
+        await release.wait()
+        return "done"
+
+    first = asyncio.create_task(bulkhead.execute(busy))
+    await asyncio.sleep(0)
+    with pytest.raises(BulkheadFullError):
+        await bulkhead.execute(ok)
+
+    release.set()
+    assert await first == "done"
+    assert bulkhead.in_flight == 0
+    assert await bulkhead.execute(ok) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_retry_respects_deadline_and_skips_rejections():
+    calls = []
+
+    async def flaky():
+        calls.append(time.monotonic())
+        raise ConnectionError("timeout")
+
+    retry = Retry("test_retry_deadline", max_attempts=10, delay=0.05, backoff=1.0, jitter=False, deadline=0.12)
+    with pytest.raises(ConnectionError):
+        await retry.execute(flaky)
+    assert len(calls) == 3  # 0s, 0.05s, 0.10s; a próxima espera estouraria o prazo
+
+    async def rejected():
+        calls.append(None)
+        raise CircuitOpenError("open")
+
+    calls.clear()
+    with pytest.raises(CircuitOpenError):
+        await Retry("test_retry_rejection", delay=0).execute(rejected)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_registry_shares_instances_per_dependency_and_tenant():
+    registry = ResilienceRegistry()
+    registry.configure("test_provider", circuit_breaker={"failure_threshold": 1}, retry={"max_attempts": 1})
+
+    assert registry.circuit_breaker("test_provider") is registry.circuit_breaker("test_provider")
+    assert registry.circuit_breaker("test_provider", "tenant-a") is not registry.circuit_breaker("test_provider")
+
+    with pytest.raises(ConnectionError):
+        await registry.call("test_provider", failing, tenant_id="tenant-a")
+    with pytest.raises(CircuitOpenError):
+        await registry.call("test_provider", ok, tenant_id="tenant-a")
+
+    # Outro tenant não é afetado
+    assert await registry.call("test_provider", ok, tenant_id="tenant-b") == "ok"
@@ -0,0 +1,74 @@
+# 🧪 Rollups horários de tickets com vários serviços (Postgres)
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import create_tenant, requires_database
+
+requires_database()
+
+from models import Ticket, TicketService
+from routers.tickets import _build_dashboard_stats
+from services.rollups import backfill_rollups, get_rollup_summary, record_ticket_finished
+
+
+def _finished_ticket(db, tenant, number, status, services, service_minutes):
+    now = datetime.now(timezone.utc)
+    ticket = Ticket(
+        tenant_id=tenant.tenant.id,
+        ticket_number=number,
+        status=status,
+        customer_name=f"Cliente {number}",
+        consent_version="1",
+        queued_at=now - timedelta(minutes=service_minutes + 5),
+        called_at=now - timedelta(minutes=service_minutes),
+        started_at=now - timedelta(minutes=service_minutes),
+        completed_at=now if status == "completed" else None,
+        cancelled_at=now if status == "cancelled" else None,
+    )
+    db.add(ticket)
+    db.flush()
+    for service in services:
+        db.add(TicketService(ticket_id=ticket.id, service_id=service.id, price=service.price))
+    record_ticket_finished(db, ticket)
+    db.commit()
+    return ticket
+
+
+@pytest.fixture
+def tenant(db):
+    tenant = create_tenant(db)
+    first, second = tenant.services
+    _finished_ticket(db, tenant, 1, "completed", [first, second], service_minutes=20)
+    _finished_ticket(db, tenant, 2, "completed", [first], service_minutes=10)
+    _finished_ticket(db, tenant, 3, "cancelled", [first, second], service_minutes=0)
+    tenant.start = datetime.now(timezone.utc) - timedelta(hours=2)
+    tenant.end = datetime.now(timezone.utc) + timedelta(hours=2)
+    return tenant
+
+
+def _assert_counts_each_ticket_once(db, tenant):
+    first, second = tenant.services
+
+    summary = get_rollup_summary(db, tenant.tenant.id, tenant.start, tenant.end)
+    assert (summary["completed"], summary["cancelled"]) == (2, 1)
+    assert summary["revenue"] == 130.0  # Receita continua somando cada serviço
+    assert summary["avg_service_seconds"] == pytest.approx(15 * 60, abs=1)  # Média por ticket, não por serviço
+
+    by_service = [get_rollup_summary(db, tenant.tenant.id, tenant.start, tenant.end, service_id=s.id) for s in (first, second)]
+    assert [(s["completed"], s["cancelled"]) for s in by_service] == [(2, 1), (1, 1)]
+    assert [s["revenue"] for s in by_service] == [100.0, 30.0]
+
+
+def test_multi_service_ticket_counts_once_in_tenant_totals(db, tenant):
+    _assert_counts_each_ticket_once(db, tenant)
+
+    stats = _build_dashboard_stats(db, tenant.tenant.id, tenant.start, tenant.end)
+    assert stats["summary"]["today_completed"] == 2
+
+
+def test_backfill_matches_incremental_rollups(db, tenant):
+    backfill_rollups(db, tenant.start - timedelta(hours=1), tenant.end, tenant_id=tenant.tenant.id)
+
+    _assert_counts_each_ticket_once(db, tenant)
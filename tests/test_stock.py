@@ -0,0 +1,54 @@
+# 🧪 Testes da reserva de estoque de extras
+
+import uuid
+
+import pytest
+
+from apps.api.services.stock import (
+    InsufficientStockError,
+    aggregate_quantities,
+    release_ticket_extras,
+    reserve_extras,
+)
+
+
+class _NoQueryDB:
+    def execute(self, *args, **kwargs):
+        raise AssertionError("nenhuma query esperada")
+
+
+def test_aggregate_sums_repeated_extras():
+    first, second = uuid.uuid4(), uuid.uuid4()
+
+    totals = aggregate_quantities([(first, 2), (second, 1), (first, 3)])
+
+    assert totals == {str(first): 5, str(second): 1}
+
+
+@pytest.mark.parametrize("quantity", [0, -1, None])
+def test_aggregate_rejects_invalid_quantity(quantity):
+    with pytest.raises(ValueError):
+        aggregate_quantities([(uuid.uuid4(), quantity)])
+
+
+def test_empty_order_does_not_touch_the_database():
+    assert reserve_extras(_NoQueryDB(), uuid.uuid4(), []) == {}
+    release_ticket_extras(_NoQueryDB(), [])
+
+
+def test_reserve_reports_extras_without_stock():
+    available, sold_out = str(uuid.uuid4()), str(uuid.uuid4())
+
+    class _DB:
+        def execute(self, statement, params):
+            assert params["extra_ids"] == [available, sold_out]
+            assert params["quantities"] == [1, 2]
+
+            class _Result:
+                def all(self):
+                    return [(available, 9)]  # Só o extra com estoque volta no RETURNING
+            return _Result()
+
+    with pytest.raises(InsufficientStockError) as exc:
+        reserve_extras(_DB(), uuid.uuid4(), [(available, 1), (sold_out, 2)])
+    assert exc.value.extra_ids == [sold_out]
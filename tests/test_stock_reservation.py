@@ -0,0 +1,272 @@
+# 🧪 Reserva de estoque de extras ligada à sessão de pagamento (Postgres)
+
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import create_tenant, requires_database
+
+requires_database()
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from auth import get_current_operator
+from database import get_db
+from models import Extra, OperationConfig, OperationConfigExtra, PaymentSession, Ticket
+from routers import payment_sessions, tickets
+from services.payment_expiry import cancel_unpaid_tickets, expire_payment_sessions_batch
+from services.operator_auth import OperatorPrincipal
+from services.stock import InsufficientStockError, release_ticket_extras, reserve_extras
+
+
+@pytest.fixture
+def client(session_factory):
+    app = FastAPI()
+    app.include_router(tickets.router, prefix="/tickets")
+    app.include_router(payment_sessions.router, prefix="/payment-sessions")
+
+    def _get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = _get_db
+    return TestClient(app)
+
+
+@pytest.fixture
+def shop(db):
+    """Tenant com um extra (estoque 1) também presente na configuração de operação"""
+    tenant = create_tenant(db)
+    extra = Extra(tenant_id=tenant.tenant.id, name="Toalha", price=5, stock=1, is_active=True)
+    config = OperationConfig(tenant_id=tenant.tenant.id, operator_id=tenant.operator.id, payment_modes=["mercadopago"])
+    db.add_all([extra, config])
+    db.flush()
+    db.add(OperationConfigExtra(operation_config_id=config.id, extra_id=extra.id, stock=1, price=5, active=True))
+    db.commit()
+    tenant.extra = extra
+    return tenant
+
+
+def _stock(db, extra):
+    db.expire_all()
+    config_stock = db.query(OperationConfigExtra.stock).filter(OperationConfigExtra.extra_id == extra.id).scalar()
+    return db.get(Extra, extra.id).stock, config_stock
+
+
+def _ticket_payload(shop, quantity=1):
+    return {
+        "tenant_id": str(shop.tenant.id),
+        "customer_name": "Cliente Teste",
+        "consent_version": "1",
+        "services": [{"service_id": str(shop.services[0].id), "price": 50}],
+        "extras": [{"extra_id": str(shop.extra.id), "quantity": quantity, "price": 5}],
+    }
+
+
+@pytest.mark.parametrize("first_commits, second_wins", [(True, False), (False, True)])
+def test_concurrent_reservations_for_the_last_unit(db, session_factory, shop, first_commits, second_wins):
+    """O segundo pedido espera o lock da linha e reavalia ``stock >= n`` com o valor final"""
+    first, second = session_factory(), session_factory()
+    outcome = {}
+
+    def reserve_second():
+        try:
+            reserve_extras(second, shop.tenant.id, [(shop.extra.id, 1)])
+            second.commit()
+            outcome["second"] = "reserved"
+        except InsufficientStockError:
+            second.rollback()
+            outcome["second"] = "sold_out"
+
+    try:
+        assert reserve_extras(first, shop.tenant.id, [(shop.extra.id, 1)]) == {str(shop.extra.id): 0}
+        thread = threading.Thread(target=reserve_second)
+        thread.start()
+        time.sleep(0.2)
+        assert thread.is_alive()  # Bloqueado no lock do primeiro pedido
+
+        if first_commits:
+            first.commit()
+        else:
+            first.rollback()
+        thread.join(timeout=5)
+    finally:
+        first.close()
+        second.close()
+
+    assert outcome["second"] == ("reserved" if second_wins else "sold_out")
+    assert _stock(db, shop.extra) == (0, 0)
+
+
+def test_partial_shortage_reserves_nothing(db, shop):
+    other = Extra(tenant_id=shop.tenant.id, name="Água", price=3, stock=10, is_active=True)
+    db.add(other)
+    db.commit()
+
+    with pytest.raises(InsufficientStockError) as exc:
+        reserve_extras(db, shop.tenant.id, [(other.id, 2), (shop.extra.id, 2)])
+    db.rollback()
+
+    assert exc.value.extra_ids == [str(shop.extra.id)]
+    assert db.get(Extra, other.id).stock == 10
+
+
+def test_create_ticket_reserves_under_an_expiring_session(db, client, shop):
+    response = client.post("/tickets", json=_ticket_payload(shop))
+    assert response.status_code == 200
+    assert _stock(db, shop.extra) == (0, 0)
+
+    sold_out = client.post("/tickets", json=_ticket_payload(shop))
+    assert sold_out.status_code == 409
+    assert db.query(Ticket).count() == 1
+
+    ticket_id = response.json()["id"]
+    reservation = db.query(PaymentSession).filter(PaymentSession.ticket_id == ticket_id).one()
+    assert (reservation.status, reservation.payment_method) == ("pending", "none")
+
+    # Ninguém criou o pagamento: a reserva vence e o estoque volta, mas o
+    # ticket continua aguardando o operador (pagamento no balcão)
+    reservation.expires_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.commit()
+    expired = expire_payment_sessions_batch(db)
+
+    assert [(row["ticket_cancelled"], row["stock_released"]) for row in expired] == [(False, True)]
+    assert db.get(Ticket, reservation.ticket_id).status == "pending_payment"
+    assert _stock(db, shop.extra) == (1, 1)
+
+    release_ticket_extras(db, [ticket_id])  # Devolução é idempotente
+    db.commit()
+    assert _stock(db, shop.extra) == (1, 1)
+
+
+def test_ticket_without_reserved_extras_has_no_session(db, client, shop):
+    payload = {**_ticket_payload(shop), "extras": []}
+
+    response = client.post("/tickets", json=payload)
+
+    assert response.status_code == 200
+    assert db.get(Ticket, uuid.UUID(response.json()["id"])).payment_session_id is None
+    assert db.query(PaymentSession).count() == 0
+
+
+def test_signature_only_session_does_not_hold_the_ticket(db, client, shop):
+    payload = {**_ticket_payload(shop), "extras": [], "signature": "data:image/png;base64,AAAA"}
+
+    ticket_id = uuid.UUID(client.post("/tickets", json=payload).json()["id"])
+
+    session = db.query(PaymentSession).one()
+    assert db.get(Ticket, ticket_id).payment_session_id == session.id
+    assert session.ticket_id is None  # Só vincula o consentimento
+    session.expires_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.commit()
+    expire_payment_sessions_batch(db)
+    assert db.get(Ticket, ticket_id).status == "pending_payment"
+
+
+def _confirm(client, shop, ticket_id):
+    client.app.dependency_overrides[get_current_operator] = lambda: OperatorPrincipal.from_operator(shop.operator)
+    return client.post(f"/tickets/{ticket_id}/confirm-payment")
+
+
+def test_operator_confirmation_closes_the_reservation(db, client, shop):
+    ticket_id = client.post("/tickets", json=_ticket_payload(shop)).json()["id"]
+
+    assert _confirm(client, shop, ticket_id).status_code == 200
+
+    db.expire_all()
+    reservation = db.query(PaymentSession).filter(PaymentSession.ticket_id == ticket_id).one()
+    assert reservation.status == "paid"
+    assert db.get(Ticket, uuid.UUID(ticket_id)).status == "in_queue"
+    assert expire_payment_sessions_batch(db) == []
+    assert _stock(db, shop.extra) == (0, 0)
+
+
+def test_confirmation_after_expired_reservation_reserves_again(db, client, shop):
+    ticket_id = client.post("/tickets", json=_ticket_payload(shop)).json()["id"]
+    reservation = db.query(PaymentSession).filter(PaymentSession.ticket_id == ticket_id).one()
+    reservation.expires_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.commit()
+    expire_payment_sessions_batch(db)
+    assert _stock(db, shop.extra) == (1, 1)
+
+    assert _confirm(client, shop, ticket_id).status_code == 200
+    assert _stock(db, shop.extra) == (0, 0)
+
+    # A venda voltou a segurar o estoque: um cancelamento devolve uma vez só
+    release_ticket_extras(db, [ticket_id])
+    release_ticket_extras(db, [ticket_id])
+    db.commit()
+    assert _stock(db, shop.extra) == (1, 1)
+
+
+def test_confirmation_fails_when_released_stock_was_sold(db, client, shop):
+    ticket_id = client.post("/tickets", json=_ticket_payload(shop)).json()["id"]
+    reservation = db.query(PaymentSession).filter(PaymentSession.ticket_id == ticket_id).one()
+    reservation.expires_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.commit()
+    expire_payment_sessions_batch(db)
+    assert client.post("/tickets", json=_ticket_payload(shop)).status_code == 200  # Outro cliente levou a unidade
+
+    response = _confirm(client, shop, ticket_id)
+
+    assert response.status_code == 409
+    db.expire_all()
+    assert db.get(Ticket, uuid.UUID(ticket_id)).status == "pending_payment"
+    assert _stock(db, shop.extra) == (0, 0)
+
+
+def test_expired_gateway_session_cancels_ticket(db, client, shop):
+    ticket_id = client.post("/tickets", json=_ticket_payload(shop)).json()["id"]
+    session_id = client.post(f"/tickets/{ticket_id}/create-payment", json={"payment_method": "pix"}).json()["id"]
+    payment_session = db.get(PaymentSession, uuid.UUID(session_id))
+    payment_session.expires_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.commit()
+
+    expired = expire_payment_sessions_batch(db)
+
+    assert [(row["ticket_cancelled"], row["stock_released"]) for row in expired] == [(True, True)]
+    assert db.get(Ticket, uuid.UUID(ticket_id)).status == "cancelled"
+    assert _stock(db, shop.extra) == (1, 1)
+
+
+def test_create_payment_takes_over_the_reservation(db, client, shop):
+    ticket_id = client.post("/tickets", json=_ticket_payload(shop)).json()["id"]
+
+    response = client.post(f"/tickets/{ticket_id}/create-payment", json={"payment_method": "pix"})
+    assert response.status_code == 200
+
+    statuses = dict(db.query(PaymentSession.id, PaymentSession.status).filter(PaymentSession.ticket_id == ticket_id).all())
+    assert sorted(statuses.values()) == ["cancelled", "pending"]
+    assert statuses[uuid.UUID(response.json()["id"])] == "pending"
+    assert db.get(Ticket, ticket_id).status == "pending_payment"
+    assert _stock(db, shop.extra) == (0, 0)
+
+
+@pytest.mark.parametrize("provider_status", ["failed", "cancelled"])
+def test_failed_or_cancelled_session_releases_stock(db, client, shop, provider_status):
+    ticket_id = client.post("/tickets", json=_ticket_payload(shop)).json()["id"]
+    session_id = client.post(f"/tickets/{ticket_id}/create-payment", json={"payment_method": "pix"}).json()["id"]
+    payment_session = db.get(PaymentSession, uuid.UUID(session_id))
+    payment_session.transaction_id = "tx-42"
+    db.commit()
+
+    response = client.post("/payment-sessions/webhook", json={"transaction_id": "tx-42", "status": provider_status})
+
+    assert response.json()["status"] == "success"
+    assert db.get(Ticket, ticket_id).status == "cancelled"
+    assert _stock(db, shop.extra) == (1, 1)
+
+
+def test_ticket_with_another_live_session_is_not_cancelled(db, client, shop):
+    ticket_id = client.post("/tickets", json=_ticket_payload(shop)).json()["id"]
+
+    assert cancel_unpaid_tickets(db, [ticket_id], "Pagamento recusado") == []  # Sessão de reserva ainda válida
+    assert db.get(Ticket, ticket_id).status == "pending_payment"
+    assert _stock(db, shop.extra) == (0, 0)
@@ -0,0 +1,95 @@
+# 🧪 Métrica de tempo de espera nos caminhos que chamam tickets (Postgres)
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import create_tenant, requires_database
+
+requires_database()
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from auth import get_current_operator
+from database import get_db
+from models import Equipment, EquipmentStatus, EquipmentType, Ticket, TicketService
+from routers import tickets
+from services.operator_auth import OperatorPrincipal
+
+WAIT_SECONDS = 300
+
+
+@pytest.fixture
+def queue(db):
+    tenant = create_tenant(db)
+    service = tenant.services[0]
+    ticket = Ticket(
+        tenant_id=tenant.tenant.id,
+        ticket_number=1,
+        status="in_queue",
+        customer_name="Cliente Teste",
+        consent_version="1",
+        queued_at=datetime.now(timezone.utc) - timedelta(seconds=WAIT_SECONDS),
+    )
+    db.add(ticket)
+    db.flush()
+    db.add(TicketService(ticket_id=ticket.id, service_id=service.id, price=50))
+    equipment = Equipment(
+        tenant_id=tenant.tenant.id, service_id=service.id, type=EquipmentType.totem,
+        identifier="crio-1", status=EquipmentStatus.online
+    )
+    db.add(equipment)
+    db.commit()
+    tenant.ticket, tenant.service, tenant.equipment = ticket, service, equipment
+    return tenant
+
+
+@pytest.fixture
+def client(session_factory, queue):
+    app = FastAPI()
+    app.include_router(tickets.router, prefix="/tickets")
+
+    def _get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = _get_db
+    app.dependency_overrides[get_current_operator] = lambda: OperatorPrincipal.from_operator(queue.operator)
+    return TestClient(app)
+
+
+def _wait_samples(service_id):
+    labels = {"service_id": str(service_id)}
+    return (
+        REGISTRY.get_sample_value("totem_ticket_wait_time_seconds_count", labels) or 0,
+        REGISTRY.get_sample_value("totem_ticket_wait_time_seconds_sum", labels) or 0,
+    )
+
+
+def test_queue_next_records_wait_time(client, queue):
+    count, total = _wait_samples(queue.service.id)
+
+    response = client.get("/tickets/queue/next")
+
+    assert response.status_code == 200
+    assert response.json()["ticket"]["status"] == "called"
+    new_count, new_total = _wait_samples(queue.service.id)
+    assert new_count == count + 1
+    assert new_total - total == pytest.approx(WAIT_SECONDS, abs=30)
+
+
+def test_call_service_records_wait_time_once(client, queue, db):
+    count, _ = _wait_samples(queue.service.id)
+    body = {"equipment_id": str(queue.equipment.id), "service_id": str(queue.service.id)}
+
+    response = client.post(f"/tickets/{queue.ticket.id}/call-service", json=body)
+
+    assert response.status_code == 200
+    db.expire_all()
+    assert db.get(Ticket, queue.ticket.id).status == "called"
+    assert _wait_samples(queue.service.id)[0] == count + 1
@@ -0,0 +1,90 @@
+# 🧪 Endpoint /totem/bootstrap (Postgres)
+
+from datetime import datetime
+
+import pytest
+
+from conftest import create_tenant, requires_database
+
+requires_database()
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import get_db
+from models import OperationConfig, OperationStatusModel
+from routers import totem
+from services.catalog import catalog_cache
+
+
+@pytest.fixture
+def client(session_factory):
+    app = FastAPI()
+    app.include_router(totem.router, prefix="/totem")
+
+    def _get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = _get_db
+    catalog_cache.clear()
+    yield TestClient(app)
+    catalog_cache.clear()
+
+
+@pytest.fixture
+def tenant(db):
+    tenant = create_tenant(db)
+    db.add(OperationConfig(tenant_id=tenant.tenant.id, operator_id=tenant.operator.id, payment_modes=["mercadopago"]))
+    db.add(OperationStatusModel(tenant_id=tenant.tenant.id, is_operating=False, service_duration=10, equipment_counts={}))
+    db.commit()
+    return tenant
+
+
+def _bootstrap(client, tenant, **headers):
+    return client.get("/totem/bootstrap", params={"tenant_id": str(tenant.tenant.id)}, headers=headers)
+
+
+def test_bundle_has_catalog_and_stable_version(client, tenant):
+    first = _bootstrap(client, tenant)
+    assert first.status_code == 200
+    body = first.json()
+    assert len(body["services"]) == 2
+    assert body["payment_modes"] == ["mercadopago"]
+    assert body["operation_status"]["is_operating"] is False
+
+    # Montado de novo (sem cache) o conteúdo, a versão e o ETag não mudam
+    catalog_cache.clear()
+    second = _bootstrap(client, tenant)
+    assert second.json()["version"] == body["version"]
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert second.content == first.content
+
+
+def test_if_none_match_returns_304(client, tenant):
+    etag = _bootstrap(client, tenant).headers["ETag"]
+
+    response = _bootstrap(client, tenant, **{"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    assert _bootstrap(client, tenant, **{"If-None-Match": '"outro"'}).status_code == 200
+
+
+def test_operation_status_write_invalidates_bundle(client, tenant, db):
+    first = _bootstrap(client, tenant)
+
+    status_obj = db.query(OperationStatusModel).filter(OperationStatusModel.tenant_id == tenant.tenant.id).one()
+    status_obj.is_operating = True
+    status_obj.updated_at = datetime.utcnow()
+    db.commit()
+
+    response = _bootstrap(client, tenant, **{"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != first.headers["ETag"]
+    assert response.json()["version"] != first.json()["version"]
+    assert response.json()["operation_status"]["is_operating"] is True
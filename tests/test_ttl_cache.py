@@ -0,0 +1,52 @@
+# 🧪 Testes do cache em memória com TTL
+
+import time
+
+from apps.api.services.cache import TTLCache
+
+class TestTTLCache:
+    """Testes do TTLCache usado por dashboards e catálogos"""
+
+    def test_get_set_and_expiry(self):
+        cache = TTLCache(ttl_seconds=0.05)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+
+        time.sleep(0.06)
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_lru_eviction_respects_max_entries(self):
+        cache = TTLCache(ttl_seconds=60, max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "a" passa a ser o mais recente
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_get_or_set_calls_factory_once(self):
+        cache = TTLCache(ttl_seconds=60)
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return "value"
+
+        assert cache.get_or_set("k", factory) == "value"
+        assert cache.get_or_set("k", factory) == "value"
+        assert len(calls) == 1
+
+    def test_invalidate_prefix(self):
+        cache = TTLCache(ttl_seconds=60)
+        cache.set(("tenant-1", "today"), 1)
+        cache.set(("tenant-1", "week"), 2)
+        cache.set(("tenant-2", "today"), 3)
+
+        cache.invalidate_prefix("tenant-1")
+
+        assert cache.get(("tenant-1", "today")) is None
+        assert cache.get(("tenant-1", "week")) is None
+        assert cache.get(("tenant-2", "today")) == 3
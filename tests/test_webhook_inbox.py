@@ -0,0 +1,195 @@
+# 🧪 Testes da caixa de entrada de webhooks (Postgres)
+
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import requires_database
+
+requires_database()
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import get_db
+from models import WebhookInbox
+from routers import webhooks
+from services.webhook_inbox import WebhookInboxWorker
+from services.webhook_validator import (
+    WebhookProvider,
+    WebhookReplayProtection,
+    WebhookValidationConfig,
+    WebhookValidator,
+)
+
+SECRET = "segredo-teste"
+
+
+def _entry(db, transaction_id, **overrides):
+    data = dict(
+        provider="mercadopago",
+        transaction_id=transaction_id,
+        payload={"id": transaction_id},
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.now(timezone.utc) - timedelta(seconds=1),
+    )
+    data.update(overrides)
+    entry = WebhookInbox(**data)
+    db.add(entry)
+    db.commit()
+    return entry
+
+
+def _worker(session_factory, **overrides):
+    options = dict(session_factory=session_factory, max_attempts=3, lease_seconds=120)
+    options.update(overrides)
+    return WebhookInboxWorker(**options)
+
+
+def _reload(db, entry):
+    db.expire_all()
+    return db.get(WebhookInbox, entry.id)
+
+
+def test_claim_takes_due_entry_and_starts_lease(db, session_factory):
+    _entry(db, "tx-later", next_attempt_at=datetime.now(timezone.utc) + timedelta(minutes=5))
+    due = _entry(db, "tx-due")
+    worker = _worker(session_factory)
+
+    claimed = worker._claim()
+
+    assert claimed["transaction_id"] == "tx-due"
+    assert claimed["attempts"] == 1
+    row = _reload(db, due)
+    assert row.status == "processing"
+    assert row.next_attempt_at > datetime.now(timezone.utc) + timedelta(seconds=60)
+    assert worker._claim() is None  # Lease ativo e a outra linha ainda não venceu
+
+
+def test_expired_lease_is_reclaimed_while_attempts_remain(db, session_factory):
+    entry = _entry(db, "tx-1", status="processing", attempts=2)
+
+    claimed = _worker(session_factory)._claim()
+
+    assert claimed["transaction_id"] == "tx-1"
+    assert claimed["attempts"] == 3
+    assert _reload(db, entry).status == "processing"
+
+
+def test_expired_lease_on_last_attempt_moves_to_failed(db, session_factory):
+    exhausted = _entry(db, "tx-exhausted", status="processing", attempts=3)
+    active = _entry(
+        db, "tx-active", status="processing", attempts=3,
+        next_attempt_at=datetime.now(timezone.utc) + timedelta(minutes=1)
+    )
+
+    assert _worker(session_factory)._claim() is None
+
+    row = _reload(db, exhausted)
+    assert row.status == "failed"
+    assert row.attempts == 3
+    assert "Lease expirado" in row.last_error
+    assert _reload(db, active).status == "processing"  # Lease ainda válido
+
+
+def test_pending_entry_over_max_attempts_is_not_claimed(db, session_factory):
+    # Ex.: max_attempts reduzido na configuração depois do enfileiramento
+    _entry(db, "tx-1", attempts=3)
+
+    assert _worker(session_factory)._claim() is None
+
+
+@pytest.mark.asyncio
+async def test_handler_failures_retry_until_failed(db, session_factory):
+    entry = _entry(db, "tx-1")
+    worker = _worker(session_factory, max_attempts=2, base_retry_delay=0)
+    calls = []
+
+    async def handler(claimed):
+        calls.append(claimed["attempts"])
+        raise RuntimeError("provedor fora do ar")
+
+    worker._handler = handler
+
+    assert await worker.process_next() is True
+    row = _reload(db, entry)
+    assert (row.status, row.attempts) == ("pending", 1)
+
+    assert await worker.process_next() is True
+    row = _reload(db, entry)
+    assert (row.status, row.attempts) == ("failed", 2)
+    assert row.last_error == "provedor fora do ar"
+
+    assert await worker.process_next() is False
+    assert calls == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_successful_handler_marks_done(db, session_factory):
+    entry = _entry(db, "tx-1")
+    worker = _worker(session_factory)
+
+    async def handler(claimed):
+        pass
+
+    worker._handler = handler
+
+    assert await worker.process_next() is True
+    row = _reload(db, entry)
+    assert row.status == "done"
+    assert row.processed_at is not None
+
+
+@pytest.fixture
+def client(session_factory, monkeypatch):
+    validator = WebhookValidator(WebhookReplayProtection())
+    validator.register_provider(WebhookValidationConfig(provider=WebhookProvider.MERCADOPAGO, secret_key=SECRET))
+    monkeypatch.setattr(webhooks, "webhook_validator", validator)
+
+    app = FastAPI()
+    app.include_router(webhooks.router, prefix="/webhooks")
+
+    def _get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = _get_db
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def _deliver(client, body, timestamp):
+    signature = hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return client.post("/webhooks/mercadopago", content=body, headers={
+        "Content-Type": "application/json", "X-Signature": signature, "X-Timestamp": timestamp
+    })
+
+
+def test_failed_enqueue_lets_provider_redeliver(client, db, monkeypatch):
+    real_enqueue = webhooks.enqueue_webhook
+    calls = []
+
+    def flaky_enqueue(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("banco fora do ar")
+        return real_enqueue(*args, **kwargs)
+
+    monkeypatch.setattr(webhooks, "enqueue_webhook", flaky_enqueue)
+    body = json.dumps({"id": "pay-1", "type": "payment"}).encode()
+    timestamp = str(int(time.time()))
+
+    assert _deliver(client, body, timestamp).status_code == 500
+    retry = _deliver(client, body, timestamp)
+
+    assert retry.status_code == 200
+    assert db.query(WebhookInbox).filter(WebhookInbox.transaction_id == "pay-1").count() == 1
+    # Depois de persistido, a mesma entrega volta a ser replay
+    assert _deliver(client, body, timestamp).status_code == 400
@@ -0,0 +1,47 @@
+# 🧪 Lista de IPs permitidos dos webhooks (busca por prefixo)
+
+import pytest
+
+from apps.api.services.webhook_validator import (
+    CompiledWebhookValidator,
+    WebhookProvider,
+    WebhookReplayProtection,
+    WebhookValidationConfig,
+    WebhookValidationResult,
+)
+
+ALLOWED = ["200.10.0.0/16", "200.20.30.0/24", "187.1.2.3", "10.0.0.0/8", "2801:80::/32"]
+
+
+def _validator(allowed_ips):
+    config = WebhookValidationConfig(provider=WebhookProvider.STONE, secret_key="x", allowed_ips=allowed_ips)
+    return CompiledWebhookValidator(config, WebhookReplayProtection())
+
+
+@pytest.mark.parametrize("client_ip, allowed", [
+    ("200.10.255.1", True),      # /16
+    ("200.20.30.77", True),      # /24
+    ("187.1.2.3", True),         # Host único
+    ("187.1.2.3:443", True),     # IPv4 com porta
+    ("10.9.8.7", True),          # /8
+    ("2801:80:1::5", True),      # IPv6 /32
+    ("200.21.30.1", False),
+    ("200.20.31.1", False),
+    ("187.1.2.4", False),
+    ("11.0.0.1", False),
+    ("2801:81::1", False),
+    ("::ffff:10.0.0.1", False),  # Outra versão de IP não casa com redes IPv4
+    ("lixo", False),
+    (None, False),
+])
+def test_prefix_lookup_matches_network_membership(client_ip, allowed):
+    result = WebhookValidationResult(is_valid=False, provider=WebhookProvider.STONE)
+
+    assert _validator(ALLOWED)._validate_ip(client_ip, result) is allowed
+    assert result.ip_valid is allowed
+
+
+def test_empty_allowlist_accepts_any_ip():
+    result = WebhookValidationResult(is_valid=False, provider=WebhookProvider.STONE)
+
+    assert _validator([])._validate_ip("8.8.8.8", result) is True
@@ -0,0 +1,125 @@
+# 🧪 Testes da proteção contra replay de webhooks
+
+import threading
+import time
+
+import pytest
+
+from apps.api.services import webhook_validator
+from apps.api.services.webhook_validator import RedisReplayBackend, WebhookReplayProtection
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.keys = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = (value, ex)
+        return True
+
+    def delete(self, key):
+        self.keys.pop(key, None)
+
+
+class _SlowBackend:
+    """Backend que demora a responder (abre a janela entre checar e registrar)"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def check_and_set(self, webhook_id, ttl_seconds):
+        self.calls += 1
+        time.sleep(0.05)
+        return True
+
+
+class _FailingBackend:
+    def __init__(self):
+        self.fail = True
+
+    def check_and_set(self, webhook_id, ttl_seconds):
+        if self.fail:
+            raise ConnectionError("redis fora do ar")
+        return True
+
+
+def test_detects_replay_until_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(webhook_validator.time, "monotonic", lambda: now[0])
+    protection = WebhookReplayProtection(max_age=60)
+
+    assert protection.is_replay("wh-1") is False
+    assert protection.is_replay("wh-1") is True
+
+    now[0] += 61
+    assert protection.is_replay("wh-2") is False
+    assert len(protection) == 1  # wh-1 expirou e saiu do início da fila
+    assert protection.is_replay("wh-1") is False
+
+
+def test_max_entries_evicts_oldest():
+    protection = WebhookReplayProtection(max_age=60, max_entries=3)
+    for i in range(5):
+        assert protection.is_replay(f"wh-{i}") is False
+
+    assert len(protection) == 3
+    assert protection.is_replay("wh-4") is True
+    assert protection.is_replay("wh-0") is False
+
+
+def test_shared_backend_detects_replay_from_other_worker():
+    redis = _FakeRedis()
+    worker_a = WebhookReplayProtection(backend=RedisReplayBackend(redis))
+    worker_b = WebhookReplayProtection(backend=RedisReplayBackend(redis))
+
+    assert worker_a.is_replay("wh-1") is False
+    assert worker_b.is_replay("wh-1") is True
+    assert redis.keys["webhook:replay:wh-1"][1] == worker_a.max_age
+
+
+def test_concurrent_deliveries_of_same_id_pass_only_once():
+    backend = _SlowBackend()
+    protection = WebhookReplayProtection(backend=backend)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def deliver():
+        barrier.wait()
+        results.append(protection.is_replay("wh-1"))
+
+    threads = [threading.Thread(target=deliver) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(False) == 1
+    assert backend.calls == 1
+
+
+def test_backend_failure_rolls_back_local_entry():
+    backend = _FailingBackend()
+    protection = WebhookReplayProtection(backend=backend)
+
+    with pytest.raises(ConnectionError):
+        protection.is_replay("wh-1")
+    assert len(protection) == 0
+
+    # A reentrega do provedor é aceita quando o backend volta
+    backend.fail = False
+    assert protection.is_replay("wh-1") is False
+    assert protection.is_replay("wh-1") is True
+
+
+def test_forget_releases_id_locally_and_in_shared_backend():
+    redis = _FakeRedis()
+    protection = WebhookReplayProtection(backend=RedisReplayBackend(redis))
+    assert protection.is_replay("wh-1") is False
+
+    protection.forget("wh-1")
+
+    assert redis.keys == {}
+    assert protection.is_replay("wh-1") is False
+    assert protection.is_replay("wh-1") is True
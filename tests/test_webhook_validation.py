@@ -370,9 +370,52 @@ class WebhookTester:
         
         return passed_tests == total_tests
 
+    def benchmark(self, iterations: int = 2000) -> Dict[str, float]:
+        """Mede a validação (µs por webhook) com os payloads de teste de cada provedor"""
+        
+        self.setup_test_configs()
+        timings = {}
+        
+        for provider in ["sicredi", "stone", "pagseguro", "mercadopago", "pagbank"]:
+            # Payloads/headers gerados antes da medição. O ID de replay vem do
+            # "id" de topo (o da Stone fica aninhado em "transaction"), então
+            # todo payload recebe um único por iteração: mede-se o caminho de
+            # sucesso, não a recusa por replay.
+            requests = []
+            for i in range(iterations):
+                payload = self.create_test_payload(provider, f"bench_{provider}_{i}")
+                payload["id"] = f"bench_{provider}_{i}"
+                payload_str = json.dumps(payload, separators=(',', ':'), sort_keys=True)
+                headers = self.create_test_headers(provider, payload_str, valid=True)
+                requests.append((payload_str.encode('utf-8'), headers))
+            
+            start = time.perf_counter()
+            results = [
+                self.validator.validate_webhook(
+                    provider=WebhookProvider(provider),
+                    payload=body,
+                    headers=headers,
+                    client_ip="127.0.0.1"
+                )
+                for body, headers in requests
+            ]
+            elapsed = time.perf_counter() - start
+            rejected = [result.errors for result in results if not result.is_valid]
+            if rejected:
+                raise RuntimeError(f"{provider}: {len(rejected)} webhook(s) recusado(s) no benchmark: {rejected[0]}")
+            timings[provider] = elapsed / iterations * 1_000_000
+            print(f"⏱️ {provider}: {timings[provider]:.1f} µs/webhook")
+        
+        return timings
+
 async def main():
     """Função principal de teste"""
     
+    import sys
+    if "--benchmark" in sys.argv:
+        WebhookTester().benchmark()
+        return
+    
     tester = WebhookTester()
     success = await tester.run_all_tests()
     